@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Cache de respuestas de /buscar. Los tableros repiten las mismas búsquedas
+# cada pocos segundos: mientras no lleguen bloques nuevos que puedan cambiar
+# el resultado, la página se sirve de memoria sin ir a Postgres.
+#
+# La clave son los parámetros normalizados del pedido. Cada entrada recuerda
+# su fuente y su rango (desde/hasta) y un insert la invalida si el bloque
+# nuevo puede entrar en ese rango; el TTL acota lo que puede quedar
+# desactualizado por cambios que no pasan por esta API (otro proceso,
+# mantenimiento.py). El cache es por proceso.
+
+
+def _fecha(valor):
+    """
+    Fecha sin zona horaria, o None si no hay fecha o no se puede interpretar.
+    La zona se descarta sin convertir, igual que Postgres al pasar el texto a
+    la columna TIMESTAMP: `10:00-03:00` filtra desde las 10:00, no las 13:00.
+    """
+    if isinstance(valor, str):
+        try:
+            valor = datetime.fromisoformat(valor)
+        except ValueError:
+            return None
+    if isinstance(valor, datetime) and valor.tzinfo is not None:
+        valor = valor.replace(tzinfo=None)
+    return valor
+
+
+def clave_busqueda(fuente: str = None, desde: str = None, hasta: str = None, texto: str = None,
+                   modo: str = "web", orden: str = "tiempo", resaltar: bool = False,
+                   campos: str = None, cursor: str = None, limite: int = None) -> tuple:
+    """
+    Parámetros de /buscar normalizados: espacios y mayúsculas del texto, orden
+    y repeticiones de los campos, fechas en ISO.
+    """
+    if texto:
+        texto = " ".join(texto.lower().split())
+    if campos:
+        campos = ",".join(sorted({c.strip() for c in campos.split(",") if c.strip()}))
+    if orden != "relevancia" or not texto:
+        orden = "tiempo"
+    desde = _fecha(desde).isoformat() if _fecha(desde) else desde
+    hasta = _fecha(hasta).isoformat() if _fecha(hasta) else hasta
+    return (fuente, desde, hasta, texto or None, modo if texto else None, orden,
+            bool(resaltar and texto), campos or None, cursor, limite)
+
+
+class CacheBusquedas:
+    """
+    Cache LRU con TTL de páginas de /buscar, invalidado por fuente y rango.
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl_segundos: float = 10):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        # clave → (vencimiento, fuente, desde, hasta, valor)
+        self._entradas = OrderedDict()
+        # cambia con cada insert: una búsqueda que empezó antes no guarda su resultado
+        self.generacion = 0
+        self.stats = {"hit": 0, "miss": 0, "invalidado": 0}
+
+    def buscar(self, clave: tuple):
+        """
+        Valor guardado para la clave, o None si no está o ya venció.
+        """
+        entrada = self._entradas.get(clave)
+        if entrada is None or entrada[0] <= time.monotonic():
+            self._entradas.pop(clave, None)
+            self.stats["miss"] += 1
+            return None
+        self._entradas.move_to_end(clave)
+        self.stats["hit"] += 1
+        return entrada[4]
+
+    def guardar(self, clave: tuple, valor, generacion: int = None):
+        """
+        Guarda el valor, salvo que desde `generacion` (la leída antes de
+        consultar la base) haya habido inserts: podría no incluirlos.
+        """
+        if generacion is not None and generacion != self.generacion:
+            return
+        fuente, desde, hasta = clave[0], _fecha(clave[1]), _fecha(clave[2])
+        self._entradas[clave] = (time.monotonic() + self.ttl_segundos, fuente, desde, hasta, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, fuente: str, inicio_max: datetime, fin_min: datetime) -> int:
+        """
+        Descarta las búsquedas en las que pueden entrar bloques nuevos de
+        `fuente`: las de esa fuente (o sin fuente) con desde <= `inicio_max` y
+        hasta >= `fin_min`. Para un lote de bloques se pasan el mayor inicio y
+        el menor fin, con lo que se descarta de más pero nunca de menos.
+        """
+        self.generacion += 1
+        inicio_max, fin_min = _fecha(inicio_max), _fecha(fin_min)
+        descartadas = []
+        for clave, (_, entrada_fuente, desde, hasta, _) in self._entradas.items():
+            if entrada_fuente is not None and entrada_fuente != fuente:
+                continue
+            if (desde is not None and inicio_max < desde) or (hasta is not None and fin_min > hasta):
+                continue
+            descartadas.append(clave)
+        for clave in descartadas:
+            del self._entradas[clave]
+        self.stats["invalidado"] += len(descartadas)
+        return len(descartadas)
+
+    def invalidar_bloques(self, bloques: list) -> int:
+        """
+        invalidar para un lote de bloques (con fuente, timestamp_inicio y timestamp_fin).
+        """
+        rangos = {}
+        for bloque in bloques:
+            inicio, fin = _fecha(bloque.timestamp_inicio), _fecha(bloque.timestamp_fin)
+            inicio_max, fin_min = rangos.get(bloque.fuente, (inicio, fin))
+            rangos[bloque.fuente] = (max(inicio_max, inicio), min(fin_min, fin))
+        return sum(self.invalidar(fuente, inicio, fin) for fuente, (inicio, fin) in rangos.items())
+
+    def __len__(self):
+        return len(self._entradas)
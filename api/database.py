@@ -1,13 +1,81 @@
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Optional
 
-def get_connection():
-    return psycopg2.connect(
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+# Configuración del pool (todas opcionales, con valores por defecto razonables)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+_pool: Optional[AsyncConnectionPool] = None
+
+
+def get_conninfo() -> str:
+    return make_conninfo(
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASS"),
         host=os.getenv("DB_HOST"),
         port=os.getenv("DB_PORT"),
-        cursor_factory=RealDictCursor
+        connect_timeout=DB_CONNECT_TIMEOUT,
     )
+
+
+def get_connection():
+    """
+    Conexión suelta (sin pool) para scripts y tareas de mantenimiento.
+    Los handlers de la API deben usar get_pool().
+    """
+    return psycopg.connect(get_conninfo(), row_factory=dict_row)
+
+
+async def open_pool() -> AsyncConnectionPool:
+    """
+    Crea y abre el pool asíncrono. Se llama una sola vez al iniciar la app.
+    """
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            get_conninfo(),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            kwargs={"row_factory": dict_row},
+            open=False,
+        )
+        await _pool.open(wait=True)
+    return _pool
+
+
+async def close_pool():
+    """
+    Drena y cierra el pool al apagar la app.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> AsyncConnectionPool:
+    if _pool is None:
+        raise RuntimeError("El pool de conexiones no está inicializado")
+    return _pool
+
+
+def pool_stats() -> dict:
+    """
+    Estadísticas del pool para monitoreo (tamaño, conexiones libres, esperas, etc.).
+    """
+    if _pool is None:
+        return {"abierto": False}
+    stats = _pool.get_stats()
+    stats["abierto"] = True
+    return stats
@@ -1,5 +1,24 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from database import open_pool, close_pool, pool_stats
+from metrics import instrumentar
 from routers import transcripciones
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El pool se crea al arrancar y se drena al apagar
+    await open_pool()
+    try:
+        yield
+    finally:
+        await close_pool()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(transcripciones.router, prefix="/transcripciones")
+instrumentar(app)
+
+@app.get("/db/pool")
+def estado_pool():
+    return pool_stats()
@@ -0,0 +1,38 @@
+import argparse
+import logging
+import os
+
+from database import get_connection
+
+logger = logging.getLogger("mantenimiento")
+logging.basicConfig(level=logging.INFO)
+
+
+def mantener_particiones(meses_adelante: int, meses_retencion: int):
+    """
+    Crea las particiones mensuales del mes en curso y de los próximos
+    `meses_adelante` meses, y elimina las que superan la retención.
+    Pensado para correr una vez por día (cron, systemd timer, etc.).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT crear_particiones_transcripciones(date_trunc('month', now())::date, %s) AS particion",
+                (meses_adelante + 1,))
+            creadas = [fila["particion"] for fila in cur.fetchall()]
+            logger.info(f"Particiones vigentes: {creadas}")
+
+            if meses_retencion > 0:
+                cur.execute("SELECT eliminar_particiones_transcripciones(%s) AS particion", (meses_retencion,))
+                eliminadas = [fila["particion"] for fila in cur.fetchall()]
+                logger.info(f"Particiones eliminadas por retención ({meses_retencion} meses): {eliminadas}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mantenimiento de particiones de la tabla transcripciones.")
+    parser.add_argument('--meses-adelante', type=int, default=int(os.getenv("PARTICIONES_MESES_ADELANTE", "3")),
+                        help="Meses futuros con partición creada de antemano (por defecto: 3)")
+    parser.add_argument('--meses-retencion', type=int, default=int(os.getenv("RETENCION_MESES", "0")),
+                        help="Meses de datos a conservar; 0 desactiva la retención (por defecto: 0)")
+    args = parser.parse_args()
+    mantener_particiones(args.meses_adelante, args.meses_retencion)
@@ -0,0 +1,46 @@
+import time
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from database import pool_stats
+
+# Métricas de la API en formato Prometheus, expuestas en GET /metrics
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Latencia de los pedidos HTTP", ["metodo", "ruta", "estado"]
+)
+DB_SECONDS = Histogram(
+    "api_db_seconds", "Latencia de las operaciones contra Postgres", ["operacion"]
+)
+DB_FILAS_INSERTADAS = Counter(
+    "api_db_filas_insertadas_total", "Bloques de transcripción insertados", ["operacion"]
+)
+POOL = Gauge(
+    "api_db_pool", "Estadísticas del pool de conexiones (psycopg_pool)", ["estadistica"]
+)
+CACHE_BUSCAR = Counter(
+    "api_cache_buscar_total", "Consultas al cache de /buscar e invalidaciones", ["resultado"]
+)
+
+
+def instrumentar(app: FastAPI):
+    """
+    Registra el middleware que mide cada pedido y la ruta /metrics.
+    """
+    @app.middleware("http")
+    async def medir_pedido(request: Request, call_next):
+        inicio = time.perf_counter()
+        response = await call_next(request)
+        # se usa el template de la ruta (/transcripciones/buscar), no la URL, para acotar las series
+        route = request.scope.get("route")
+        ruta = route.path if route is not None else "desconocida"
+        REQUEST_SECONDS.labels(request.method, ruta, response.status_code).observe(time.perf_counter() - inicio)
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        for estadistica, valor in pool_stats().items():
+            if isinstance(valor, (int, float)):
+                POOL.labels(estadistica).set(valor)
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,8 +1,48 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime
+from typing import List, Optional
 
 class Transcripcion(BaseModel):
     fuente: str
     timestamp_inicio: datetime
     timestamp_fin: datetime
     texto: str
+    # marcas por palabra (opcionales): cada palabra y su inicio en ms desde timestamp_inicio
+    palabras: Optional[List[str]] = None
+    palabras_ms: Optional[List[int]] = None
+
+    @model_validator(mode="after")
+    def palabras_alineadas(self):
+        if (self.palabras is None) != (self.palabras_ms is None):
+            raise ValueError("palabras y palabras_ms van juntas")
+        if self.palabras is not None and len(self.palabras) != len(self.palabras_ms):
+            raise ValueError("palabras y palabras_ms tienen que tener el mismo largo")
+        return self
+
+class TranscripcionResultado(BaseModel):
+    """
+    Fila de /buscar. Con `campos` solo vienen las columnas pedidas (más id y
+    timestamp_inicio); relevancia con `texto` y fragmento con `resaltar`.
+    """
+    id: int
+    timestamp_inicio: datetime
+    fuente: Optional[str] = None
+    timestamp_fin: Optional[datetime] = None
+    texto: Optional[str] = None
+    creado_en: Optional[datetime] = None
+    relevancia: Optional[float] = None
+    fragmento: Optional[str] = None
+
+class Momento(BaseModel):
+    """
+    Aparición de la búsqueda en /momentos: el bloque, la posición de la
+    primera palabra, el momento exacto (y su segundo dentro del bloque) y el
+    texto de los segundos de alrededor, aunque cruce varios bloques.
+    """
+    id: int
+    fuente: str
+    timestamp_inicio: datetime
+    posicion: int
+    momento: datetime
+    segundo: float
+    contexto: Optional[str] = None
@@ -1,57 +1,465 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import base64
+import csv
+import io
+import json
 import logging
-from database import get_connection
-from models import Transcripcion
+import os
+import re
+from datetime import datetime
+from typing import Any, List, Optional
+from pydantic import ValidationError
+from cache import CacheBusquedas, clave_busqueda
+from database import get_pool
+from metrics import CACHE_BUSCAR, DB_FILAS_INSERTADAS, DB_SECONDS
+from models import Momento, Transcripcion, TranscripcionResultado
+from serializacion import RespuestaJSON, a_json
 
 router = APIRouter()
 logger = logging.getLogger("api")
 logging.basicConfig(level=logging.INFO)
 
+# Tope de bloques por pedido de carga masiva
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+
+# Paginación de /buscar y tamaño de lote del cursor de /exportar
+BUSCAR_LIMITE_DEFAULT = int(os.getenv("BUSCAR_LIMITE_DEFAULT", "100"))
+BUSCAR_LIMITE_MAXIMO = int(os.getenv("BUSCAR_LIMITE_MAXIMO", "1000"))
+EXPORTAR_ITERSIZE = int(os.getenv("EXPORTAR_ITERSIZE", "2000"))
+
+# /momentos: segundos de contexto alrededor de cada aparición y duración
+# máxima de un bloque (acota hacia atrás la búsqueda de bloques vecinos)
+MOMENTOS_CONTEXTO_DEFAULT = float(os.getenv("MOMENTOS_CONTEXTO_DEFAULT", "10"))
+MOMENTOS_CONTEXTO_MAXIMO = float(os.getenv("MOMENTOS_CONTEXTO_MAXIMO", "120"))
+MOMENTOS_BLOQUE_MAX_SEGUNDOS = float(os.getenv("MOMENTOS_BLOQUE_MAX_SEGUNDOS", "60"))
+
+# Cache de páginas de /buscar (ver cache.py); BUSCAR_CACHE_SIZE=0 lo desactiva
+BUSCAR_CACHE_SIZE = int(os.getenv("BUSCAR_CACHE_SIZE", "1024"))
+BUSCAR_CACHE_TTL_SECONDS = float(os.getenv("BUSCAR_CACHE_TTL_SECONDS", "10"))
+cache_busquedas = CacheBusquedas(BUSCAR_CACHE_SIZE, BUSCAR_CACHE_TTL_SECONDS) if BUSCAR_CACHE_SIZE else None
+
+# Columnas devueltas por las búsquedas (texto_tsv queda afuera)
+CAMPOS_PERMITIDOS = ("id", "fuente", "timestamp_inicio", "timestamp_fin", "texto", "creado_en")
+COLUMNAS = ", ".join(f"t.{c}" for c in CAMPOS_PERMITIDOS)
+FORMATOS_EXPORTACION = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+OPCIONES_RESALTADO = "StartSel=<b>, StopSel=</b>, MaxFragments=2, MinWords=8, MaxWords=25"
+
+COPY_TRANSCRIPCIONES = (
+    "COPY transcripciones (fuente, timestamp_inicio, timestamp_fin, texto, palabras, palabras_ms) FROM STDIN"
+)
+
 @router.post("/")
-def crear_transcripcion(transcripcion: Transcripcion):
-    conn = get_connection()
+async def crear_transcripcion(transcripcion: Transcripcion):
     try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO transcripciones (fuente, timestamp_inicio, timestamp_fin, texto)
-                    VALUES (%s, %s, %s, %s)
-                """, (transcripcion.fuente, transcripcion.timestamp_inicio,
-                      transcripcion.timestamp_fin, transcripcion.texto))
-                logger.info(f"Transcripción creada: {transcripcion}")
+        with DB_SECONDS.labels("insert").time():
+            async with get_pool().connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("""
+                        INSERT INTO transcripciones (fuente, timestamp_inicio, timestamp_fin, texto,
+                                                     palabras, palabras_ms)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (transcripcion.fuente, transcripcion.timestamp_inicio,
+                          transcripcion.timestamp_fin, transcripcion.texto,
+                          transcripcion.palabras, transcripcion.palabras_ms))
+        DB_FILAS_INSERTADAS.labels("insert").inc()
+        _invalidar_busquedas([transcripcion])
+        logger.info(f"Transcripción creada: {transcripcion}")
         return {"ok": True}
     except Exception as e:
         logger.exception("Error al crear transcripción")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
-@router.get("/buscar")
-def buscar(fuente: str = None, desde: str = None, hasta: str = None, texto: str = None):
-    conn = get_connection()
-    query = "SELECT * FROM transcripciones WHERE TRUE"
+def _invalidar_busquedas(transcripciones: List[Transcripcion]):
+    if cache_busquedas is not None:
+        CACHE_BUSCAR.labels("invalidado").inc(cache_busquedas.invalidar_bloques(transcripciones))
+
+def _validar_items(items: List[Any]):
+    """
+    Valida cada bloque por separado para poder informar el estado de cada uno.
+    Devuelve (transcripciones válidas, estados por item).
+    """
+    validas = []
+    estados = []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            # línea NDJSON que no se pudo parsear
+            estados.append({"index": index, "ok": False, "error": f"JSON inválido: {item}"})
+            continue
+        try:
+            validas.append(Transcripcion.model_validate(item))
+            estados.append({"index": index, "ok": True})
+        except ValidationError as e:
+            estados.append({"index": index, "ok": False,
+                            "error": e.errors(include_url=False, include_context=False, include_input=False)})
+    return validas, estados
+
+async def _insertar_bulk(transcripciones: List[Transcripcion]):
+    """
+    Inserta todos los bloques con un único COPY dentro de una sola transacción.
+    """
+    with DB_SECONDS.labels("copy").time():
+        async with get_pool().connection() as conn:
+            async with conn.cursor() as cur:
+                async with cur.copy(COPY_TRANSCRIPCIONES) as copy:
+                    for t in transcripciones:
+                        await copy.write_row((t.fuente, t.timestamp_inicio, t.timestamp_fin, t.texto,
+                                              t.palabras, t.palabras_ms))
+    DB_FILAS_INSERTADAS.labels("copy").inc(len(transcripciones))
+    _invalidar_busquedas(transcripciones)
+
+async def _procesar_bulk(items: List[Any]):
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ITEMS} bloques por pedido")
+
+    validas, estados = _validar_items(items)
+    try:
+        if validas:
+            await _insertar_bulk(validas)
+        logger.info(f"Carga masiva: {len(validas)} bloques insertados, {len(items) - len(validas)} rechazados")
+    except Exception as e:
+        logger.exception("Error en la carga masiva")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"ok": len(validas) == len(items), "insertados": len(validas), "items": estados}
+
+def _parsear_lineas(lineas: List[bytes]) -> List[Any]:
+    items = []
+    for linea in lineas:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            items.append(json.loads(linea))
+        except ValueError as e:
+            # se conserva el error para reportarlo en la posición del item
+            items.append(e)
+    return items
+
+@router.post("/bulk")
+async def crear_transcripciones_bulk(items: List[Any] = Body(...)):
+    return await _procesar_bulk(items)
+
+@router.post("/bulk/ndjson")
+async def crear_transcripciones_ndjson(request: Request):
+    """
+    Igual que /bulk pero recibe un bloque JSON por línea (application/x-ndjson).
+    El cuerpo se parsea a medida que llega.
+    """
+    items = []
+    resto = b""
+    async for parte in request.stream():
+        *lineas, resto = (resto + parte).split(b"\n")
+        items.extend(_parsear_lineas(lineas))
+        if len(items) > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ITEMS} bloques por pedido")
+    items.extend(_parsear_lineas([resto]))
+    return await _procesar_bulk(items)
+
+def _construir_tsquery(texto: str, modo: str):
+    """
+    Devuelve (expresión SQL del tsquery, parámetro) según el modo de búsqueda:
+     - web: sintaxis tipo buscador ("frase exacta", -excluir, or)
+     - frase: las palabras tienen que aparecer juntas y en orden
+     - prefijo: cada palabra matchea como prefijo (transcrip -> transcripción)
+    """
+    if modo == "web":
+        return "websearch_to_tsquery('spanish', %s)", texto
+    if modo == "frase":
+        return "phraseto_tsquery('spanish', %s)", texto
+    if modo == "prefijo":
+        palabras = re.findall(r"\w+", texto)
+        if not palabras:
+            raise HTTPException(status_code=400, detail="La búsqueda no contiene palabras")
+        return "to_tsquery('spanish', %s)", " & ".join(f"{p}:*" for p in palabras)
+    raise HTTPException(status_code=400, detail=f"Modo de búsqueda desconocido: {modo}")
+
+def _parsear_campos(campos: Optional[str]) -> str:
+    """
+    Proyección de columnas pedida por el cliente. id y timestamp_inicio se
+    incluyen siempre porque forman el cursor de paginación.
+    """
+    if not campos:
+        return COLUMNAS
+    pedidos = [c.strip() for c in campos.split(",") if c.strip()]
+    desconocidos = [c for c in pedidos if c not in CAMPOS_PERMITIDOS]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(desconocidos)}")
+    columnas = ["id", "timestamp_inicio"] + [c for c in pedidos if c not in ("id", "timestamp_inicio")]
+    return ", ".join(f"t.{c}" for c in columnas)
+
+def _codificar_cursor(fila: dict) -> str:
+    crudo = json.dumps([fila["timestamp_inicio"].isoformat(), fila["id"]])
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+def _decodificar_cursor(cursor: str):
+    try:
+        timestamp_inicio, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp_inicio), int(id_)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _construir_consulta(fuente: str = None, desde: str = None, hasta: str = None, texto: str = None,
+                        modo: str = "web", orden: str = "tiempo", resaltar: bool = False,
+                        campos: str = None, cursor: str = None):
+    """
+    Arma el SELECT de búsqueda (sin LIMIT) compartido por /buscar y /exportar.
+    Devuelve (query, params).
+    """
+    if orden not in ("tiempo", "relevancia"):
+        raise HTTPException(status_code=400, detail=f"Orden desconocido: {orden}")
+
+    columnas = _parsear_campos(campos)
+    desde_sql = "transcripciones t"
     params = []
+    if texto:
+        tsquery, valor = _construir_tsquery(texto, modo)
+        desde_sql += f" CROSS JOIN {tsquery} AS q"
+        params.append(valor)
+        columnas += ", ts_rank_cd(t.texto_tsv, q) AS relevancia"
+        if resaltar:
+            # Postgres posterga las funciones caras del SELECT hasta después
+            # del ORDER BY/LIMIT, así que ts_headline solo corre sobre la página
+            columnas += f", ts_headline('spanish', t.texto, q, '{OPCIONES_RESALTADO}') AS fragmento"
+
+    query = f"SELECT {columnas} FROM {desde_sql} WHERE TRUE"
 
     if fuente:
-        query += " AND fuente = %s"
+        query += " AND t.fuente = %s"
         params.append(fuente)
     if desde:
-        query += " AND timestamp_inicio >= %s"
+        query += " AND t.timestamp_inicio >= %s"
         params.append(desde)
     if hasta:
-        query += " AND timestamp_fin <= %s"
+        query += " AND t.timestamp_fin <= %s"
         params.append(hasta)
     if texto:
-        query += " AND texto ILIKE %s"
-        params.append(f"%{texto}%")
+        query += " AND t.texto_tsv @@ q"
+
+    if texto and orden == "relevancia":
+        if cursor:
+            raise HTTPException(status_code=400, detail="El cursor solo se admite con orden=tiempo")
+        query += " ORDER BY relevancia DESC, t.timestamp_inicio, t.id"
+    else:
+        if cursor:
+            # keyset: sigue exactamente después de la última fila de la página anterior
+            query += " AND (t.timestamp_inicio, t.id) > (%s, %s)"
+            params.extend(_decodificar_cursor(cursor))
+        query += " ORDER BY t.timestamp_inicio, t.id"
+
+    return query, params
+
+@router.get("/buscar", response_model=List[TranscripcionResultado])
+async def buscar(fuente: str = None, desde: str = None, hasta: str = None,
+                 texto: str = None, modo: str = "web", orden: str = "tiempo", resaltar: bool = False,
+                 campos: str = None, cursor: str = None,
+                 limite: int = Query(BUSCAR_LIMITE_DEFAULT, ge=1, le=BUSCAR_LIMITE_MAXIMO)):
+    """
+    Devuelve una página de resultados. Si hay más, el header X-Siguiente-Cursor
+    trae el valor a pasar como `cursor` para pedir la siguiente. Las búsquedas
+    repetidas se sirven del cache (header X-Cache: hit) hasta que vencen o
+    llegan bloques que pueden cambiarlas.
+
+    Las filas se serializan directo a JSON (serializacion.py), sin pasar por
+    la validación del modelo ni por jsonable_encoder: TranscripcionResultado
+    solo documenta la respuesta. El cache guarda el JSON ya serializado.
+    """
+    query, params = _construir_consulta(fuente, desde, hasta, texto, modo, orden, resaltar, campos, cursor)
+    clave = clave_busqueda(fuente, desde, hasta, texto, modo, orden, resaltar, campos, cursor, limite)
+    headers = {}
+    if cache_busquedas is not None:
+        guardado = cache_busquedas.buscar(clave)
+        CACHE_BUSCAR.labels("hit" if guardado is not None else "miss").inc()
+        headers["X-Cache"] = "hit" if guardado is not None else "miss"
+        if guardado is not None:
+            cuerpo, siguiente = guardado
+            if siguiente:
+                headers["X-Siguiente-Cursor"] = siguiente
+            return RespuestaJSON(cuerpo, headers=headers)
+        generacion = cache_busquedas.generacion
+
+    # se pide una fila de más para saber si hay otra página
+    query += " LIMIT %s"
+    params.append(limite + 1)
 
     try:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            resultados = cur.fetchall()
-        return resultados
+        with DB_SECONDS.labels("buscar").time():
+            async with get_pool().connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(query, params)
+                    resultados = await cur.fetchall()
     except Exception as e:
         logger.exception("Error en la búsqueda")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+    siguiente = None
+    if len(resultados) > limite:
+        resultados = resultados[:limite]
+        if not (texto and orden == "relevancia"):
+            siguiente = _codificar_cursor(resultados[-1])
+            headers["X-Siguiente-Cursor"] = siguiente
+    cuerpo = a_json(resultados)
+    if cache_busquedas is not None:
+        cache_busquedas.guardar(clave, (cuerpo, siguiente), generacion)
+    return RespuestaJSON(cuerpo, headers=headers)
+
+# Apariciones exactas de una palabra o frase en los bloques con marcas por
+# palabra. El índice GIN sobre normalizar_palabras(palabras) encuentra los
+# bloques que tienen todas las palabras; la comparación del slice ubica la
+# frase completa y en orden. Para cada aparición, el contexto se arma en la
+# base con las palabras de los bloques vecinos de la misma fuente que caen a
+# menos de `contexto` segundos, ordenadas por su momento.
+CONSULTA_MOMENTOS = """
+WITH q AS (
+    SELECT array_agg(normalizar_palabra(p) ORDER BY i) AS palabras
+    FROM unnest(%(palabras)s::text[]) WITH ORDINALITY AS u(p, i)
+    WHERE normalizar_palabra(p) <> ''
+),
+apariciones AS (
+    SELECT t.id, t.fuente, t.timestamp_inicio, pos AS posicion, t.palabras_ms[pos] AS inicio_ms,
+           t.timestamp_inicio + t.palabras_ms[pos] * INTERVAL '1 millisecond' AS momento
+    FROM transcripciones t
+    CROSS JOIN q
+    CROSS JOIN LATERAL (SELECT normalizar_palabras(t.palabras) AS normalizadas) n
+    CROSS JOIN LATERAL generate_subscripts(t.palabras, 1) AS pos
+    WHERE normalizar_palabras(t.palabras) @> q.palabras
+      AND n.normalizadas[pos:pos + cardinality(q.palabras) - 1] = q.palabras
+      {filtros}
+    ORDER BY t.timestamp_inicio, t.id, pos
+    LIMIT %(limite)s
+)
+SELECT a.id, a.fuente, a.timestamp_inicio, a.posicion, a.momento,
+       (a.inicio_ms / 1000.0)::float8 AS segundo, c.contexto
+FROM apariciones a
+CROSS JOIN LATERAL (
+    SELECT string_agg(u.palabra, ' ' ORDER BY v.timestamp_inicio, u.inicio_ms) AS contexto
+    FROM transcripciones v
+    CROSS JOIN LATERAL unnest(v.palabras, v.palabras_ms) AS u(palabra, inicio_ms)
+    WHERE v.fuente = a.fuente
+      AND v.timestamp_inicio > a.momento - (%(contexto)s + %(bloque_max)s) * INTERVAL '1 second'
+      AND v.timestamp_inicio <= a.momento + %(contexto)s * INTERVAL '1 second'
+      AND v.timestamp_inicio + u.inicio_ms * INTERVAL '1 millisecond'
+          BETWEEN a.momento - %(contexto)s * INTERVAL '1 second' AND a.momento + %(contexto)s * INTERVAL '1 second'
+) c
+ORDER BY a.timestamp_inicio, a.id, a.posicion
+"""
+
+def _codificar_cursor_momento(fila: dict) -> str:
+    crudo = json.dumps([fila["timestamp_inicio"].isoformat(), fila["id"], fila["posicion"]])
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+def _decodificar_cursor_momento(cursor: str):
+    try:
+        timestamp_inicio, id_, posicion = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp_inicio), int(id_), int(posicion)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _construir_momentos(texto: str, fuente: str = None, desde: str = None, hasta: str = None,
+                        contexto: float = MOMENTOS_CONTEXTO_DEFAULT, cursor: str = None, limite: int = 100):
+    """
+    Devuelve (query, params) de /momentos.
+    """
+    # se corta por espacios como las palabras guardadas: "1.500" o
+    # "medio-oriente" son una palabra, que normalizar_palabra deja igual que
+    # en el índice; los tokens sin letras ni números quedarían vacíos
+    palabras = [palabra for palabra in texto.split() if any(c.isalnum() for c in palabra)]
+    if not palabras:
+        raise HTTPException(status_code=400, detail="La búsqueda no contiene palabras")
+    params = {"palabras": palabras, "contexto": contexto, "bloque_max": MOMENTOS_BLOQUE_MAX_SEGUNDOS,
+              "limite": limite}
+    filtros = ""
+    if fuente:
+        filtros += " AND t.fuente = %(fuente)s"
+        params["fuente"] = fuente
+    if desde:
+        filtros += " AND t.timestamp_inicio >= %(desde)s"
+        params["desde"] = desde
+    if hasta:
+        filtros += " AND t.timestamp_fin <= %(hasta)s"
+        params["hasta"] = hasta
+    if cursor:
+        filtros += " AND (t.timestamp_inicio, t.id, pos) > (%(cursor_inicio)s, %(cursor_id)s, %(cursor_posicion)s)"
+        params["cursor_inicio"], params["cursor_id"], params["cursor_posicion"] = _decodificar_cursor_momento(cursor)
+    return CONSULTA_MOMENTOS.format(filtros=filtros), params
+
+@router.get("/momentos", response_model=List[Momento])
+async def momentos(texto: str, fuente: str = None, desde: str = None, hasta: str = None,
+                   contexto: float = Query(MOMENTOS_CONTEXTO_DEFAULT, ge=0, le=MOMENTOS_CONTEXTO_MAXIMO),
+                   cursor: str = None,
+                   limite: int = Query(BUSCAR_LIMITE_DEFAULT, ge=1, le=BUSCAR_LIMITE_MAXIMO)):
+    """
+    Cada aparición de `texto` (una palabra o una frase, palabras seguidas y en
+    orden) en los bloques con marcas por palabra: el momento exacto en que se
+    dice y el texto de `contexto` segundos antes y después, uniendo los
+    bloques vecinos. Se pagina como /buscar (header X-Siguiente-Cursor).
+    """
+    query, params = _construir_momentos(texto, fuente, desde, hasta, contexto, cursor, limite + 1)
+    try:
+        with DB_SECONDS.labels("momentos").time():
+            async with get_pool().connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(query, params)
+                    resultados = await cur.fetchall()
+    except Exception as e:
+        logger.exception("Error en la búsqueda de momentos")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {}
+    if len(resultados) > limite:
+        resultados = resultados[:limite]
+        headers["X-Siguiente-Cursor"] = _codificar_cursor_momento(resultados[-1])
+    return RespuestaJSON(a_json(resultados), headers=headers)
+
+def _vaciar_lote(buffer: io.StringIO, lineas: List[bytes]) -> bytes:
+    """
+    Bytes acumulados del lote de exportación (CSV en el buffer o líneas NDJSON).
+    """
+    if lineas:
+        datos = b"\n".join(lineas) + b"\n"
+        lineas.clear()
+        return datos
+    datos = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    return datos
+
+async def _exportar_filas(query: str, params: list, formato: str):
+    """
+    Recorre el resultado con un cursor del lado del servidor (memoria constante)
+    y va emitiendo las filas ya serializadas en lotes.
+    """
+    async with get_pool().connection() as conn:
+        async with conn.cursor(name="exportar_transcripciones") as cur:
+            cur.itersize = EXPORTAR_ITERSIZE
+            await cur.execute(query, params)
+            buffer = io.StringIO()
+            escritor = None
+            lineas = []
+            filas = 0
+            async for fila in cur:
+                if formato == "csv":
+                    if escritor is None:
+                        escritor = csv.DictWriter(buffer, fieldnames=list(fila.keys()))
+                        escritor.writeheader()
+                    escritor.writerow(fila)
+                else:
+                    lineas.append(a_json(fila))
+                filas += 1
+                if filas % EXPORTAR_ITERSIZE == 0:
+                    yield _vaciar_lote(buffer, lineas)
+            if buffer.tell() or lineas:
+                yield _vaciar_lote(buffer, lineas)
+            logger.info(f"Exportación {formato} terminada: {filas} filas")
+
+@router.get("/exportar")
+async def exportar(fuente: str = None, desde: str = None, hasta: str = None, texto: str = None,
+                   modo: str = "web", campos: str = None, formato: str = "ndjson"):
+    """
+    Exporta todos los resultados de una búsqueda como NDJSON o CSV en streaming.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail=f"Formato desconocido: {formato}")
+    query, params = _construir_consulta(fuente, desde, hasta, texto, modo, campos=campos)
+    return StreamingResponse(_exportar_filas(query, params, formato),
+                             media_type=FORMATOS_EXPORTACION[formato])
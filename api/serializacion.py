@@ -0,0 +1,37 @@
+import json
+from datetime import datetime
+
+from fastapi import Response
+
+# Serialización de respuestas grandes (/buscar, /exportar). Por defecto
+# FastAPI pasa cada fila por jsonable_encoder (que recorre y copia todo en
+# Python) y después por json.dumps. Con orjson las filas de Postgres, con sus
+# datetimes, se serializan directo a bytes en una sola pasada.
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa json, más lento pero con la misma salida
+    orjson = None
+
+
+def _json_default(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def a_json(valor) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(valor, default=str)
+    return json.dumps(valor, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RespuestaJSON(Response):
+    """
+    Respuesta JSON serializada con a_json. Acepta bytes ya serializados (por
+    ejemplo, del cache) y los devuelve tal cual.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else a_json(content)
@@ -1,18 +1,32 @@
 import argparse
 import asyncio
+import csv
 import datetime
-import json
+import functools
 import logging
 import os
 import re
+import sys
 import tempfile
 import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 import redis.asyncio as aioredis
 from dotenv import load_dotenv
 from pydub import AudioSegment
 from yt_dlp import YoutubeDL
 
+# el transporte de jobs (pipeline/) se comparte con el transcriber y el cleaner
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.audio import AUDIO_KEY_FIELD, store_audio
+from pipeline.metrics import AUDIO_SECONDS, STAGE_SECONDS, start_metrics_server
+from pipeline.scheduler import add_source_job, finish_source, register_source, scheduling_from_env
+from pipeline.streams import add_job
+from sources import (HostLimiter, StreamInfoCache, host_limiter_from_env, load_sources_file, load_sources_redis,
+                     stream_info_cache_from_env)
+from vad import (FRAME_BYTES, FRAME_MS, SAMPLE_RATE, FixedSegmenter, SpeechDetector, VadSegmenter, iter_frames,
+                 vad_config_from_env)
+
 
 # Configuración de logging
 def setup_logger():
@@ -27,106 +41,649 @@ def setup_logger():
 
 logger = setup_logger()
 
+# Formatos de chunk soportados. Salvo mp3, todos se guardan a 16 kHz mono, que
+# es lo que consume el transcriber, evitando una recompresión con pérdida.
+# pcm no escribe archivos: el PCM crudo va a Redis (ver pipeline/audio.py).
+CHUNK_FORMATS = {
+    "mp3": {
+        "ext": "mp3",
+        "resample": False,
+        "export": {"format": "mp3", "bitrate": "192k"},
+        "ffmpeg": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    },
+    "wav": {
+        "ext": "wav",
+        "resample": True,
+        "export": {"format": "wav"},
+        "ffmpeg": ["-c:a", "pcm_s16le", "-ar", "16000", "-ac", "1"],
+    },
+    "flac": {
+        "ext": "flac",
+        "resample": True,
+        "export": {"format": "flac"},
+        "ffmpeg": ["-c:a", "flac", "-ar", "16000", "-ac", "1"],
+    },
+    "opus": {
+        "ext": "opus",
+        "resample": True,
+        "export": {"format": "opus", "codec": "libopus", "bitrate": "32k"},
+        "ffmpeg": ["-c:a", "libopus", "-b:a", "32k", "-ar", "16000", "-ac", "1"],
+    },
+    "pcm": {
+        "ext": "pcm",
+        "resample": True,
+        "redis": True,
+    },
+}
+
+def get_chunk_format(name: str = None) -> dict:
+    name = name or os.getenv("CHUNK_FORMAT", "mp3")
+    if name not in CHUNK_FORMATS:
+        raise Exception(f"CHUNK_FORMAT desconocido: {name}")
+    return CHUNK_FORMATS[name]
+
 # Sanitiza la URL para usarla en el nombre de archivo
 def sanitize_url(url: str) -> str:
     return re.sub(r"[^0-9A-Za-z]+", "_", url)
 
-async def download_audio(url: str) -> str:
+def media_start_time(info: dict) -> datetime.datetime:
+    """
+    Momento (UTC) que corresponde al segundo 0 del audio: la fecha de emisión
+    del VOD si yt_dlp la conoce, o el momento actual (transmisiones en vivo).
+    """
+    if not info.get("is_live"):
+        timestamp = info.get("release_timestamp") or info.get("timestamp")
+        if timestamp:
+            return datetime.datetime.utcfromtimestamp(timestamp)
+    return datetime.datetime.utcnow()
+
+@functools.cache
+def host_limiter() -> HostLimiter:
+    return host_limiter_from_env()
+
+@functools.cache
+def stream_info_cache() -> StreamInfoCache:
+    return stream_info_cache_from_env()
+
+async def download_audio(url: str, extract_mp3: bool = True):
     """
-    Descarga el audio de YouTube como archivo mp3 en un archivo temporal.
-    Devuelve la ruta al archivo mp3 descargado.
+    Descarga el audio de YouTube en un archivo temporal, en un hilo aparte y
+    respetando el límite de pedidos por host.
+    Con extract_mp3 lo convierte a mp3; si no, deja el formato original
+    (pydub/ffmpeg lo decodifican igual) y se ahorra una recompresión.
+    Devuelve (ruta al archivo descargado, metadata de yt_dlp).
     """
+    async with host_limiter().limit(url):
+        return await asyncio.to_thread(_download_audio, url, extract_mp3)
+
+def _download_audio(url: str, extract_mp3: bool):
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".%(ext)s")
     tmp_path = tmp.name
     tmp.close()
     ydl_opts = {
         'format': 'bestaudio/best',
         'outtmpl': tmp_path,
-        'postprocessors': [{
+        'quiet': True
+    }
+    if extract_mp3:
+        ydl_opts['postprocessors'] = [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'mp3',
             'preferredquality': '192',
-        }],
-        'quiet': True
-    }
+        }]
     logger.info(f"Descargando audio de {url}...")
-    with YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
-    mp3_path = tmp_path.replace('%(ext)s', 'mp3')
-    logger.info(f"Audio descargado en {mp3_path}")
-    return mp3_path
+    with YoutubeDL(ydl_opts) as ydl, STAGE_SECONDS.labels("download").time():
+        info = ydl.extract_info(url, download=True)
+    audio_path = tmp_path.replace('%(ext)s', 'mp3' if extract_mp3 else info['ext'])
+    logger.info(f"Audio descargado en {audio_path}")
+    return audio_path, info
 
-async def handle_chunk(chunk: AudioSegment, index: int, url: str, chunk_duration: int, redis: aioredis.Redis, media_name: str):
+async def register_media(redis: aioredis.Redis, media_name: str, info: dict):
     """
-    Procesa y guarda un único chunk: exporta a mp3 y crea el mensaje en Redis.
+    Con TRANSCRIPTION_SCHEDULING=fuentes registra la sub-cola de la media en
+    el scheduler: CHUNKER_PRIORIDAD (auto = vivo para transmisiones en vivo,
+    diferido para VODs), CHUNKER_PESO y CHUNKER_MAX_CONCURRENCIA.
     """
-    audio_chunks_path = os.getenv("AUDIO_CHUNKS_PATH")
+    if scheduling_from_env() != "fuentes":
+        return
+    prioridad = os.getenv("CHUNKER_PRIORIDAD", "auto")
+    if prioridad == "auto":
+        prioridad = "vivo" if info.get("is_live") else "diferido"
+    await register_source(redis, os.getenv("REDIS_QUEUE_TRANSCRIPTION_JOB"), media_name, prioridad,
+                          float(os.getenv("CHUNKER_PESO", "1")), int(os.getenv("CHUNKER_MAX_CONCURRENCIA", "0")))
 
-    ID = str(uuid.uuid4())
+def build_chunk_path(url: str, chunk_duration: int, media_name: str, index: int, job_id: str, ext: str = "mp3") -> str:
+    """
+    Arma la ruta absoluta del archivo de un chunk dentro de AUDIO_CHUNKS_PATH.
+    """
+    audio_chunks_path = os.getenv("AUDIO_CHUNKS_PATH")
     timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%d")
     url_slug = sanitize_url(url)
-    file_name = f"{timestamp}-{url_slug}-{ID}-{chunk_duration}-{media_name}-{index}.mp3"
+    file_name = f"{timestamp}-{url_slug}-{job_id}-{chunk_duration}-{media_name}-{index}.{ext}"
     os.makedirs(audio_chunks_path, exist_ok=True)
-    file_path = os.path.join(audio_chunks_path, file_name)
-    absolute_path = os.path.abspath(file_path)
+    return os.path.abspath(os.path.join(audio_chunks_path, file_name))
 
-    # Guardar archivo mp3 de manera asíncrona
-    await asyncio.to_thread(chunk.export, absolute_path, format="mp3")
-    logger.info(f"Chunk {index} guardado en {absolute_path}")
-
-    # Crear mensaje de trabajo y guardar en Redis
+async def enqueue_chunk(redis: aioredis.Redis, job_id: str, absolute_path: str, media_name: str,
+                        timestamp_inicio: datetime.datetime, audio_key: str = None):
+    """
+    Crea el mensaje de trabajo para un chunk ya guardado (en un archivo o, con
+    `audio_key`, en Redis) y lo agrega al stream de Redis.
+    """
     transcription_job = {
-        "id": ID,
-        "file-path": absolute_path,
-        "media":  media_name
+        "id": job_id,
+        "media":  media_name,
+        "timestamp_inicio": timestamp_inicio.isoformat()
     }
+    if audio_key:
+        transcription_job[AUDIO_KEY_FIELD] = audio_key
+    else:
+        transcription_job["file-path"] = absolute_path
 
     transcription_queue = os.getenv("REDIS_QUEUE_TRANSCRIPTION_JOB")
-    await redis.rpush( transcription_queue, json.dumps(transcription_job))
-    logger.info(f"Mensaje guardado en Redis: queue: {transcription_queue} job: {transcription_job}")
+    with STAGE_SECONDS.labels("enqueue").time():
+        if scheduling_from_env() == "fuentes":
+            message_id = await add_source_job(redis, transcription_queue, transcription_job)
+        else:
+            message_id = await add_job(redis, transcription_queue, transcription_job)
+    logger.info(f"Mensaje guardado en Redis: stream: {transcription_queue} id: {message_id} job: {transcription_job}")
 
-async def process_url(url: str, chunk_duration: int, media_name: str = None):
-    # Conexión a Redis usando redis-py con soporte asyncio
-    if media_name is None:
-        raise Exception("media_name is None")
+def export_chunk(raw_data: bytes, sample_width: int, frame_rate: int, channels: int, path: str, chunk_format: dict):
+    """
+    Codifica un chunk a disco. Corre en un proceso del pool de exportación,
+    por eso recibe el PCM crudo en lugar del AudioSegment.
+    """
+    chunk = AudioSegment(data=raw_data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+    if chunk_format["resample"]:
+        chunk = chunk.set_frame_rate(16000).set_channels(1).set_sample_width(2)
+    chunk.export(path, **chunk_format["export"])
+    return path
+
+def chunk_pcm(raw_data: bytes, sample_width: int, frame_rate: int, channels: int) -> bytes:
+    """
+    PCM 16 kHz mono 16 bits de un chunk (CHUNK_FORMAT=pcm).
+    """
+    chunk = AudioSegment(data=raw_data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+    return chunk.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2).raw_data
+
+async def handle_chunk(chunk: AudioSegment, index: int, url: str, chunk_duration: int, redis: aioredis.Redis, media_name: str,
+                       executor: Executor = None, chunk_format: dict = None, timestamp_inicio: datetime.datetime = None):
+    """
+    Procesa y guarda un único chunk: lo codifica en el pool de procesos y crea el mensaje en Redis.
+    Con CHUNK_FORMAT=pcm el chunk no pasa por disco: el PCM se guarda en Redis junto al mensaje.
+    """
+    chunk_format = chunk_format or get_chunk_format()
+    ID = str(uuid.uuid4())
+    loop = asyncio.get_running_loop()
+    if chunk_format.get("redis"):
+        with STAGE_SECONDS.labels("export").time():
+            pcm = await loop.run_in_executor(executor, chunk_pcm, chunk.raw_data, chunk.sample_width,
+                                             chunk.frame_rate, chunk.channels)
+            audio_key = await store_audio(redis, ID, pcm)
+        logger.info(f"Chunk {index} guardado en Redis: {audio_key}")
+        await enqueue_chunk(redis, ID, None, media_name, timestamp_inicio or datetime.datetime.utcnow(), audio_key)
+        return
+
+    absolute_path = build_chunk_path(url, chunk_duration, media_name, index, ID, chunk_format["ext"])
+
+    # La codificación es CPU-bound: se hace fuera del event loop
+    with STAGE_SECONDS.labels("export").time():
+        await loop.run_in_executor(executor, export_chunk, chunk.raw_data, chunk.sample_width,
+                                   chunk.frame_rate, chunk.channels, absolute_path, chunk_format)
+    logger.info(f"Chunk {index} guardado en {absolute_path}")
+
+    await enqueue_chunk(redis, ID, absolute_path, media_name, timestamp_inicio or datetime.datetime.utcnow())
+
+def resolve_stream(url: str):
+    """
+    Extrae con yt_dlp la metadata y la URL real del audio, sin descargar nada.
+    Devuelve (info, stream_url).
+    """
+    ydl_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "format": "bestaudio/best"
+    }
+    with YoutubeDL(ydl_opts) as ydl, STAGE_SECONDS.labels("resolve").time():
+        info = ydl.extract_info(url, download=False)
+        return info, info.get("url")
+
+async def resolve_source(url: str):
+    """
+    resolve_stream en un hilo aparte, con el límite de pedidos por host y el
+    cache de metadata (CHUNKER_STREAM_CACHE_TTL_SECONDS; nunca más allá del
+    vencimiento de la URL firmada).
+    """
+    cached = stream_info_cache().get(url)
+    if cached is not None:
+        return cached
+    async with host_limiter().limit(url):
+        info, stream_url = await asyncio.to_thread(resolve_stream, url)
+    stream_info_cache().put(url, info, stream_url)
+    return info, stream_url
+
+async def _log_ffmpeg_stderr(stream: asyncio.StreamReader):
+    async for line in stream:
+        logger.warning(f"ffmpeg: {line.decode(errors='replace').rstrip()}")
+
+def ffmpeg_input_args(stream_url: str) -> list:
+    args = []
+    if stream_url.startswith("http"):
+        args += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "10"]
+    return args + ["-i", stream_url, "-vn"]
+
+def parse_segment_entry(line: str):
+    """
+    (ruta, inicio, fin) de una línea de la lista de segmentos de ffmpeg en
+    formato csv; inicio y fin en segundos desde el comienzo del audio.
+    """
+    path, start, end = next(csv.reader([line]))
+    return path, float(start), float(end)
+
+async def stream_chunks(url: str, chunk_duration: int, redis: aioredis.Redis, media_name: str, chunk_format: dict):
+    """
+    Modo streaming: ffmpeg lee el audio a medida que llega y lo corta en
+    segmentos de `chunk_duration` segundos. Cada segmento terminado se encola
+    en Redis apenas ffmpeg lo cierra, sin cargar el audio completo en memoria.
+    Sirve tanto para VODs como para transmisiones en vivo (corre hasta que
+    termina la transmisión).
+
+    El horario de cada chunk sale del inicio real del segmento que informa
+    ffmpeg (los cortes caen en frames y el último es más corto); en vivo, del
+    reloj al cerrarse el segmento menos su duración, para que una reconexión
+    no corra todos los chunks siguientes.
+    """
+    info, stream_url = await resolve_source(url)
+    is_live = bool(info.get("is_live", False))
+    start_time = media_start_time(info)
+    logger.info(f"Procesando {url} en modo streaming ({'LIVE' if is_live else 'VOD'})")
+    await register_media(redis, media_name, info)
 
-    redis_host = os.getenv("REDIS_HOST")
-    redis_port = os.getenv("REDIS_PORT")
-    redis = aioredis.from_url("redis://" + redis_host + ":" + redis_port, encoding="utf-8", decode_responses=True)
+    audio_chunks_path = os.path.abspath(os.getenv("AUDIO_CHUNKS_PATH"))
+    os.makedirs(audio_chunks_path, exist_ok=True)
+    # ffmpeg escribe los segmentos con un nombre temporal; al terminar cada uno
+    # se renombra con el mismo formato que usa handle_chunk
+    run_id = str(uuid.uuid4())
+    segment_pattern = os.path.join(audio_chunks_path, f".{run_id}-%06d.{chunk_format['ext']}")
+
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        *ffmpeg_input_args(stream_url),
+        *chunk_format["ffmpeg"],
+        "-f", "segment",
+        "-segment_time", str(chunk_duration),
+        "-reset_timestamps", "1",
+        # la lista de segmentos terminados sale por stdout: ruta,inicio,fin por línea
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "csv",
+        "-segment_list_entry_prefix", audio_chunks_path + os.sep,
+        segment_pattern
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(_log_ffmpeg_stderr(process.stderr))
     try:
-        # Descargar audio completo
-        mp3_path = await download_audio(url)
-        audio = await asyncio.to_thread(AudioSegment.from_file, mp3_path)
-        duration_ms = len(audio)
-        chunk_ms = chunk_duration * 1000
+        index = 1
+        loop = asyncio.get_running_loop()
+        last_segment = loop.time()
+        async for line in process.stdout:
+            line = line.decode().strip()
+            if not line:
+                continue
+            segment_path, segment_start, segment_end = parse_segment_entry(line)
+            # tiempo que tardó ffmpeg en leer y codificar el segmento
+            STAGE_SECONDS.labels("segment").observe(loop.time() - last_segment)
+            last_segment = loop.time()
+            ID = str(uuid.uuid4())
+            absolute_path = build_chunk_path(url, chunk_duration, media_name, index, ID, chunk_format["ext"])
+            os.rename(segment_path, absolute_path)
+            logger.info(f"Chunk {index} guardado en {absolute_path}")
+            if is_live:
+                chunk_start = datetime.datetime.utcnow() - datetime.timedelta(seconds=segment_end - segment_start)
+            else:
+                chunk_start = start_time + datetime.timedelta(seconds=segment_start)
+            await enqueue_chunk(redis, ID, absolute_path, media_name, chunk_start)
+            index += 1
+
+        return_code = await process.wait()
+        if return_code != 0:
+            raise Exception(f"ffmpeg terminó con código {return_code} procesando {url}")
+        logger.info(f"Streaming de {url} terminado: {index - 1} chunks")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await stderr_task
+
+async def stream_pcm_chunks(url: str, chunk_duration: int, redis: aioredis.Redis, media_name: str,
+                            chunk_format: dict, vad_config: dict = None, executor: Executor = None):
+    """
+    Modo streaming sobre PCM: ffmpeg decodifica el audio a PCM 16 kHz mono
+    por stdout y los segmentos se arman en Python. Con `vad_config` se corta
+    en las pausas (ver vad.py) y los segmentos sin voz no se encolan; si no,
+    cada `chunk_duration` segundos (para CHUNK_FORMAT=pcm, que no escribe
+    archivos con ffmpeg).
+
+    Como en el modo completo, los chunks se codifican en el pool de procesos
+    y como mucho hay CHUNKER_MAX_IN_FLIGHT pendientes: si Redis está en el
+    límite de CHUNK_AUDIO_MAX_MB se deja de leer a ffmpeg en vez de acumular
+    PCM en memoria.
+    """
+    workers = int(os.getenv("CHUNKER_EXPORT_WORKERS", str(os.cpu_count() or 1)))
+    max_in_flight = int(os.getenv("CHUNKER_MAX_IN_FLIGHT", str(workers * 2)))
+    info, stream_url = await resolve_source(url)
+    is_live = bool(info.get("is_live", False))
+    start_time = media_start_time(info)
+    logger.info(f"Procesando {url} en modo streaming sobre PCM{' con VAD' if vad_config else ''} "
+                f"({'LIVE' if is_live else 'VOD'})")
+    await register_media(redis, media_name, info)
+
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", *ffmpeg_input_args(stream_url),
+           "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(_log_ffmpeg_stderr(process.stderr))
+    if vad_config:
+        detector = SpeechDetector(**vad_config)
+        segmenter = VadSegmenter(**vad_config)
+    else:
+        detector = None
+        segmenter = FixedSegmenter(chunk_duration * 1000, FRAME_MS)
+    index = 1
+    tasks = []
+    in_flight = asyncio.Semaphore(max_in_flight)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
 
+    async def enqueue_segments(segments: list):
+        # la codificación corre aparte para no dejar de leer el stdout de ffmpeg
+        nonlocal index
+        for task in [task for task in tasks if task.done()]:
+            tasks.remove(task)
+            task.result()  # propaga los errores de chunks anteriores
+        for start_ms, pcm in segments:
+            await in_flight.acquire()
+            chunk = AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+            if detector:
+                AUDIO_SECONDS.labels("vad_voz").inc(len(chunk) / 1000)
+            chunk_start = start_time + datetime.timedelta(milliseconds=start_ms)
+            task = asyncio.create_task(handle_chunk(chunk, index, url, chunk_duration, redis, media_name,
+                                                    executor, chunk_format, chunk_start))
+            task.add_done_callback(lambda _: in_flight.release())
+            tasks.append(task)
+            index += 1
+
+    try:
+        while True:
+            try:
+                frame = await process.stdout.readexactly(FRAME_BYTES)
+            except asyncio.IncompleteReadError:
+                break
+            await enqueue_segments(segmenter.push(frame, detector.is_speech(frame) if detector else True))
+        await enqueue_segments(segmenter.flush())
+        await asyncio.gather(*tasks)
+
+        return_code = await process.wait()
+        if return_code != 0:
+            raise Exception(f"ffmpeg terminó con código {return_code} procesando {url}")
+        if detector:
+            AUDIO_SECONDS.labels("vad_descartado").inc(segmenter.dropped_ms / 1000)
+        logger.info(f"Streaming de {url} terminado: {index - 1} chunks, "
+                    f"{segmenter.dropped_ms / 1000:.0f}s sin voz descartados")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await stderr_task
+        if own_executor:
+            executor.shutdown()
+
+def vad_bounds(audio: AudioSegment, vad_config: dict) -> list:
+    """
+    (inicio_ms, fin_ms) de los segmentos con voz de un audio completo.
+    """
+    pcm = audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2).raw_data
+    detector = SpeechDetector(**vad_config)
+    segmenter = VadSegmenter(**vad_config)
+    segments = []
+    for frame in iter_frames(pcm):
+        segments += [(start_ms, len(data)) for start_ms, data in segmenter.push(frame, detector.is_speech(frame))]
+    segments += [(start_ms, len(data)) for start_ms, data in segmenter.flush()]
+    bytes_per_ms = SAMPLE_RATE * 2 // 1000
+    AUDIO_SECONDS.labels("vad_voz").inc(sum(size for _, size in segments) / bytes_per_ms / 1000)
+    AUDIO_SECONDS.labels("vad_descartado").inc(segmenter.dropped_ms / 1000)
+    logger.info(f"VAD: {len(segments)} segmentos con voz, {segmenter.dropped_ms / 1000:.0f}s sin voz descartados")
+    return [(start_ms, start_ms + size // bytes_per_ms) for start_ms, size in segments]
+
+async def split_downloaded(url: str, chunk_duration: int, redis: aioredis.Redis, media_name: str, chunk_format: dict,
+                           vad_config: dict = None, executor: Executor = None):
+    """
+    Modo completo: descarga todo el archivo, lo decodifica con pydub y lo corta
+    cada `chunk_duration` segundos o, con `vad_config`, en las pausas.
+    Solo sirve para VODs y requiere memoria proporcional a la duración.
+
+    Los chunks se codifican en un pool de procesos (CHUNKER_EXPORT_WORKERS, o
+    `executor` si se pasa uno compartido) y como mucho hay
+    CHUNKER_MAX_IN_FLIGHT cortados y pendientes a la vez: el corte se frena
+    hasta que se libera un lugar.
+    """
+    workers = int(os.getenv("CHUNKER_EXPORT_WORKERS", str(os.cpu_count() or 1)))
+    max_in_flight = int(os.getenv("CHUNKER_MAX_IN_FLIGHT", str(workers * 2)))
+
+    # Descargar audio completo (sin pasar por mp3 si el chunk no va a ser mp3)
+    audio_path, info = await download_audio(url, extract_mp3=chunk_format["ext"] == "mp3")
+    start_time = media_start_time(info)
+    await register_media(redis, media_name, info)
+    with STAGE_SECONDS.labels("decode").time():
+        audio = await asyncio.to_thread(AudioSegment.from_file, audio_path)
+    duration_ms = len(audio)
+    chunk_ms = chunk_duration * 1000
+    if vad_config:
+        with STAGE_SECONDS.labels("vad").time():
+            bounds = await asyncio.to_thread(vad_bounds, audio, vad_config)
+    else:
+        bounds = [(start, min(start + chunk_ms, duration_ms)) for start in range(0, duration_ms, chunk_ms)]
+
+    in_flight = asyncio.Semaphore(max_in_flight)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
         tasks = []
         index = 1
-        for start in range(0, duration_ms, chunk_ms):
-            end = min(start + chunk_ms, duration_ms)
-            chunk = audio[start:end]
+        for start, end in bounds:
+            await in_flight.acquire()
+            with STAGE_SECONDS.labels("slice").time():
+                chunk = audio[start:end]
             logger.debug(f"Procesando chunk {index}: {start}ms a {end}ms")
-            tasks.append(asyncio.create_task(handle_chunk(chunk, index, url, chunk_duration, redis, media_name)))
+            chunk_start = start_time + datetime.timedelta(milliseconds=start)
+            task = asyncio.create_task(handle_chunk(chunk, index, url, chunk_duration, redis, media_name,
+                                                    executor, chunk_format, chunk_start))
+            task.add_done_callback(lambda _: in_flight.release())
+            tasks.append(task)
             index += 1
 
         # Esperar a que todas las tareas terminen
         await asyncio.gather(*tasks)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def redis_from_env(max_connections: int = None) -> aioredis.Redis:
+    # Conexión a Redis usando redis-py con soporte asyncio; con max_connections
+    # el pool es compartido y espera a que se libere una conexión
+    redis_url = "redis://" + os.getenv("REDIS_HOST") + ":" + os.getenv("REDIS_PORT")
+    if max_connections:
+        pool = aioredis.BlockingConnectionPool.from_url(redis_url, max_connections=max_connections,
+                                                        encoding="utf-8", decode_responses=True)
+        return aioredis.Redis(connection_pool=pool)
+    return aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+
+async def process_url(url: str, chunk_duration: int, media_name: str = None, mode: str = None,
+                      redis: aioredis.Redis = None, executor: Executor = None):
+    """
+    Procesa una fuente completa. `redis` y `executor` permiten compartir la
+    conexión y el pool de procesos entre fuentes (ChunkerService); si no se
+    pasan, se crean y se cierran acá.
+    """
+    if media_name is None:
+        raise Exception("media_name is None")
+    mode = mode or os.getenv("CHUNKER_MODE", "completo")
+    if mode not in ("completo", "streaming"):
+        raise Exception(f"CHUNKER_MODE desconocido: {mode}")
+    segmenter = os.getenv("CHUNKER_SEGMENTER", "fijo")
+    if segmenter not in ("fijo", "vad"):
+        raise Exception(f"CHUNKER_SEGMENTER desconocido: {segmenter}")
+    vad_config = vad_config_from_env() if segmenter == "vad" else None
+    chunk_format = get_chunk_format()
+
+    own_redis = redis is None
+    if own_redis:
+        redis = redis_from_env()
+    try:
+        if mode == "streaming" and (vad_config or chunk_format.get("redis")):
+            await stream_pcm_chunks(url, chunk_duration, redis, media_name, chunk_format, vad_config, executor)
+        elif mode == "streaming":
+            await stream_chunks(url, chunk_duration, redis, media_name, chunk_format)
+        else:
+            await split_downloaded(url, chunk_duration, redis, media_name, chunk_format, vad_config, executor)
+        if scheduling_from_env() == "fuentes":
+            await finish_source(redis, os.getenv("REDIS_QUEUE_TRANSCRIPTION_JOB"), media_name)
+    finally:
+        if own_redis:
+            await redis.aclose()
+
+class ChunkerService:
+    """
+    Chunker de larga duración para muchas fuentes a la vez. Cada
+    `refresh_seconds` relee las fuentes (`load_sources`, ver sources.py) y
+    mantiene una tarea por fuente: arranca las nuevas, cancela las que se
+    quitaron y reinicia las que cambiaron de configuración.
+
+    Una fuente que falla se reintenta con backoff exponencial (de
+    `restart_seconds` hasta `restart_max_seconds`), descartando su entrada en
+    el cache de yt_dlp por si la URL venció; una `continuo` se vuelve a
+    capturar también cuando termina. Como mucho corren `max_sources` a la vez
+    (0 = sin tope) y todas comparten la conexión a Redis y el pool de procesos.
+    """
+
+    def __init__(self, redis: aioredis.Redis, load_sources, chunk_duration: int, executor: Executor = None,
+                 refresh_seconds: float = 30, max_sources: int = 0, restart_seconds: float = 5,
+                 restart_max_seconds: float = 300):
+        self.redis = redis
+        self.load_sources = load_sources
+        self.chunk_duration = chunk_duration
+        self.executor = executor
+        self.refresh_seconds = refresh_seconds
+        self.slots = asyncio.Semaphore(max_sources) if max_sources else None
+        self.restart_seconds = restart_seconds
+        self.restart_max_seconds = restart_max_seconds
+        # media → (configuración, tarea)
+        self.tasks = {}
+
+    async def _process(self, source: dict):
+        await process_url(source["url"], int(source.get("chunk_duration", self.chunk_duration)), source["media"],
+                          source.get("modo"), redis=self.redis, executor=self.executor)
+
+    async def run_source(self, source: dict):
+        media = source["media"]
+        delay = self.restart_seconds
+        while True:
+            try:
+                if self.slots is not None:
+                    async with self.slots:
+                        await self._process(source)
+                else:
+                    await self._process(source)
+                if not source.get("continuo"):
+                    logger.info(f"Fuente '{media}' terminada")
+                    return
+                delay = self.restart_seconds
+                logger.info(f"Fuente '{media}' cortada, se vuelve a capturar en {delay:.0f}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stream_info_cache().invalidate(source["url"])
+                logger.error(f"Fuente '{media}' falló, se reintenta en {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.restart_max_seconds)
+
+    async def _stop(self, media: str):
+        _, task = self.tasks.pop(media)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def reconcile(self):
+        try:
+            sources = await self.load_sources()
+        except Exception as e:
+            logger.error(f"No se pudieron leer las fuentes, se siguen las actuales: {e}")
+            return
+        for media in [media for media, (source, _) in self.tasks.items() if sources.get(media) != source]:
+            logger.info(f"Fuente '{media}' quitada o modificada, se detiene")
+            await self._stop(media)
+        for media, source in sources.items():
+            if media not in self.tasks:
+                logger.info(f"Fuente '{media}' agregada: {source['url']}")
+                self.tasks[media] = (source, asyncio.create_task(self.run_source(source)))
+
+    async def run(self):
+        try:
+            while True:
+                await self.reconcile()
+                await asyncio.sleep(self.refresh_seconds)
+        finally:
+            for media in list(self.tasks):
+                await self._stop(media)
+
+def sources_loader(sources: str, redis: aioredis.Redis):
+    """
+    `sources` es la ruta a un archivo JSON o `redis` (el hash CHUNKER_SOURCES_KEY).
+    """
+    if sources == "redis":
+        key = os.getenv("CHUNKER_SOURCES_KEY", "chunker:fuentes")
+        return lambda: load_sources_redis(redis, key)
+    return lambda: asyncio.to_thread(load_sources_file, sources)
+
+async def run_service(sources: str, chunk_duration: int):
+    # las descargas y las llamadas a yt_dlp corren en hilos: con cientos de
+    # fuentes el pool por defecto del loop se queda corto
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.getenv("CHUNKER_IO_THREADS", "64"))))
+    redis = redis_from_env(int(os.getenv("CHUNKER_REDIS_MAX_CONNECTIONS", "50")))
+    workers = int(os.getenv("CHUNKER_EXPORT_WORKERS", str(os.cpu_count() or 1)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            service = ChunkerService(redis, sources_loader(sources, redis), chunk_duration, executor,
+                                     refresh_seconds=float(os.getenv("CHUNKER_SOURCES_REFRESH_SECONDS", "30")),
+                                     max_sources=int(os.getenv("CHUNKER_MAX_SOURCES", "0")),
+                                     restart_seconds=float(os.getenv("CHUNKER_RESTART_SECONDS", "5")),
+                                     restart_max_seconds=float(os.getenv("CHUNKER_RESTART_MAX_SECONDS", "300")))
+            await service.run()
     finally:
         await redis.aclose()
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Extrae y procesa chunks de audio de un video de YouTube.")
+    parser = argparse.ArgumentParser(description="Extrae y procesa chunks de audio de YouTube y otras fuentes.")
+    parser.add_argument("url", nargs="?", help="URL a procesar una sola vez")
+    parser.add_argument("--media", help="Nombre de la media de la URL")
+    parser.add_argument("--fuentes", help="Servicio: archivo JSON de fuentes o 'redis' (hash CHUNKER_SOURCES_KEY)")
+    args = parser.parse_args()
+    if bool(args.url) == bool(args.fuentes) or (args.url and not args.media):
+        parser.error("Hay que pasar una URL con --media, o --fuentes")
     # Carga variables desde .env
     load_dotenv()
 
-    # Obtiene el valor de DB_HOST y lo imprime
-
-    # parser.add_argument('url', help="URL del video de YouTube")
-    # parser.add_argument('--chunk-duration', type=int, default=15,
-    #                     help="Duración de cada chunk en segundos (por defecto: 15)")
-    # args = parser.parse_args()
-    URL_YT = "https://www.youtube.com/watch?v=LWRr4MEECcQ"
-    CHUNK_DURATION = 15
-    logger.info(f"Iniciando procesamiento de {URL_YT} con chunks de {CHUNK_DURATION}s")
-    media_name = "test-media"
-    asyncio.run(process_url(URL_YT, int(os.getenv("AUDIO_CHUNK_DURATION_SECONDS")), media_name))
+    chunk_duration = int(os.getenv("AUDIO_CHUNK_DURATION_SECONDS", "15"))
+    start_metrics_server(9100)
+    try:
+        if args.fuentes:
+            logger.info(f"Iniciando servicio de chunking con las fuentes de {args.fuentes}")
+            asyncio.run(run_service(args.fuentes, chunk_duration))
+        else:
+            logger.info(f"Iniciando procesamiento de {args.url} con chunks de {chunk_duration}s")
+            asyncio.run(process_url(args.url, chunk_duration, args.media))
+    except KeyboardInterrupt:
+        logger.info("Deteniendo chunker…")
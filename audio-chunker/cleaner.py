@@ -1,12 +1,18 @@
 import asyncio
 import datetime
-import json
 import logging
 import os
+import sys
 
 import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
+# el transporte de jobs (pipeline/) se comparte con el chunker y el transcriber
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.audio import AUDIO_KEY_FIELD, delete_audio
+from pipeline.metrics import JOBS, STAGE_SECONDS, start_metrics_server, watch_queue_depths
+from pipeline.streams import StreamQueue, stream_queue_from_env
+
 
 def setup_logger():
     logger = logging.getLogger("cleaner")
@@ -20,40 +26,74 @@ def setup_logger():
 
 logger = setup_logger()
 
-async def cleaner(redis: aioredis.Redis, transcribed_queue: str, completed_queue: str):
-    logger.info(f"Cleaner iniciado, leyendo de '{transcribed_queue}'")
-    while True:
-        try:
-            payload = await redis.lpop(transcribed_queue)
-            if not payload:
-                await asyncio.sleep(1)
-                continue
+def delete_file(file_path: str):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        # ya borrado: un job recuperado de un cleaner que se cayó antes de confirmarlo
+        logger.warning(f"'{file_path}' ya no existe, se da por borrado")
 
-            job = json.loads(payload)
-            file_path = job.get('file-path')
+async def delete_job_file(job: dict):
+    # los chunks guardados en Redis no tienen archivo: clean_batch borra sus claves
+    if job.get('file-path'):
+        await asyncio.to_thread(delete_file, job['file-path'])
 
-            try:
-                os.remove(file_path)
-                # marcar fecha de borrado
-                job['file_deleted_date'] = datetime.datetime.utcnow().isoformat()
-                # enviar a completed_jobs
-                new_payload = json.dumps(job)
-                await redis.lpush(completed_queue, new_payload)
-                logger.info(f"Archivo '{file_path}' borrado. Job enviado a '{completed_queue}': {job}")
-            except Exception as del_err:
-                # si falla el borrado, reenviar para reintento
-                await redis.lpush(transcribed_queue, payload)
-                logger.error(f"No se pudo borrar '{file_path}', reencolando: {del_err}")
+async def clean_batch(queue: StreamQueue, messages: list, completed_stream: str):
+    """
+    Borra en paralelo (fuera del event loop) los archivos de un batch de jobs
+    y, con un único DEL, los chunks guardados en Redis. Confirma todos los
+    borrados en una sola transacción y reintenta el resto.
+    """
+    with STAGE_SECONDS.labels("delete").time():
+        await delete_audio(queue.redis, [job[AUDIO_KEY_FIELD] for _, job in messages if job.get(AUDIO_KEY_FIELD)])
+        results = await asyncio.gather(
+            *(delete_job_file(job) for _, job in messages),
+            return_exceptions=True
+        )
+    deleted_date = datetime.datetime.utcnow().isoformat()
+    deleted = []
+    for (message_id, job), result in zip(messages, results):
+        if isinstance(result, Exception):
+            # si falla el borrado, reintentar más tarde
+            logger.error(f"No se pudo borrar '{job.get('file-path')}': {result}")
+            await queue.retry(message_id, job, result)
+            continue
+        # marcar fecha de borrado
+        job['file_deleted_date'] = deleted_date
+        deleted.append((message_id, job))
+
+    # confirmar y enviar a completed_jobs
+    await queue.move_many(deleted, completed_stream)
+    JOBS.labels(queue.stream, "ok").inc(len(deleted))
+    if deleted:
+        logger.info(f"{len(deleted)} chunks borrados. Jobs enviados a '{completed_stream}': "
+                    f"{[job.get('id') for _, job in deleted]}")
+
+async def cleaner(queue: StreamQueue, completed_stream: str, batch_size: int = 50):
+    logger.info(f"Cleaner iniciado, leyendo de '{queue.stream}' como '{queue.consumer}' (batches de {batch_size})")
+    while True:
+        try:
+            # bloquea hasta que haya jobs y toma todos los disponibles (hasta batch_size)
+            messages = await queue.read(count=batch_size)
+            if messages:
+                await clean_batch(queue, messages, completed_stream)
 
         except Exception as e:
             logger.error(f"Error en bucle cleaner: {e}")
             await asyncio.sleep(1)
 
-async def main(redis_url: str, transcribed_queue: str, completed_queue: str):
+async def main(redis_url: str, transcribed_stream: str, group: str, completed_stream: str, batch_size: int = 50):
     redis = aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    watcher = None
     try:
-        await cleaner(redis, transcribed_queue, completed_queue)
+        if start_metrics_server(9102, "CLEANER_METRICS_PORT"):
+            watcher = asyncio.create_task(watch_queue_depths(redis))
+        queue = stream_queue_from_env(redis, transcribed_stream, group, "cleaner")
+        await queue.ensure_group()
+        await cleaner(queue, completed_stream, batch_size)
     finally:
+        if watcher:
+            watcher.cancel()
         await redis.close()
 
 if __name__ == '__main__':
@@ -65,13 +105,17 @@ if __name__ == '__main__':
     redis_url = f"redis://{redis_host}:{redis_port}"
     transcribed_not_deleted_queue   = os.getenv("REDIS_QUEUE_TRANSCRIBED_FILES_NOT_DELETED_JOB")
     transcribed_and_deleted_queue   = os.getenv("REDIS_QUEUE_TRANSCRIBED_DELETED")
+    consumer_group                  = os.getenv("REDIS_CONSUMER_GROUP_CLEANER", "cleaners")
+    batch_size = int(os.getenv("CLEANER_BATCH_SIZE", "50"))
 
     logger.info(f"Iniciando cleaner: de '{transcribed_not_deleted_queue}' → '{transcribed_and_deleted_queue}'")
     try:
         asyncio.run(main(
             redis_url,
             transcribed_not_deleted_queue,
-            transcribed_and_deleted_queue
+            consumer_group,
+            transcribed_and_deleted_queue,
+            batch_size
         ))
     except KeyboardInterrupt:
         logger.info("Deteniendo cleaner…")
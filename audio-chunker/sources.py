@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import redis.asyncio as aioredis
+
+# Piezas del chunker como servicio (audio-chunker.py --fuentes): la lista de
+# fuentes a procesar, el límite de pedidos a yt_dlp por host y el cache de la
+# metadata y la URL real del audio de cada fuente.
+#
+# Una fuente es una media (el nombre con el que se guardan sus bloques) con su
+# URL y, opcionalmente, `modo`, `chunk_duration` y `continuo` (radios 24/7: se
+# vuelve a capturar cuando la transmisión se corta o termina).
+
+# las URLs firmadas de YouTube traen su vencimiento: `expire=<epoch>` en la
+# query o `/expire/<epoch>/` en el path (manifiestos HLS de los vivos)
+EXPIRE_RE = re.compile(r"[/?&]expire[/=](\d+)")
+
+
+def parse_source(media: str, value) -> dict:
+    """
+    Configuración de una fuente: un dict con al menos `url`, o directamente la URL.
+    """
+    if isinstance(value, str):
+        value = json.loads(value) if value.lstrip().startswith("{") else {"url": value}
+    if not value.get("url"):
+        raise ValueError(f"La fuente '{media}' no tiene url")
+    return {**value, "media": media}
+
+
+def load_sources_file(path: str) -> dict:
+    """
+    Fuentes de un archivo JSON: un objeto media → configuración (o URL), o una
+    lista de configuraciones con `media`.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {source["media"]: source for source in data}
+    return {media: parse_source(media, value) for media, value in data.items()}
+
+
+async def load_sources_redis(redis: aioredis.Redis, key: str) -> dict:
+    """
+    Fuentes del hash `key`: campo = media, valor = URL o configuración en JSON.
+    """
+    return {media: parse_source(media, value) for media, value in (await redis.hgetall(key)).items()}
+
+
+class HostLimiter:
+    """
+    Límite de pedidos a yt_dlp por host: como mucho `concurrency` a la vez y
+    `min_interval` segundos entre el comienzo de dos pedidos, para no disparar
+    los bloqueos de YouTube al arrancar cientos de fuentes juntas.
+    """
+
+    def __init__(self, concurrency: int = 2, min_interval: float = 1.0):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self._semaphores = {}
+        self._locks = {}
+        self._next_start = {}
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        host = urlparse(url).hostname or ""
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            async with self._locks.setdefault(host, asyncio.Lock()):
+                wait = self._next_start.get(host, 0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._next_start[host] = time.monotonic() + self.min_interval
+            yield
+
+
+class StreamInfoCache:
+    """
+    Cache de (metadata de yt_dlp, URL real del audio) por URL de la fuente. Una
+    entrada vence a los `ttl_seconds` o `margin_seconds` antes de que venza la
+    URL firmada, lo que pase primero.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, margin_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self.margin_seconds = margin_seconds
+        # url → (vencimiento en epoch, info, stream_url)
+        self._entries = {}
+
+    def expiry(self, stream_url: str, now: float) -> float:
+        expiry = now + self.ttl_seconds
+        match = EXPIRE_RE.search(stream_url or "")
+        if match:
+            expiry = min(expiry, int(match.group(1)) - self.margin_seconds)
+        return expiry
+
+    def get(self, url: str):
+        entry = self._entries.get(url)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(url, None)
+            return None
+        return entry[1], entry[2]
+
+    def put(self, url: str, info: dict, stream_url: str):
+        now = time.time()
+        for expired in [key for key, entry in self._entries.items() if entry[0] <= now]:
+            del self._entries[expired]
+        if self.ttl_seconds > 0:
+            self._entries[url] = (self.expiry(stream_url, now), info, stream_url)
+
+    def invalidate(self, url: str):
+        self._entries.pop(url, None)
+
+
+def host_limiter_from_env() -> HostLimiter:
+    return HostLimiter(int(os.getenv("CHUNKER_HOST_CONCURRENCY", "2")),
+                       float(os.getenv("CHUNKER_HOST_MIN_INTERVAL_SECONDS", "1")))
+
+
+def stream_info_cache_from_env() -> StreamInfoCache:
+    return StreamInfoCache(float(os.getenv("CHUNKER_STREAM_CACHE_TTL_SECONDS", "300")))
@@ -0,0 +1,165 @@
+import logging
+import os
+
+logger = logging.getLogger("youtube_chunker")
+
+# Segmentado por voz: en vez de cortar cada N segundos, los cortes se hacen
+# en las pausas y los segmentos sin voz (música, silencio) no se encolan.
+# El audio se analiza en frames de 30ms de PCM 16 kHz mono 16 bits, que es
+# lo que acepta webrtcvad.
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+
+def vad_config_from_env() -> dict:
+    return {
+        "aggressiveness": int(os.getenv("VAD_AGGRESSIVENESS", "2")),
+        "min_ms": int(float(os.getenv("VAD_MIN_SECONDS", "5")) * 1000),
+        "max_ms": int(float(os.getenv("VAD_MAX_SECONDS", "25")) * 1000),
+        "min_silence_ms": int(os.getenv("VAD_MIN_SILENCE_MS", "300")),
+        "min_speech_ratio": float(os.getenv("VAD_MIN_SPEECH_RATIO", "0.3")),
+    }
+
+
+class SpeechDetector:
+    """
+    Clasifica frames de FRAME_MS como voz / no voz con webrtcvad.
+    """
+    def __init__(self, aggressiveness: int = 2, **_):
+        import webrtcvad
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame: bytes) -> bool:
+        return self.vad.is_speech(frame, SAMPLE_RATE)
+
+
+class VadSegmenter:
+    """
+    Arma segmentos a partir de frames ya clasificados, de a uno (sirve tanto
+    para un archivo completo como para un stream):
+
+    - pasado `min_ms`, corta en la primera pausa de al menos `min_silence_ms`;
+    - al llegar a `max_ms`, corta en la pausa más larga del segmento (o ahí
+      mismo si no hubo ninguna);
+    - descarta los segmentos con menos de `min_speech_ratio` de voz, el
+      silencio inicial en cuanto dura `min_silence_ms` y una cola final más
+      corta que `min_silence_ms`.
+
+    push y flush devuelven los segmentos terminados como (inicio_ms, pcm).
+    """
+
+    def __init__(self, min_ms: int = 5000, max_ms: int = 25000, min_silence_ms: int = 300,
+                 min_speech_ratio: float = 0.3, frame_ms: int = FRAME_MS, **_):
+        self.frame_ms = frame_ms
+        self.min_frames = max(1, min_ms // frame_ms)
+        self.max_frames = max(self.min_frames, max_ms // frame_ms)
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.min_speech_ratio = min_speech_ratio
+        self._frames = []
+        self._speech = []
+        self._silence_run = 0
+        self._n_speech = 0
+        # número de frame (desde el inicio del audio) del primer frame en el buffer
+        self._start = 0
+        self.dropped_ms = 0
+
+    def push(self, frame: bytes, speech: bool) -> list:
+        self._frames.append(frame)
+        self._speech.append(speech)
+        self._silence_run = 0 if speech else self._silence_run + 1
+        self._n_speech += speech
+
+        if not self._n_speech and self._silence_run >= self.min_silence_frames:
+            # todavía no empezó a hablar: no hace falta acumular el silencio
+            self._discard(len(self._frames))
+            return []
+        if len(self._frames) >= self.min_frames and self._silence_run >= self.min_silence_frames:
+            return self._cut(len(self._frames) - self._silence_run // 2)
+        if len(self._frames) >= self.max_frames:
+            return self._cut(self._best_pause())
+        return []
+
+    def flush(self) -> list:
+        if len(self._frames) < self.min_silence_frames:
+            # una cola más corta que una pausa no tiene nada que transcribir
+            self._discard(len(self._frames))
+            return []
+        return self._cut(len(self._frames))
+
+    def _best_pause(self) -> int:
+        """
+        Mitad de la pausa más larga después de min_frames, o el final del buffer.
+        """
+        best, best_len, run = len(self._frames), 0, 0
+        for i, speech in enumerate(self._speech):
+            run = 0 if speech else run + 1
+            if i >= self.min_frames and run > best_len:
+                best, best_len = i + 1 - run // 2, run
+        return best
+
+    def _advance(self, n: int):
+        self._n_speech -= sum(self._speech[:n])
+        del self._frames[:n]
+        del self._speech[:n]
+        self._start += n
+
+    def _discard(self, n: int):
+        self.dropped_ms += n * self.frame_ms
+        self._advance(n)
+
+    def _cut(self, n: int) -> list:
+        start_ms = self._start * self.frame_ms
+        speech_ratio = sum(self._speech[:n]) / n
+        pcm = b"".join(self._frames[:n])
+        if speech_ratio < self.min_speech_ratio:
+            logger.debug(f"Segmento sin voz descartado: {start_ms}ms, {n * self.frame_ms}ms "
+                         f"({speech_ratio:.0%} de voz)")
+            self._discard(n)
+            segments = []
+        else:
+            self._advance(n)
+            segments = [(start_ms, pcm)]
+        self._silence_run = 0
+        for speech in reversed(self._speech):
+            if speech:
+                break
+            self._silence_run += 1
+        return segments
+
+
+class FixedSegmenter:
+    """
+    Misma interfaz que VadSegmenter pero corta cada `chunk_ms` sin mirar la
+    voz: el segmentado fijo cuando el audio llega como PCM.
+    """
+
+    def __init__(self, chunk_ms: int, frame_ms: int = FRAME_MS):
+        self.frame_ms = frame_ms
+        self.chunk_frames = max(1, chunk_ms // frame_ms)
+        self._frames = []
+        self._start = 0
+        self.dropped_ms = 0
+
+    def push(self, frame: bytes, speech: bool = True) -> list:
+        self._frames.append(frame)
+        if len(self._frames) >= self.chunk_frames:
+            return self.flush()
+        return []
+
+    def flush(self) -> list:
+        if not self._frames:
+            return []
+        segment = (self._start * self.frame_ms, b"".join(self._frames))
+        self._start += len(self._frames)
+        self._frames = []
+        return [segment]
+
+
+def iter_frames(pcm: bytes):
+    """
+    Frames completos de FRAME_MS de un PCM 16 kHz mono 16 bits (el resto se ignora).
+    """
+    for offset in range(0, len(pcm) - FRAME_BYTES + 1, FRAME_BYTES):
+        yield pcm[offset:offset + FRAME_BYTES]
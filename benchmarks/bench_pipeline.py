@@ -0,0 +1,536 @@
+"""
+Benchmark reproducible del pipeline chunk → transcribe → store.
+
+Cada etapa corre en un proceso aparte (para poder medir su pico de RSS) y
+contra stand-ins locales:
+
+- chunker: audio sintético (WAV generado acá) cortado con split_downloaded o
+  stream_chunks, sin pasar por YouTube.
+- transcriber: los workers reales (consumer / batch_consumer) con un motor
+  stub de real-time factor fijo, o un modelo chico (`--engine faster-whisper
+  --modelo tiny`). Los bloques van a la API real si hay Postgres, si no a un
+  endpoint simulado.
+- cleaner: el cleaner real sobre archivos vacíos.
+- api: inserts, carga masiva y búsquedas contra un Postgres descartable
+  (variables DB_*; la etapa se saltea si no hay DB_HOST).
+
+Las colas son fakeredis, o un Redis real con `--redis-url`. Por etapa se
+informa throughput, latencia p50/p99 por item y pico de RSS. Con `--guardar`
+se escribe el resultado en JSON y con `--comparar` se lo compara contra uno
+anterior: sale con código 1 si alguna etapa empeoró más de `--tolerancia`.
+
+    python benchmarks/bench_pipeline.py --audio-segundos 600 --guardar base.json
+    python benchmarks/bench_pipeline.py --audio-segundos 600 --comparar base.json
+"""
+import argparse
+import array
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "transcriber"))
+sys.path.append(os.path.join(ROOT, "audio-chunker"))
+
+ETAPAS = ("chunker", "transcriber", "cleaner", "api")
+SAMPLE_RATE = 16000
+
+
+def generar_audio(path: str, segundos: float, seed: int = 0):
+    """
+    WAV 16 kHz mono con tonos y ruido. Se genera un segundo y se repite, con
+    lo que el archivo es determinístico y rápido de crear.
+    """
+    rng = random.Random(seed)
+    frecuencia = rng.choice((220, 330, 440))
+    segundo = array.array("h", (
+        int(8000 * math.sin(2 * math.pi * frecuencia * i / SAMPLE_RATE) + rng.gauss(0, 800))
+        for i in range(SAMPLE_RATE)
+    )).tobytes()
+    completos, resto = divmod(int(segundos * SAMPLE_RATE), SAMPLE_RATE)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for _ in range(completos):
+            wav.writeframes(segundo)
+        wav.writeframes(segundo[:resto * 2])
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumen(items: int, segundos: float, latencias: list, audio_segundos: float = None) -> dict:
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    resultado = {
+        "items": items,
+        "segundos": round(segundos, 3),
+        "items_por_segundo": round(items / segundos, 2) if segundos else 0.0,
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        # ru_maxrss está en KB en Linux
+        "rss_pico_mb": round(propio / 1024, 1),
+        "rss_pico_hijos_mb": round(hijos / 1024, 1),
+    }
+    if audio_segundos is not None:
+        resultado["x_tiempo_real"] = round(audio_segundos / segundos, 1) if segundos else 0.0
+    return resultado
+
+
+def cargar_modulo(nombre: str, path: str):
+    spec = importlib.util.spec_from_file_location(nombre, path)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+async def conectar_redis(redis_url: str = None):
+    if redis_url:
+        import redis.asyncio as aioredis
+        return aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+async def esperar_largo(redis, stream: str, n: int, timeout: float):
+    limite = time.perf_counter() + timeout
+    while await redis.xlen(stream) < n:
+        if time.perf_counter() > limite:
+            raise TimeoutError(f"'{stream}' no llegó a {n} jobs en {timeout}s")
+        await asyncio.sleep(0.02)
+
+
+def instrumentar_lectura(queue, parar: asyncio.Event, leidos: dict = None):
+    """
+    Envuelve queue.read para anotar cuándo se leyó cada job y para poder
+    detener el worker: fakeredis corta un comando bloqueante cancelado
+    devolviendo vacío en vez de propagar la cancelación, así que el worker
+    sigue leyendo hasta que se levanta `parar`.
+    """
+    read = queue.read
+
+    async def timed_read(*a, **kw):
+        if parar.is_set():
+            raise asyncio.CancelledError()
+        messages = await read(*a, **kw)
+        ahora = time.perf_counter()
+        for _, job in messages:
+            if leidos is not None:
+                leidos[job["id"]] = ahora
+        return messages
+    queue.read = timed_read
+
+
+async def detener(tasks: list, parar: asyncio.Event):
+    parar.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def borrar_claves(redis, prefijo: str):
+    claves = [clave async for clave in redis.scan_iter(f"{prefijo}*")]
+    if claves:
+        await redis.delete(*claves)
+
+
+class StubEngine:
+    """
+    Motor de transcripción falso: duerme `rtf` segundos por segundo de audio.
+    Mide el costo del pipeline alrededor del modelo, no el modelo.
+    """
+    def __init__(self, rtf: float = 0.05, **_):
+        self.rtf = rtf
+
+    def load_audio(self, path: str):
+        with wave.open(path, "rb") as wav:
+            return [0] * wav.getnframes()
+
+    def transcribe_audio(self, audio) -> str:
+        time.sleep(len(audio) / SAMPLE_RATE * self.rtf)
+        return "texto de prueba"
+
+    def transcribe_words(self, audio) -> tuple:
+        texto = self.transcribe_audio(audio)
+        return texto, [(i * 500, palabra) for i, palabra in enumerate(texto.split())]
+
+    def decode_batch(self, audios: list) -> list:
+        return [self.transcribe_audio(audio) for audio in audios]
+
+
+def init_bench_engine(config: dict):
+    import engines
+    engines.ENGINES["stub"] = StubEngine
+    engines.init_engine(config)
+
+
+async def bench_chunker(args, workdir: str) -> dict:
+    os.environ["AUDIO_CHUNKS_PATH"] = os.path.join(workdir, "chunks")
+    os.environ["CHUNK_FORMAT"] = args.formato
+    os.environ["CHUNKER_EXPORT_WORKERS"] = str(args.procesos)
+    prefijo = f"bench:{uuid.uuid4()}:"
+    os.environ["REDIS_QUEUE_TRANSCRIPTION_JOB"] = prefijo + "pendientes"
+    chunker = cargar_modulo("audio_chunker", os.path.join(ROOT, "audio-chunker", "audio-chunker.py"))
+
+    audio_path = os.path.join(workdir, "fuente.wav")
+    generar_audio(audio_path, args.audio_segundos)
+    info = {"is_live": False, "timestamp": 1747130400}
+
+    # la descarga se reemplaza por el archivo local
+    async def download_audio(url: str, extract_mp3: bool = True):
+        return audio_path, info
+    chunker.download_audio = download_audio
+    chunker.resolve_stream = lambda url: (info, audio_path)
+
+    # latencia por chunk: desde el corte hasta que quedó encolado (modo completo)
+    # o entre dos chunks consecutivos (modo streaming)
+    latencias = []
+    handle_chunk = chunker.handle_chunk
+    enqueue_chunk = chunker.enqueue_chunk
+    ultimo = [time.perf_counter()]
+
+    async def medir_handle_chunk(*a, **kw):
+        inicio = time.perf_counter()
+        await handle_chunk(*a, **kw)
+        latencias.append(time.perf_counter() - inicio)
+
+    async def medir_enqueue_chunk(*a, **kw):
+        await enqueue_chunk(*a, **kw)
+        if args.modo == "streaming":
+            ahora = time.perf_counter()
+            latencias.append(ahora - ultimo[0])
+            ultimo[0] = ahora
+    chunker.handle_chunk = medir_handle_chunk
+    chunker.enqueue_chunk = medir_enqueue_chunk
+
+    redis = await conectar_redis(args.redis_url)
+    try:
+        chunk_format = chunker.get_chunk_format()
+        vad_config = chunker.vad_config_from_env() if args.segmentador == "vad" else None
+        inicio = time.perf_counter()
+        ultimo[0] = inicio
+        if args.modo == "streaming" and (vad_config or chunk_format.get("redis")):
+            await chunker.stream_pcm_chunks("bench://audio", args.chunk_segundos, redis, "bench", chunk_format,
+                                            vad_config)
+        elif args.modo == "streaming":
+            await chunker.stream_chunks("bench://audio", args.chunk_segundos, redis, "bench", chunk_format)
+        else:
+            await chunker.split_downloaded("bench://audio", args.chunk_segundos, redis, "bench", chunk_format,
+                                           vad_config)
+        segundos = time.perf_counter() - inicio
+        items = await redis.xlen(os.environ["REDIS_QUEUE_TRANSCRIPTION_JOB"])
+    finally:
+        await borrar_claves(redis, prefijo)
+        await redis.aclose()
+    return resumen(items, segundos, latencias, args.audio_segundos)
+
+
+def api_configurada() -> bool:
+    return bool(os.getenv("DB_HOST"))
+
+
+async def abrir_api():
+    """
+    La API real en proceso (sin red), con el pool abierto a mano porque
+    ASGITransport no dispara el lifespan.
+    """
+    import httpx
+    sys.path.append(os.path.join(ROOT, "api"))
+    from database import open_pool
+    from main import app
+    await open_pool()
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api")
+
+
+async def cerrar_api(http, fuente: str):
+    from database import close_pool, get_pool
+    async with get_pool().connection() as conn:
+        await conn.execute("DELETE FROM transcripciones WHERE fuente = %s", (fuente,))
+    await http.aclose()
+    await close_pool()
+
+
+async def bench_transcriber(args, workdir: str) -> dict:
+    import httpx
+    import transcriber
+    from pipeline.streams import StreamQueue, add_job
+
+    prefijo = f"bench:{uuid.uuid4()}:"
+    os.environ["CHUNK_AUDIO_PREFIX"] = prefijo + "audio:"
+    pendientes, transcriptos = prefijo + "pendientes", prefijo + "transcriptos"
+    fuente = f"bench-{uuid.uuid4()}"
+    chunk_path = os.path.join(workdir, "chunk.wav")
+    generar_audio(chunk_path, args.chunk_segundos)
+
+    if api_configurada():
+        http = await abrir_api()
+        api_url = "http://api/transcripciones/"
+    else:
+        http = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True})))
+        api_url = "http://api-simulada/transcripciones/"
+
+    config = {"backend": args.engine, "model_name": args.modelo, "language": "es", "compute_type": "int8",
+              "beam_size": 1, "threads": max(1, (os.cpu_count() or 1) // args.procesos), "rtf": args.rtf}
+    executor = ProcessPoolExecutor(max_workers=args.procesos, initializer=init_bench_engine, initargs=(config,))
+    redis = await conectar_redis(args.redis_url)
+    tasks = []
+    parar = asyncio.Event()
+    try:
+        # todos los jobs apuntan al mismo archivo (o PCM en Redis): el stub solo mira la duración
+        audio = {"file-path": chunk_path}
+        if args.formato == "pcm":
+            from pipeline.audio import AUDIO_KEY_FIELD, store_audio
+            with wave.open(chunk_path, "rb") as wav:
+                audio = {AUDIO_KEY_FIELD: await store_audio(redis, "chunk", wav.readframes(wav.getnframes()))}
+        for i in range(args.jobs):
+            await add_job(redis, pendientes, {"id": str(i), **audio, "media": fuente,
+                                              "timestamp_inicio": "2025-05-13T10:00:00"})
+
+        # latencia por job: desde que un worker lo lee hasta que lo confirma
+        leidos = {}
+        latencias = []
+        complete_job = transcriber.complete_job
+
+        async def medir_complete_job(name, queue, message_id, job, transcribed_stream):
+            await complete_job(name, queue, message_id, job, transcribed_stream)
+            latencias.append(time.perf_counter() - leidos.pop(job["id"]))
+        transcriber.complete_job = medir_complete_job
+
+        inicio = time.perf_counter()
+        for i in range(args.workers):
+            queue = StreamQueue(redis, pendientes, "bench", f"worker-{i+1}")
+            await queue.ensure_group()
+            instrumentar_lectura(queue, parar, leidos)
+            if args.batch > 1:
+                coro = transcriber.batch_consumer(f"worker-{i+1}", queue, transcriptos, executor, http, api_url,
+                                                  args.batch, args.batch_espera_ms)
+            else:
+                coro = transcriber.consumer(f"worker-{i+1}", queue, transcriptos, executor, http, api_url)
+            tasks.append(asyncio.create_task(coro))
+        await esperar_largo(redis, transcriptos, args.jobs, args.timeout)
+        segundos = time.perf_counter() - inicio
+    finally:
+        await detener(tasks, parar)
+        executor.shutdown(cancel_futures=True)
+        if api_configurada():
+            await cerrar_api(http, fuente)
+        else:
+            await http.aclose()
+        await borrar_claves(redis, prefijo)
+        await redis.aclose()
+    return resumen(args.jobs, segundos, latencias, args.jobs * args.chunk_segundos)
+
+
+async def bench_cleaner(args, workdir: str) -> dict:
+    import cleaner
+    from pipeline.streams import StreamQueue, add_job
+
+    prefijo = f"bench:{uuid.uuid4()}:"
+    transcriptos, borrados = prefijo + "transcriptos", prefijo + "borrados"
+    redis = await conectar_redis(args.redis_url)
+
+    # latencia por job: lo que tardó el batch en el que se borró
+    latencias = []
+    clean_batch = cleaner.clean_batch
+
+    async def medir_clean_batch(queue, messages, completed_stream):
+        inicio = time.perf_counter()
+        await clean_batch(queue, messages, completed_stream)
+        latencias.extend([time.perf_counter() - inicio] * len(messages))
+    cleaner.clean_batch = medir_clean_batch
+
+    task = None
+    parar = asyncio.Event()
+    try:
+        for i in range(args.jobs):
+            path = os.path.join(workdir, f"chunk-{i}.wav")
+            open(path, "wb").close()
+            await add_job(redis, transcriptos, {"id": str(i), "file-path": path})
+
+        queue = StreamQueue(redis, transcriptos, "bench", "cleaner")
+        await queue.ensure_group()
+        instrumentar_lectura(queue, parar)
+        inicio = time.perf_counter()
+        task = asyncio.create_task(cleaner.cleaner(queue, borrados, args.cleaner_batch))
+        await esperar_largo(redis, borrados, args.jobs, args.timeout)
+        segundos = time.perf_counter() - inicio
+    finally:
+        if task:
+            await detener([task], parar)
+        await borrar_claves(redis, prefijo)
+        await redis.aclose()
+    return resumen(args.jobs, segundos, latencias)
+
+
+async def bench_api(args, workdir: str) -> dict:
+    if not api_configurada():
+        return {"salteada": "sin Postgres (configurar DB_HOST, DB_NAME, DB_USER, DB_PASS)"}
+    fuente = f"bench-{uuid.uuid4()}"
+    http = await abrir_api()
+    palabras = ["economía", "inflación", "fútbol", "elecciones", "clima", "tránsito", "salud", "educación"]
+    rng = random.Random(0)
+
+    def bloque(i: int) -> dict:
+        inicio = 1747130400 + i * 15
+        return {
+            "fuente": fuente,
+            "timestamp_inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(inicio)),
+            "timestamp_fin": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(inicio + 15)),
+            "texto": " ".join(rng.choice(palabras) for _ in range(30)),
+        }
+
+    latencias = []
+
+    async def medir(coro):
+        inicio = time.perf_counter()
+        response = await coro
+        response.raise_for_status()
+        latencias.append(time.perf_counter() - inicio)
+
+    try:
+        inicio = time.perf_counter()
+        individuales = args.jobs // 10
+        for i in range(individuales):
+            await medir(http.post("/transcripciones/", json=bloque(i)))
+        for desde in range(individuales, args.jobs, 500):
+            await medir(http.post("/transcripciones/bulk",
+                                  json=[bloque(i) for i in range(desde, min(desde + 500, args.jobs))]))
+        for _ in range(args.busquedas):
+            await medir(http.get("/transcripciones/buscar", params={"fuente": fuente, "texto": rng.choice(palabras),
+                                                                    "limite": 50}))
+        segundos = time.perf_counter() - inicio
+    finally:
+        await cerrar_api(http, fuente)
+    resultado = resumen(len(latencias), segundos, latencias)
+    resultado["bloques_insertados"] = args.jobs
+    return resultado
+
+
+BENCHMARKS = {
+    "chunker": bench_chunker,
+    "transcriber": bench_transcriber,
+    "cleaner": bench_cleaner,
+    "api": bench_api,
+}
+
+
+def correr_etapa(etapa: str, args) -> dict:
+    """
+    Corre una etapa en este proceso. Para aislar el RSS, main la invoca en un
+    subproceso con --etapa.
+    """
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        return asyncio.run(BENCHMARKS[etapa](args, workdir))
+
+
+def correr_en_subproceso(etapa: str, argv: list) -> dict:
+    proceso = subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--etapa", etapa],
+                             capture_output=True, text=True)
+    if proceso.returncode != 0:
+        return {"error": proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else "falló"}
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> list:
+    """
+    Regresiones de `actual` contra `base`: menos throughput o más p99 que la
+    tolerancia relativa.
+    """
+    regresiones = []
+    for etapa, medido in actual.items():
+        anterior = base.get(etapa, {})
+        if "items_por_segundo" not in medido or "items_por_segundo" not in anterior:
+            continue
+        if medido["items_por_segundo"] < anterior["items_por_segundo"] * (1 - tolerancia):
+            regresiones.append(f"{etapa}: throughput {medido['items_por_segundo']} < {anterior['items_por_segundo']}")
+        if anterior["p99_ms"] and medido["p99_ms"] > anterior["p99_ms"] * (1 + tolerancia):
+            regresiones.append(f"{etapa}: p99 {medido['p99_ms']}ms > {anterior['p99_ms']}ms")
+    return regresiones
+
+
+def imprimir(resultados: dict):
+    columnas = ("items", "segundos", "items_por_segundo", "x_tiempo_real", "p50_ms", "p99_ms",
+                "rss_pico_mb", "rss_pico_hijos_mb")
+    print(f"{'etapa':<12}" + "".join(f"{c:>18}" for c in columnas))
+    for etapa, medido in resultados.items():
+        if "items" not in medido:
+            print(f"{etapa:<12}  {medido}")
+            continue
+        print(f"{etapa:<12}" + "".join(f"{str(medido.get(c, '-')):>18}" for c in columnas))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline chunk → transcribe → store.")
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help="Etapas a correr, separadas por coma")
+    parser.add_argument("--etapa", choices=ETAPAS, help=argparse.SUPPRESS)
+    parser.add_argument("--redis-url", help="Redis real en vez de fakeredis (se usan claves bench:*)")
+    parser.add_argument("--audio-segundos", type=float, default=300, help="Duración del audio sintético")
+    parser.add_argument("--chunk-segundos", type=int, default=15)
+    parser.add_argument("--modo", choices=("completo", "streaming"), default="completo",
+                        help="Modo del chunker (streaming requiere ffmpeg)")
+    parser.add_argument("--segmentador", choices=("fijo", "vad"), default="fijo",
+                        help="CHUNKER_SEGMENTER (vad requiere webrtcvad)")
+    parser.add_argument("--formato", default="wav",
+                        help="CHUNK_FORMAT (salvo wav y pcm, requiere ffmpeg); pcm también en el transcriber")
+    parser.add_argument("--jobs", type=int, default=200, help="Jobs para transcriber, cleaner y api")
+    parser.add_argument("--workers", type=int, default=4, help="Corrutinas consumidoras del transcriber")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos del pool")
+    parser.add_argument("--engine", default="stub", help="stub, faster-whisper o whisper")
+    parser.add_argument("--modelo", default="tiny", help="Modelo si --engine no es stub")
+    parser.add_argument("--rtf", type=float, default=0.05, help="Real-time factor del motor stub")
+    parser.add_argument("--batch", type=int, default=1, help="TRANSCRIBER_BATCH_SIZE")
+    parser.add_argument("--batch-espera-ms", type=int, default=200, help="TRANSCRIBER_BATCH_WAIT_MS")
+    parser.add_argument("--cleaner-batch", type=int, default=50, help="CLEANER_BATCH_SIZE")
+    parser.add_argument("--busquedas", type=int, default=50, help="Búsquedas de la etapa api")
+    parser.add_argument("--timeout", type=float, default=600, help="Segundos máximos por etapa")
+    parser.add_argument("--guardar", help="Guarda los resultados en este JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior contra el cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo tolerado")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.etapa:
+        print(json.dumps(correr_etapa(args.etapa, args)))
+        return 0
+
+    resultados = {}
+    for etapa in args.etapas.split(","):
+        resultados[etapa] = correr_en_subproceso(etapa, argv)
+    imprimir(resultados)
+
+    if args.guardar:
+        with open(args.guardar, "w") as f:
+            json.dump(resultados, f, indent=2)
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}")
+        if regresiones:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Benchmark de la serialización de /buscar: antes y después de serializacion.py.
+
+Serializa páginas de filas como las que devuelve Postgres (dicts con
+datetimes) de tres formas:
+
+- jsonable_encoder: lo que hacía FastAPI con las filas crudas
+  (jsonable_encoder + json.dumps, como JSONResponse).
+- response_model: validar con TranscripcionResultado y serializar con
+  pydantic, lo que haría FastAPI con response_model declarado.
+- a_json: serializacion.a_json (orjson si está instalado), lo que usa ahora.
+
+Por método informa el tiempo por página (mediana de `--repeticiones`), filas
+por segundo, tamaño del JSON y pico de memoria asignada (tracemalloc).
+
+    python benchmarks/bench_serializacion.py --filas 1000 --repeticiones 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "api"))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import TranscripcionResultado
+from serializacion import a_json, orjson
+
+
+def generar_filas(n: int, resaltar: bool = True) -> list:
+    inicio = datetime(2025, 5, 13, 10, 0, 0)
+    filas = []
+    for i in range(n):
+        t0 = inicio + timedelta(seconds=15 * i)
+        fila = {
+            "id": i + 1,
+            "fuente": "Radio Mitre",
+            "timestamp_inicio": t0,
+            "timestamp_fin": t0 + timedelta(seconds=15),
+            "texto": "la economía argentina y el dólar en el cierre de la semana " * 4,
+            "creado_en": t0 + timedelta(seconds=40, microseconds=123456),
+        }
+        if resaltar:
+            fila["relevancia"] = 0.1 + (i % 10) / 100
+            fila["fragmento"] = "la <b>economía</b> argentina y el <b>dólar</b>"
+        filas.append(fila)
+    return filas
+
+
+def con_jsonable_encoder(filas: list) -> bytes:
+    return json.dumps(jsonable_encoder(filas), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+ADAPTADOR = TypeAdapter(List[TranscripcionResultado])
+
+
+def con_response_model(filas: list) -> bytes:
+    return ADAPTADOR.dump_json(ADAPTADOR.validate_python(filas), exclude_unset=True)
+
+
+METODOS = {
+    "jsonable_encoder": con_jsonable_encoder,
+    "response_model": con_response_model,
+    "a_json": a_json,
+}
+
+
+def medir(funcion, filas: list, repeticiones: int) -> dict:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion(filas)
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcion(filas)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mediana = statistics.median(tiempos)
+    return {
+        "ms_por_pagina": round(mediana * 1000, 3),
+        "filas_por_segundo": round(len(filas) / mediana),
+        "kb_json": round(len(cuerpo) / 1024, 1),
+        "pico_memoria_kb": round(pico / 1024, 1),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la serialización de /buscar.")
+    parser.add_argument("--filas", type=int, default=1000, help="Filas por página (BUSCAR_LIMITE_MAXIMO)")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--sin-resaltar", action="store_true", help="Filas sin relevancia ni fragmento")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    filas = generar_filas(args.filas, not args.sin_resaltar)
+    resultados = {nombre: medir(funcion, filas, args.repeticiones) for nombre, funcion in METODOS.items()}
+    base = resultados["jsonable_encoder"]["ms_por_pagina"]
+    print(f"{args.filas} filas por página, a_json con {'orjson' if orjson else 'json (sin orjson)'}")
+    columnas = ["ms_por_pagina", "filas_por_segundo", "kb_json", "pico_memoria_kb"]
+    print(f"{'metodo':<18}" + "".join(f"{c:>20}" for c in columnas) + f"{'x_vs_antes':>12}")
+    for nombre, resultado in resultados.items():
+        print(f"{nombre:<18}" + "".join(f"{resultado[c]:>20}" for c in columnas)
+              + f"{base / resultado['ms_por_pagina']:>12.1f}")
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,34 @@
+\ir migrations/palabras.sql
+
+-- Tabla particionada por mes sobre timestamp_inicio. La PK empieza por
+-- timestamp_inicio para servir también a la paginación por (timestamp_inicio, id).
 CREATE TABLE transcripciones (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     fuente TEXT NOT NULL,
     timestamp_inicio TIMESTAMP NOT NULL,
     timestamp_fin TIMESTAMP NOT NULL,
     texto TEXT NOT NULL,
-    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- se mantiene solo en cada INSERT/COPY, no hace falta tocarla desde la API
+    texto_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('spanish', texto)) STORED,
+    -- WHISPER_TIMESTAMPS=palabras: cada palabra y su inicio en ms desde timestamp_inicio
+    palabras TEXT[],
+    palabras_ms INT[],
+    PRIMARY KEY (timestamp_inicio, id)
+) PARTITION BY RANGE (timestamp_inicio);
+
+-- recibe los bloques de meses que todavía no tienen partición
+CREATE TABLE transcripciones_default PARTITION OF transcripciones DEFAULT;
+
+-- búsquedas por fuente + rango de tiempo (/buscar, /exportar)
+CREATE INDEX transcripciones_fuente_inicio_idx ON transcripciones (fuente, timestamp_inicio, id);
+-- rangos de tiempo sin fuente: BRIN ocupa muy poco y los datos llegan ordenados
+CREATE INDEX transcripciones_tiempo_brin_idx ON transcripciones USING BRIN (timestamp_inicio, timestamp_fin);
+-- búsqueda de texto completo (/transcripciones/buscar?texto=...)
+CREATE INDEX transcripciones_texto_tsv_idx ON transcripciones USING GIN (texto_tsv);
+-- apariciones exactas de palabras y frases (/transcripciones/momentos)
+CREATE INDEX transcripciones_palabras_idx ON transcripciones USING GIN (normalizar_palabras(palabras));
+
+\ir migrations/particiones.sql
+
+SELECT crear_particiones_transcripciones(date_trunc('month', now())::date, 3);
@@ -0,0 +1,14 @@
+-- Búsqueda de texto completo en español para bases creadas con la versión
+-- anterior de create_table.sql.
+--
+-- El ADD COLUMN reescribe la tabla (calcula el tsvector de todas las filas).
+-- El índice se crea CONCURRENTLY para no bloquear los INSERT, por eso este
+-- archivo no puede correr dentro de una transacción:
+--   psql -f migrations/0001_busqueda_texto.sql
+
+ALTER TABLE transcripciones
+    ADD COLUMN IF NOT EXISTS texto_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('spanish', texto)) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transcripciones_texto_tsv_idx
+    ON transcripciones USING GIN (texto_tsv);
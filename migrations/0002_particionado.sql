@@ -0,0 +1,50 @@
+-- Pasa la tabla transcripciones a particionado mensual por timestamp_inicio,
+-- con los índices compuestos y BRIN de create_table.sql. Requiere la 0001.
+-- Copia todas las filas, así que conviene correrla en una ventana de baja carga:
+--   psql -f migrations/0002_particionado.sql
+
+BEGIN;
+
+ALTER TABLE transcripciones RENAME TO transcripciones_anterior;
+ALTER TABLE transcripciones_anterior RENAME CONSTRAINT transcripciones_pkey TO transcripciones_anterior_pkey;
+ALTER INDEX transcripciones_texto_tsv_idx RENAME TO transcripciones_anterior_texto_tsv_idx;
+
+CREATE TABLE transcripciones (
+    id BIGSERIAL,
+    fuente TEXT NOT NULL,
+    timestamp_inicio TIMESTAMP NOT NULL,
+    timestamp_fin TIMESTAMP NOT NULL,
+    texto TEXT NOT NULL,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    texto_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('spanish', texto)) STORED,
+    PRIMARY KEY (timestamp_inicio, id)
+) PARTITION BY RANGE (timestamp_inicio);
+
+CREATE TABLE transcripciones_default PARTITION OF transcripciones DEFAULT;
+
+CREATE INDEX transcripciones_fuente_inicio_idx ON transcripciones (fuente, timestamp_inicio, id);
+CREATE INDEX transcripciones_tiempo_brin_idx ON transcripciones USING BRIN (timestamp_inicio, timestamp_fin);
+CREATE INDEX transcripciones_texto_tsv_idx ON transcripciones USING GIN (texto_tsv);
+
+\ir particiones.sql
+
+-- particiones para todo el rango ya cargado y los próximos meses
+WITH rango AS (
+    SELECT date_trunc('month', coalesce(min(timestamp_inicio), now())) AS desde
+    FROM transcripciones_anterior
+)
+SELECT crear_particiones_transcripciones(
+    desde::date,
+    (extract(year FROM age(date_trunc('month', now()), desde)) * 12
+     + extract(month FROM age(date_trunc('month', now()), desde)))::int + 3)
+FROM rango;
+
+INSERT INTO transcripciones (id, fuente, timestamp_inicio, timestamp_fin, texto, creado_en)
+SELECT id, fuente, timestamp_inicio, timestamp_fin, texto, creado_en FROM transcripciones_anterior;
+
+SELECT setval(pg_get_serial_sequence('transcripciones', 'id'),
+              (SELECT coalesce(max(id), 0) + 1 FROM transcripciones_anterior), false);
+
+DROP TABLE transcripciones_anterior;
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- Marcas de tiempo por palabra (WHISPER_TIMESTAMPS=palabras en el
+-- transcriber) para /transcripciones/momentos. Requiere la 0002.
+--
+-- Las columnas nuevas quedan NULL en los bloques existentes (ADD COLUMN sin
+-- default no reescribe la tabla). El índice no se puede crear CONCURRENTLY
+-- sobre una tabla particionada y bloquea los INSERT mientras se construye,
+-- así que conviene correrla en una ventana de baja carga:
+--   psql -f migrations/0003_palabras.sql
+
+BEGIN;
+
+\ir palabras.sql
+-- una base con la 0002 anterior tiene la versión que no movía las columnas nuevas
+\ir particiones.sql
+
+ALTER TABLE transcripciones
+    ADD COLUMN IF NOT EXISTS palabras TEXT[],
+    ADD COLUMN IF NOT EXISTS palabras_ms INT[];
+
+CREATE INDEX IF NOT EXISTS transcripciones_palabras_idx
+    ON transcripciones USING GIN (normalizar_palabras(palabras));
+
+COMMIT;
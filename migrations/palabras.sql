@@ -0,0 +1,13 @@
+-- Normalización de palabras para /transcripciones/momentos: minúsculas y sin
+-- signos de puntuación. La usan el índice GIN sobre `palabras` y las
+-- consultas, así la palabra buscada se compara igual que las guardadas.
+-- Se cargan desde create_table.sql y la migración 0003; cambiar la
+-- normalización requiere REINDEX de transcripciones_palabras_idx.
+
+CREATE OR REPLACE FUNCTION normalizar_palabra(palabra TEXT) RETURNS TEXT AS $$
+    SELECT lower(regexp_replace(palabra, '[[:punct:][:space:]¿¡«»“”‘’…—–]+', '', 'g'))
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION normalizar_palabras(palabras TEXT[]) RETURNS TEXT[] AS $$
+    SELECT array_agg(normalizar_palabra(p) ORDER BY i) FROM unnest(palabras) WITH ORDINALITY AS u(p, i)
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
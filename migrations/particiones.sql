@@ -0,0 +1,77 @@
+-- Funciones de mantenimiento de las particiones mensuales de transcripciones.
+-- Las usa create_table.sql, las migraciones 0002 y 0003 y api/mantenimiento.py.
+-- Las filas se mueven con las columnas que tenga la tabla en ese momento, así
+-- que el mismo archivo sirve con o sin las columnas de la 0003.
+
+-- Crea (si no existe) la partición del mes que contiene `mes`. Si la partición
+-- default ya tiene filas de ese mes, las mueve a la nueva partición.
+CREATE OR REPLACE FUNCTION crear_particion_transcripciones(mes DATE) RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fin DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nombre TEXT := 'transcripciones_' || to_char(inicio, 'YYYY_MM');
+    columnas TEXT;
+BEGIN
+    IF to_regclass(nombre) IS NOT NULL THEN
+        RETURN nombre;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM transcripciones_default
+                   WHERE timestamp_inicio >= inicio AND timestamp_inicio < fin) THEN
+        EXECUTE format('CREATE TABLE %I PARTITION OF transcripciones FOR VALUES FROM (%L) TO (%L)',
+                       nombre, inicio, fin);
+        RETURN nombre;
+    END IF;
+
+    -- todas menos las generadas (texto_tsv se recalcula al insertar)
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columnas
+    FROM pg_attribute
+    WHERE attrelid = 'transcripciones'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    EXECUTE format('CREATE TABLE %I (LIKE transcripciones INCLUDING DEFAULTS INCLUDING GENERATED)', nombre);
+    EXECUTE format(
+        'WITH movidas AS (
+             DELETE FROM transcripciones_default
+             WHERE timestamp_inicio >= %L AND timestamp_inicio < %L
+             RETURNING %s)
+         INSERT INTO %I (%s)
+         SELECT %s FROM movidas',
+        inicio, fin, columnas, nombre, columnas, columnas);
+    EXECUTE format('ALTER TABLE transcripciones ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   nombre, inicio, fin);
+    RETURN nombre;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Crea las particiones de `meses` meses consecutivos a partir de `desde`.
+CREATE OR REPLACE FUNCTION crear_particiones_transcripciones(desde DATE, meses INT) RETURNS SETOF TEXT AS $$
+BEGIN
+    FOR i IN 0 .. meses - 1 LOOP
+        RETURN NEXT crear_particion_transcripciones((desde + make_interval(months => i))::date);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retención: elimina las particiones mensuales que terminan antes de
+-- `meses_retencion` meses atrás (contando desde el mes en curso).
+CREATE OR REPLACE FUNCTION eliminar_particiones_transcripciones(meses_retencion INT) RETURNS SETOF TEXT AS $$
+DECLARE
+    limite DATE := (date_trunc('month', now()) - make_interval(months => meses_retencion))::date;
+    nombre TEXT;
+BEGIN
+    FOR nombre IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'transcripciones'::regclass
+          AND c.relname ~ '^transcripciones_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        IF to_date(right(nombre, 7), 'YYYY_MM') + INTERVAL '1 month' <= limite THEN
+            EXECUTE format('ALTER TABLE transcripciones DETACH PARTITION %I', nombre);
+            EXECUTE format('DROP TABLE %I', nombre);
+            RETURN NEXT nombre;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
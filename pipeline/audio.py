@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import time
+
+import redis.asyncio as aioredis
+from redis.client import NEVER_DECODE
+
+logger = logging.getLogger("audio")
+
+# Transporte de chunks en memoria. Con CHUNK_FORMAT=pcm el chunker no escribe
+# archivos: guarda el audio como PCM 16 kHz mono 16 bits en una clave de Redis
+# y el job lleva la clave (`audio-key`) en vez de `file-path`. El transcriber
+# lo lee sin decodificar nada y el cleaner borra las claves en vez de archivos.
+# Un chunk de 15s ocupa ~480 KB; las claves vencen solas a los
+# CHUNK_AUDIO_TTL_SECONDS por si un job termina en dead letter.
+#
+# El total guardado se limita a CHUNK_AUDIO_MAX_MB: store_audio espera a que
+# el cleaner libere lugar antes de guardar un chunk más. Sin el límite, un
+# backfill de un VOD largo sube cientos de MB en minutos, y si Redis desaloja
+# claves por maxmemory los jobs terminan en dead letter. La cuenta vive en
+# Redis (`<prefijo>index`: clave → vencimiento, `<prefijo>bytes`: clave →
+# tamaño, `<prefijo>total`) y se corrige sola con las claves que vencen.
+
+SAMPLE_RATE = 16000
+AUDIO_KEY_FIELD = "audio-key"
+
+# Guarda el audio si entra en el presupuesto (o si no hay nada guardado, para
+# que un chunk más grande que el límite no trabe todo). Antes descuenta las
+# claves vencidas.
+STORE_AUDIO = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+for _, key in ipairs(expired) do
+    redis.call('DECRBY', KEYS[4], tonumber(redis.call('HGET', KEYS[3], key) or 0))
+    redis.call('HDEL', KEYS[3], key)
+    redis.call('ZREM', KEYS[2], key)
+end
+local total = tonumber(redis.call('GET', KEYS[4]) or 0)
+local size = string.len(ARGV[1])
+local limit = tonumber(ARGV[5])
+if limit > 0 and total > 0 and total + size > limit then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[4], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], size)
+redis.call('INCRBY', KEYS[4], size)
+return 1
+"""
+
+# Borra claves de audio y las descuenta del total.
+DELETE_AUDIO = """
+local deleted = 0
+for i = 4, #KEYS do
+    redis.call('DECRBY', KEYS[3], tonumber(redis.call('HGET', KEYS[2], KEYS[i]) or 0))
+    redis.call('HDEL', KEYS[2], KEYS[i])
+    redis.call('ZREM', KEYS[1], KEYS[i])
+    deleted = deleted + redis.call('DEL', KEYS[i])
+end
+return deleted
+"""
+
+
+def audio_prefix() -> str:
+    return os.getenv("CHUNK_AUDIO_PREFIX", "chunk_audio:")
+
+
+def audio_key(job_id: str) -> str:
+    return audio_prefix() + job_id
+
+
+def _budget_keys() -> list:
+    prefix = audio_prefix()
+    return [prefix + "index", prefix + "bytes", prefix + "total"]
+
+
+async def store_audio(redis: aioredis.Redis, job_id: str, pcm: bytes) -> str:
+    """
+    Guarda el PCM del job. Si el audio guardado llegó a CHUNK_AUDIO_MAX_MB
+    (0 = sin límite) espera a que se libere lugar.
+    """
+    key = audio_key(job_id)
+    ttl = int(os.getenv("CHUNK_AUDIO_TTL_SECONDS", "86400"))
+    limit = int(float(os.getenv("CHUNK_AUDIO_MAX_MB", "512")) * 1024 * 1024)
+    poll_seconds = float(os.getenv("CHUNK_AUDIO_POLL_SECONDS", "1"))
+    index, sizes, total = _budget_keys()
+    store = redis.register_script(STORE_AUDIO)
+    waiting = False
+    while True:
+        now_ms = time.time() * 1000
+        if await store(keys=[key, index, sizes, total], args=[pcm, ttl, now_ms, now_ms + ttl * 1000, limit]):
+            break
+        if not waiting:
+            logger.warning(f"Audio en Redis en el límite de CHUNK_AUDIO_MAX_MB, esperando lugar para '{key}'")
+            waiting = True
+        await asyncio.sleep(poll_seconds)
+    return key
+
+
+async def load_job_audio(redis: aioredis.Redis, job: dict):
+    """
+    Audio de un job: la ruta del archivo, o el PCM guardado en Redis. Anda
+    también con clientes con decode_responses (el PCM se lee sin decodificar).
+    """
+    if not job.get(AUDIO_KEY_FIELD):
+        return job['file-path']
+    pcm = await redis.execute_command("GET", job[AUDIO_KEY_FIELD], **{NEVER_DECODE: True})
+    if pcm is None:
+        raise FileNotFoundError(f"El audio '{job[AUDIO_KEY_FIELD]}' ya no está en Redis")
+    return pcm
+
+
+async def delete_audio(redis: aioredis.Redis, keys: list) -> int:
+    if not keys:
+        return 0
+    return await redis.register_script(DELETE_AUDIO)(keys=_budget_keys() + list(keys))
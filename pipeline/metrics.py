@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import os
+
+import redis.asyncio as aioredis
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger("metrics")
+
+# Métricas compartidas por el chunker, el transcriber y el cleaner, en formato
+# Prometheus. Cada proceso las expone en su propio puerto (METRICS_PORT).
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Duración de cada etapa del pipeline", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+)
+AUDIO_SECONDS = Counter(
+    "pipeline_audio_seconds_total", "Segundos de audio procesados", ["stage"]
+)
+REAL_TIME_FACTOR = Gauge(
+    "transcriber_real_time_factor", "Segundos de inferencia por segundo de audio del último job o batch", ["worker"]
+)
+TRANSCRIPT_CACHE = Counter(
+    "transcriber_cache_total", "Consultas al cache de transcripciones por resultado (exacto, similar, miss)",
+    ["resultado"]
+)
+JOBS = Counter(
+    "pipeline_jobs_total", "Jobs procesados por stream y resultado (ok, retry, dead_letter, reclaimed)",
+    ["stream", "resultado"]
+)
+QUEUE_DEPTH = Gauge(
+    "pipeline_queue_depth", "Jobs por stream: en el stream, pendientes de confirmar y con reintento diferido",
+    ["stream", "estado"]
+)
+SUPERVISED_TRANSCRIBERS = Gauge(
+    "supervisor_transcribers", "Procesos transcriber del supervisor: activos y drenando jobs en curso", ["estado"]
+)
+
+
+def start_metrics_server(default_port: int, env_var: str = "METRICS_PORT") -> bool:
+    """
+    Expone /metrics en el puerto de `env_var` (o `default_port`). Con 0 no se expone nada.
+    """
+    port = int(os.getenv(env_var, str(default_port)))
+    if not port:
+        return False
+    start_http_server(port)
+    logger.info(f"Métricas en http://0.0.0.0:{port}/metrics")
+    return True
+
+
+def queue_streams_from_env() -> list:
+    """
+    Todos los streams configurados con variables REDIS_QUEUE_*.
+    """
+    return sorted({value for key, value in os.environ.items() if key.startswith("REDIS_QUEUE_") and value})
+
+
+async def update_queue_depths(redis: aioredis.Redis, streams: list):
+    for stream in streams:
+        await update_stream_depth(redis, stream)
+        # sub-colas por fuente del scheduler (pipeline/scheduler.py): `<stream>:<media>`
+        for media in await redis.hkeys(f"{stream}:fuentes"):
+            await update_stream_depth(redis, f"{stream}:{media}")
+
+
+async def update_stream_depth(redis: aioredis.Redis, stream: str):
+    QUEUE_DEPTH.labels(stream, "en_stream").set(await redis.xlen(stream))
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except ResponseError:
+        # el stream todavía no existe
+        groups = []
+    QUEUE_DEPTH.labels(stream, "pendientes").set(sum(group["pending"] for group in groups))
+    QUEUE_DEPTH.labels(stream, "diferidos").set(await redis.zcard(f"{stream}:retry"))
+
+
+async def watch_queue_depths(redis: aioredis.Redis, streams: list = None, interval: float = None):
+    """
+    Tarea que actualiza QUEUE_DEPTH periódicamente; cancelarla al terminar el proceso.
+    """
+    streams = streams or queue_streams_from_env()
+    interval = interval or float(os.getenv("METRICS_QUEUE_INTERVAL_SECONDS", "15"))
+    while True:
+        try:
+            await update_queue_depths(redis, streams)
+        except Exception as e:
+            logger.error(f"No se pudo medir la profundidad de las colas: {e}")
+        await asyncio.sleep(interval)
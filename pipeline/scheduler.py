@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import redis.asyncio as aioredis
+
+from pipeline.streams import JOB_FIELD, add_job, stream_queue_from_env
+
+logger = logging.getLogger("scheduler")
+
+# Scheduling por fuente (TRANSCRIPTION_SCHEDULING=fuentes). En vez de un único
+# stream FIFO, cada media tiene su sub-cola `<stream>:<media>` y un registro
+# en el hash `<stream>:fuentes` con su configuración:
+#
+# - prioridad: las fuentes "vivo" se atienden antes que las "diferido"
+#   (backfills de VODs), que usan la capacidad que sobra;
+# - peso: dentro de una misma prioridad las fuentes se turnan con deficit
+#   round-robin, cada una recibe jobs en proporción a su peso;
+# - max_concurrencia: tope de jobs de la fuente en proceso a la vez en todos
+#   los workers (los pendientes del consumer group; 0 = sin tope).
+#
+# El chunker registra la fuente al empezar y la marca terminada al final; el
+# transcriber consume con FairQueue, que tiene la misma interfaz que
+# StreamQueue.
+
+PRIORIDADES = ("vivo", "diferido")
+SOURCES_SUFFIX = ":fuentes"
+
+# Da de baja una fuente terminada cuya sub-cola quedó vacía. Es un script
+# para que no se pierda un registro nuevo de la misma fuente hecho entre la
+# verificación y el HDEL.
+UNREGISTER_FINISHED = """
+local config = redis.call('HGET', KEYS[1], ARGV[1])
+if not config or not string.find(config, '"terminado":true', 1, true) then
+    return 0
+end
+if redis.call('XLEN', KEYS[2]) > 0 or redis.call('ZCARD', KEYS[3]) > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def scheduling_from_env() -> str:
+    scheduling = os.getenv("TRANSCRIPTION_SCHEDULING", "fifo")
+    if scheduling not in ("fifo", "fuentes"):
+        raise ValueError(f"TRANSCRIPTION_SCHEDULING desconocido: {scheduling}")
+    return scheduling
+
+
+def source_stream(stream: str, media: str) -> str:
+    return f"{stream}:{media}"
+
+
+async def register_source(redis: aioredis.Redis, stream: str, media: str, prioridad: str,
+                          peso: float = 1, max_concurrencia: int = 0):
+    if prioridad not in PRIORIDADES:
+        raise ValueError(f"Prioridad desconocida: {prioridad}")
+    config = {"prioridad": prioridad, "peso": peso, "max_concurrencia": max_concurrencia, "terminado": False}
+    await redis.hset(stream + SOURCES_SUFFIX, media, json.dumps(config, separators=(",", ":")))
+    logger.info(f"Fuente '{media}' registrada en '{stream}': {config}")
+
+
+async def finish_source(redis: aioredis.Redis, stream: str, media: str):
+    """
+    Marca la fuente como terminada: el scheduler la da de baja cuando se vacía.
+    """
+    config = await redis.hget(stream + SOURCES_SUFFIX, media)
+    if config is None:
+        return
+    config = json.loads(config)
+    config["terminado"] = True
+    await redis.hset(stream + SOURCES_SUFFIX, media, json.dumps(config, separators=(",", ":")))
+
+
+async def add_source_job(redis: aioredis.Redis, stream: str, job: dict, maxlen: int = None) -> str:
+    return await add_job(redis, source_stream(stream, job["media"]), job, maxlen)
+
+
+class FairQueue:
+    """
+    Cola de jobs repartida en sub-colas por fuente (ver arriba). Se usa igual
+    que StreamQueue: los message_id que devuelve read llevan la fuente
+    (`<media>|<id>`) y ack, move, retry y keep_alive los derivan a su sub-cola.
+    """
+
+    def __init__(self, redis: aioredis.Redis, stream: str, group: str, queue_factory,
+                 refresh_seconds: float = 5):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.queue_factory = queue_factory
+        self.refresh_seconds = refresh_seconds
+        self.consumer = queue_factory(stream).consumer
+        self.sources = {}
+        self.queues = {}
+        self.deficit = {}
+        self._turn = {prioridad: 0 for prioridad in PRIORIDADES}
+        self._next_refresh = 0.0
+        # jobs que el XREADGROUP bloqueante entregó de más: salen en el próximo read
+        self._ready = []
+        self._unregister = redis.register_script(UNREGISTER_FINISHED)
+
+    async def ensure_group(self):
+        await self.refresh(force=True)
+
+    async def refresh(self, force: bool = False):
+        """
+        Relee el registro de fuentes: crea las sub-colas nuevas y da de baja
+        las terminadas que ya se vaciaron. Como mucho cada `refresh_seconds`.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        self._next_refresh = now + self.refresh_seconds
+        registry = await self.redis.hgetall(self.stream + SOURCES_SUFFIX)
+        for media, config in registry.items():
+            config = json.loads(config)
+            if media not in self.queues:
+                queue = self.queue_factory(source_stream(self.stream, media))
+                await queue.ensure_group()
+                self.queues[media] = queue
+                self.deficit[media] = 0.0
+            if config.get("terminado"):
+                queue = self.queues[media]
+                if await self._unregister(keys=[self.stream + SOURCES_SUFFIX, queue.stream, queue.delayed_key],
+                                          args=[media]):
+                    logger.info(f"Fuente '{media}' terminada y sin jobs, dada de baja")
+                    registry[media] = None
+            self.sources[media] = config
+        for media in [media for media in self.sources if registry.get(media) is None]:
+            del self.sources[media]
+            del self.queues[media]
+            del self.deficit[media]
+
+    async def free_slots(self, media: str) -> float:
+        """
+        Jobs que la fuente todavía puede tener en proceso (aproximado: dos
+        workers pueden ver el mismo lugar libre a la vez). Los pendientes que
+        superaron el timeout de visibilidad no cuentan: son de un consumidor
+        caído y reclaim los va a recuperar.
+        """
+        cap = self.sources[media].get("max_concurrencia") or 0
+        if not cap:
+            return float("inf")
+        queue = self.queues[media]
+        busy = (await self.redis.xpending(queue.stream, self.group))["pending"]
+        if busy >= cap:
+            pending = await self.redis.xpending_range(queue.stream, self.group, min="-", max="+", count=busy)
+            busy = sum(1 for entry in pending if entry["time_since_delivered"] < queue.visibility_timeout_ms)
+        return max(0, cap - busy)
+
+    async def _read_class(self, prioridad: str, count: int) -> list:
+        """
+        Deficit round-robin entre las fuentes de una prioridad: al llegar el
+        turno de una fuente suma su peso al déficit y entrega jobs mientras le
+        quede déficit; una fuente vacía o en su tope pierde el déficit y pasa
+        el turno. Una fuente en su tope igual recupera los jobs de consumidores
+        caídos: el claim cambia el dueño sin sumar pendientes.
+        """
+        medias = sorted(media for media, config in self.sources.items() if config["prioridad"] == prioridad)
+        messages = []
+        idle = set()
+        while medias and len(messages) < count and len(idle) < len(medias):
+            media = medias[self._turn[prioridad] % len(medias)]
+            if media in idle:
+                self._turn[prioridad] += 1
+                continue
+            if self.deficit[media] < 1:
+                self.deficit[media] += float(self.sources[media].get("peso", 1))
+                if self.deficit[media] < 1:
+                    self._turn[prioridad] += 1
+                    continue
+            wanted = min(count - len(messages), int(self.deficit[media]), await self.free_slots(media))
+            if wanted:
+                got = await self.queues[media].read(count=wanted, block_ms=None)
+            else:
+                got = await self.queues[media].reclaim(min(count - len(messages), int(self.deficit[media])))
+            if not got:
+                idle.add(media)
+                self.deficit[media] = 0.0
+                self._turn[prioridad] += 1
+                continue
+            self.deficit[media] -= len(got)
+            messages += [(f"{media}|{message_id}", job) for message_id, job in got]
+            if self.deficit[media] < 1:
+                self._turn[prioridad] += 1
+        return messages
+
+    async def read(self, count: int = 1, block_ms: int = 5000) -> list:
+        """
+        Hasta `count` jobs, primero de las fuentes en vivo y después de las
+        diferidas. Si no hay nada, bloquea hasta `block_ms` sobre todas las
+        sub-colas que no están en su tope (o duerme `block_ms` si no hay
+        ninguna).
+        """
+        await self.refresh()
+        messages, self._ready = self._ready[:count], self._ready[count:]
+        for prioridad in PRIORIDADES:
+            if len(messages) >= count:
+                break
+            messages += await self._read_class(prioridad, count - len(messages))
+        if messages or block_ms is None:
+            return messages
+
+        streams = {self.queues[media].stream: media for media in self.queues if await self.free_slots(media)}
+        if not streams:
+            await asyncio.sleep(block_ms / 1000)
+            await self.refresh(force=True)
+            return []
+        # uno por sub-cola (solo las que tienen lugar), así ninguna pasa su
+        # tope; lo que exceda `count` ya quedó pendiente de este consumidor
+        response = await self.redis.xreadgroup(self.group, self.consumer, {stream: ">" for stream in streams},
+                                               count=1, block=block_ms)
+        for stream, entries in response or []:
+            for message_id, fields in entries:
+                messages.append((f"{streams[stream]}|{message_id}", json.loads(fields[JOB_FIELD])))
+        self._ready = messages[count:]
+        return messages[:count]
+
+    def _route(self, message_id: str):
+        media, _, source_id = message_id.rpartition("|")
+        return self.queues[media], source_id
+
+    async def touch(self, message_ids: list):
+        by_queue = {}
+        for message_id in message_ids:
+            queue, source_id = self._route(message_id)
+            by_queue.setdefault(queue, []).append(source_id)
+        for queue, source_ids in by_queue.items():
+            await queue.touch(source_ids)
+
+    async def keep_alive(self, message_ids: list):
+        queue, _ = self._route(message_ids[0])
+        while True:
+            await asyncio.sleep(queue.visibility_timeout_ms / 3000)
+            await self.touch(message_ids)
+
+    async def remove_consumer(self) -> bool:
+        removed = [await queue.remove_consumer() for queue in self.queues.values()]
+        return all(removed)
+
+    async def ack(self, message_id: str):
+        queue, source_id = self._route(message_id)
+        await queue.ack(source_id)
+
+    async def move(self, message_id: str, job: dict, target_stream: str, target_maxlen: int = None):
+        queue, source_id = self._route(message_id)
+        await queue.move(source_id, job, target_stream, target_maxlen)
+
+    async def move_many(self, items: list, target_stream: str, target_maxlen: int = None):
+        by_queue = {}
+        for message_id, job in items:
+            queue, source_id = self._route(message_id)
+            by_queue.setdefault(queue, []).append((source_id, job))
+        for queue, queue_items in by_queue.items():
+            await queue.move_many(queue_items, target_stream, target_maxlen)
+
+    async def retry(self, message_id: str, job: dict, error: Exception):
+        queue, source_id = self._route(message_id)
+        await queue.retry(source_id, job, error)
+
+    async def dead_letter(self, message_id: str, job: dict, reason: str):
+        queue, source_id = self._route(message_id)
+        await queue.dead_letter(source_id, job, reason)
+
+
+def fair_queue_from_env(redis: aioredis.Redis, stream: str, group: str, name: str) -> FairQueue:
+    return FairQueue(redis, stream, group, lambda sub_stream: stream_queue_from_env(redis, sub_stream, group, name),
+                     refresh_seconds=float(os.getenv("SCHEDULER_REFRESH_SECONDS", "5")))
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from pipeline.metrics import JOBS
+
+logger = logging.getLogger("streams")
+
+# Campo del stream donde viaja el job serializado
+JOB_FIELD = "job"
+
+# Pasa al stream los jobs diferidos cuyo momento de reintento ya llegó. Es un
+# script para que ZREM + XADD sean atómicos aunque haya varios consumidores.
+PROMOTE_DELAYED = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], '*', ARGV[3], job)
+end
+return #due
+"""
+
+
+def consumer_name(name: str) -> str:
+    """
+    Nombre único del consumidor dentro del consumer group: permite correr
+    workers con el mismo nombre en varios hosts/procesos.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}-{name}"
+
+
+async def add_job(redis: aioredis.Redis, stream: str, job: dict, maxlen: int = None) -> str:
+    """
+    Agrega un job al final del stream. Con maxlen se recorta (aproximado) el
+    stream para que no crezca sin límite.
+    """
+    return await redis.xadd(stream, {JOB_FIELD: json.dumps(job)}, maxlen=maxlen, approximate=True)
+
+
+class StreamQueue:
+    """
+    Cola de jobs sobre un Redis Stream con consumer group.
+
+    - read: entrega jobs nuevos (XREADGROUP) y, cada tanto, recupera los que
+      quedaron pendientes más de `visibility_timeout_ms` en otro consumidor
+      caído (XAUTOCLAIM).
+    - ack / move: confirman el job (XACK + XDEL), opcionalmente pasándolo a
+      otro stream en la misma transacción.
+    - retry: lo vuelve a encolar con `attempts` + 1; pasados `max_attempts`
+      va al stream de dead letter. Con `retry_backoff_ms` el reintento se
+      difiere en un sorted set (`<stream>:retry`) con backoff exponencial, y
+      read lo devuelve al stream cuando se cumple el plazo.
+    """
+
+    def __init__(self, redis: aioredis.Redis, stream: str, group: str, consumer: str,
+                 visibility_timeout_ms: int = 300000, max_attempts: int = 5,
+                 dead_letter_stream: str = None, maxlen: int = None,
+                 retry_backoff_ms: int = 0, retry_backoff_max_ms: int = 300000):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.visibility_timeout_ms = visibility_timeout_ms
+        self.max_attempts = max_attempts
+        self.dead_letter_stream = dead_letter_stream
+        self.maxlen = maxlen
+        self.retry_backoff_ms = retry_backoff_ms
+        self.retry_backoff_max_ms = retry_backoff_max_ms
+        self.delayed_key = f"{stream}:retry"
+        self._promote_delayed = redis.register_script(PROMOTE_DELAYED)
+        self._next_promote = 0.0
+        self._claim_cursor = "0-0"
+        self._next_reclaim = 0.0
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"Consumer group '{self.group}' creado en '{self.stream}'")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def add(self, job: dict) -> str:
+        return await add_job(self.redis, self.stream, job, self.maxlen)
+
+    async def read(self, count: int = 1, block_ms: int = 5000) -> list:
+        """
+        Devuelve hasta `count` jobs como lista de (message_id, job).
+        Bloquea como mucho `block_ms` (None = no bloquea) si no hay nada.
+        """
+        if self.retry_backoff_ms:
+            await self.promote_delayed()
+        reclaimed = await self.reclaim(count)
+        if reclaimed:
+            return reclaimed
+        response = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                               count=count, block=block_ms)
+        messages = []
+        for _, entries in response or []:
+            for message_id, fields in entries:
+                messages.append((message_id, json.loads(fields[JOB_FIELD])))
+        return messages
+
+    async def promote_delayed(self, limit: int = 100) -> int:
+        """
+        Devuelve al stream los reintentos diferidos que ya vencieron.
+        Se consulta como mucho una vez por segundo.
+        """
+        now = time.monotonic()
+        if now < self._next_promote:
+            return 0
+        self._next_promote = now + 1
+        promoted = await self._promote_delayed(keys=[self.delayed_key, self.stream],
+                                               args=[time.time() * 1000, limit, JOB_FIELD])
+        if promoted:
+            logger.info(f"{promoted} reintentos diferidos devueltos a '{self.stream}'")
+        return promoted
+
+    async def reclaim(self, count: int) -> list:
+        """
+        Toma los jobs pendientes de otros consumidores que superaron el
+        timeout de visibilidad. Se consulta como mucho cada cuarto del timeout.
+        """
+        now = time.monotonic()
+        if now < self._next_reclaim:
+            return []
+        response = await self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                               min_idle_time=self.visibility_timeout_ms,
+                                               start_id=self._claim_cursor, count=count)
+        self._claim_cursor = response[0]
+        if self._claim_cursor == "0-0":
+            # se recorrió toda la lista de pendientes; próxima revisión más tarde
+            self._next_reclaim = now + self.visibility_timeout_ms / 4000
+
+        messages = []
+        for message_id, fields in response[1]:
+            if not fields:
+                # la entrada se borró del stream pero seguía pendiente
+                await self.redis.xack(self.stream, self.group, message_id)
+                continue
+            job = json.loads(fields[JOB_FIELD])
+            pending = await self.redis.xpending_range(self.stream, self.group, min=message_id, max=message_id,
+                                                      count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            logger.warning(f"Job {message_id} recuperado de '{self.stream}' tras superar el timeout de visibilidad "
+                           f"(entrega #{deliveries})")
+            JOBS.labels(self.stream, "reclaimed").inc()
+            if deliveries > self.max_attempts:
+                await self.dead_letter(message_id, job, "superó el máximo de entregas")
+                continue
+            messages.append((message_id, job))
+        return messages
+
+    async def touch(self, message_ids: list):
+        """
+        Reinicia el tiempo ocioso de jobs que siguen en proceso para que
+        otro consumidor no los recupere.
+        """
+        if message_ids:
+            await self.redis.xclaim(self.stream, self.group, self.consumer, min_idle_time=0,
+                                    message_ids=message_ids, justid=True)
+
+    async def keep_alive(self, message_ids: list):
+        """
+        Tarea que llama a touch periódicamente; cancelarla al terminar el proceso.
+        """
+        while True:
+            await asyncio.sleep(self.visibility_timeout_ms / 3000)
+            await self.touch(message_ids)
+
+    async def remove_consumer(self) -> bool:
+        """
+        Borra el consumidor del group si no tiene jobs pendientes (al salir
+        un worker), para que los procesos que van y vienen no se acumulen.
+        """
+        pending = await self.redis.xpending_range(self.stream, self.group, min="-", max="+", count=1,
+                                                  consumername=self.consumer)
+        if pending:
+            return False
+        await self.redis.xgroup_delconsumer(self.stream, self.group, self.consumer)
+        return True
+
+    async def ack(self, message_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.xdel(self.stream, message_id)
+            await pipe.execute()
+
+    async def move(self, message_id: str, job: dict, target_stream: str, target_maxlen: int = None):
+        """
+        Confirma el job y lo agrega a `target_stream` en una sola transacción.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(target_stream, {JOB_FIELD: json.dumps(job)}, maxlen=target_maxlen, approximate=True)
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.xdel(self.stream, message_id)
+            await pipe.execute()
+
+    async def move_many(self, items: list, target_stream: str, target_maxlen: int = None):
+        """
+        Como move, para una lista de (message_id, job), en una sola transacción.
+        """
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for _, job in items:
+                pipe.xadd(target_stream, {JOB_FIELD: json.dumps(job)}, maxlen=target_maxlen, approximate=True)
+            message_ids = [message_id for message_id, _ in items]
+            pipe.xack(self.stream, self.group, *message_ids)
+            pipe.xdel(self.stream, *message_ids)
+            await pipe.execute()
+
+    def retry_delay_ms(self, attempts: int) -> int:
+        return min(self.retry_backoff_ms * 2 ** (attempts - 1), self.retry_backoff_max_ms)
+
+    async def retry(self, message_id: str, job: dict, error: Exception):
+        attempts = job.get('attempts', 0) + 1
+        job['attempts'] = attempts
+        job['last_error'] = str(error)
+        if attempts >= self.max_attempts:
+            await self.dead_letter(message_id, job, str(error))
+            return
+        JOBS.labels(self.stream, "retry").inc()
+        if self.retry_backoff_ms:
+            delay_ms = self.retry_delay_ms(attempts)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(self.delayed_key, {json.dumps(job): time.time() * 1000 + delay_ms})
+                pipe.xack(self.stream, self.group, message_id)
+                pipe.xdel(self.stream, message_id)
+                await pipe.execute()
+            logger.error(f"[{self.consumer}] Error procesando {job}, reintento #{attempts} en {delay_ms}ms: {error}")
+            return
+        await self.move(message_id, job, self.stream, self.maxlen)
+        logger.error(f"[{self.consumer}] Error procesando {job}, reintento #{attempts}: {error}")
+
+    async def dead_letter(self, message_id: str, job: dict, reason: str):
+        job['dead_letter_reason'] = reason
+        JOBS.labels(self.stream, "dead_letter").inc()
+        if self.dead_letter_stream:
+            await self.move(message_id, job, self.dead_letter_stream)
+        else:
+            await self.ack(message_id)
+        logger.error(f"Job {message_id} descartado a '{self.dead_letter_stream}': {reason} ({job})")
+
+
+def stream_queue_from_env(redis: aioredis.Redis, stream: str, group: str, name: str) -> StreamQueue:
+    return StreamQueue(
+        redis,
+        stream,
+        group,
+        consumer_name(name),
+        visibility_timeout_ms=int(os.getenv("REDIS_VISIBILITY_TIMEOUT_MS", "300000")),
+        max_attempts=int(os.getenv("REDIS_MAX_ATTEMPTS", "5")),
+        dead_letter_stream=os.getenv("REDIS_QUEUE_DEAD_LETTER"),
+        retry_backoff_ms=int(os.getenv("REDIS_RETRY_BACKOFF_MS", "0")),
+        retry_backoff_max_ms=int(os.getenv("REDIS_RETRY_BACKOFF_MAX_MS", "300000")),
+    )
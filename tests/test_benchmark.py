@@ -0,0 +1,53 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("httpx")
+
+RUTA = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench_pipeline.py")
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("bench_pipeline", RUTA)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.mark.parametrize("etapa", ["transcriber", "cleaner"])
+def test_etapa(bench, etapa):
+    args = bench.parse_args(["--jobs", "6", "--workers", "2", "--procesos", "1", "--rtf", "0.001",
+                             "--chunk-segundos", "1", "--timeout", "30"])
+    resultado = bench.correr_etapa(etapa, args)
+    assert resultado["items"] == 6
+    assert resultado["p50_ms"] <= resultado["p99_ms"]
+
+
+def test_transcriber_pcm(bench):
+    args = bench.parse_args(["--jobs", "4", "--workers", "2", "--procesos", "1", "--rtf", "0.001",
+                             "--chunk-segundos", "1", "--timeout", "30", "--formato", "pcm", "--batch", "2"])
+    assert bench.correr_etapa("transcriber", args)["items"] == 4
+
+
+def test_comparar(bench):
+    base = {"cleaner": {"items_por_segundo": 100.0, "p99_ms": 10.0}}
+    assert bench.comparar({"cleaner": {"items_por_segundo": 95.0, "p99_ms": 11.0}}, base, 0.2) == []
+    assert len(bench.comparar({"cleaner": {"items_por_segundo": 50.0, "p99_ms": 20.0}}, base, 0.2)) == 2
+
+
+def test_serializacion_equivalente():
+    pytest.importorskip("fastapi")
+    spec = importlib.util.spec_from_file_location(
+        "bench_serializacion", os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench_serializacion.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+
+    filas = modulo.generar_filas(20)
+    esperado = json.loads(modulo.con_jsonable_encoder(filas))
+    for funcion in modulo.METODOS.values():
+        assert json.loads(funcion(filas)) == esperado
+    assert set(modulo.main(["--filas", "20", "--repeticiones", "2"])) == set(modulo.METODOS)
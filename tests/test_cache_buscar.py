@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from cache import CacheBusquedas, clave_busqueda
+
+
+def bloque(fuente: str, inicio: str, fin: str):
+    return SimpleNamespace(fuente=fuente, timestamp_inicio=datetime.fromisoformat(inicio),
+                           timestamp_fin=datetime.fromisoformat(fin))
+
+
+def test_clave_normalizada():
+    assert clave_busqueda("Radio", texto="  Economía   Dólar ", campos="texto,id,texto") == \
+        clave_busqueda("Radio", texto="economía dólar", campos="id,texto")
+    # sin texto, modo/orden/resaltar no cambian la consulta
+    assert clave_busqueda("Radio", modo="frase", orden="relevancia", resaltar=True) == clave_busqueda("Radio")
+    assert clave_busqueda(desde="2025-05-13T10:00:00Z") == clave_busqueda(desde="2025-05-13T10:00:00+00:00")
+    assert clave_busqueda("Radio", limite=10) != clave_busqueda("Radio", limite=20)
+
+
+def test_invalidacion_por_fuente_y_rango():
+    cache = CacheBusquedas()
+    mayo = clave_busqueda("Radio", desde="2025-05-13T00:00:00", hasta="2025-05-14T00:00:00")
+    junio = clave_busqueda("Radio", desde="2025-06-01T00:00:00")
+    otra = clave_busqueda("Otra")
+    todas = clave_busqueda(texto="dólar")
+    for clave in (mayo, junio, otra, todas):
+        cache.guardar(clave, [clave])
+
+    assert cache.invalidar_bloques([bloque("Radio", "2025-05-13T10:00:00", "2025-05-13T10:00:15")]) == 2
+    assert cache.buscar(mayo) is None
+    assert cache.buscar(todas) is None
+    assert cache.buscar(junio) == [junio]
+    assert cache.buscar(otra) == [otra]
+    assert cache.stats == {"hit": 2, "miss": 2, "invalidado": 2}
+
+
+def test_fechas_con_zona_como_en_postgres():
+    # la columna es TIMESTAMP: Postgres descarta la zona sin convertir
+    cache = CacheBusquedas()
+    clave = clave_busqueda("Radio", desde="2025-05-13T10:00:00-03:00", hasta="2025-05-13T12:00:00-03:00")
+    assert clave == clave_busqueda("Radio", desde="2025-05-13T10:00:00", hasta="2025-05-13T12:00:00")
+    cache.guardar(clave, [])
+    assert cache.invalidar_bloques([bloque("Radio", "2025-05-13T11:00:00", "2025-05-13T11:00:15")]) == 1
+
+
+def test_no_guarda_resultados_de_antes_de_un_insert():
+    cache = CacheBusquedas()
+    clave = clave_busqueda("Radio")
+    generacion = cache.generacion
+    cache.invalidar("Radio", datetime(2025, 5, 13), datetime(2025, 5, 13))
+    cache.guardar(clave, [], generacion)
+    assert cache.buscar(clave) is None
+
+
+def test_lru_y_ttl():
+    cache = CacheBusquedas(max_entradas=2, ttl_segundos=60)
+    a, b, c, d = (clave_busqueda(fuente) for fuente in "abcd")
+    cache.guardar(a, 1)
+    cache.guardar(b, 2)
+    cache.buscar(a)
+    cache.guardar(c, 3)
+    assert (cache.buscar(a), cache.buscar(b), cache.buscar(c)) == (1, None, 3)
+
+    cache.ttl_segundos = 0.01
+    cache.guardar(d, 4)
+    time.sleep(0.02)
+    assert cache.buscar(d) is None
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "transcriber"))
+
+from fingerprint import TranscriptCache
+
+
+def audio(seed: int, segundos: int = 15) -> "np.ndarray":
+    n = 16000 * segundos
+    rng = np.random.default_rng(seed)
+    envolvente = 1 + np.sin(np.arange(n) / 3000 * (seed + 1))
+    return (rng.standard_normal(n) * 0.1 * envolvente).astype(np.float32)
+
+
+def test_exacto_y_similar():
+    cache = TranscriptCache(max_entries=10)
+    original = audio(1)
+    texto, acierto, clave, huella = cache.lookup(original)
+    assert (texto, acierto) == (None, "miss")
+    cache.store(clave, huella, "jingle")
+
+    assert cache.lookup(original)[:2] == ("jingle", "exacto")
+    # otro volumen y un poco de ruido: misma huella salvo algunos bits
+    recodificado = original * 0.7 + np.random.default_rng(99).standard_normal(len(original)).astype(np.float32) * 0.01
+    assert cache.lookup(recodificado)[:2] == ("jingle", "similar")
+    assert cache.lookup(audio(2))[:2] == (None, "miss")
+    assert cache.hit_rate() == 0.5
+
+
+def test_lru_y_ttl():
+    cache = TranscriptCache(max_entries=2, ttl_seconds=60)
+    for seed in (1, 2, 3):
+        _, _, clave, huella = cache.lookup(audio(seed, 2))
+        cache.store(clave, huella, str(seed))
+    assert cache.lookup(audio(1, 2))[1] == "miss"
+    assert cache.lookup(audio(3, 2))[1] == "exacto"
+
+    cache.ttl_seconds = 0
+    _, _, clave, huella = cache.lookup(audio(4, 2))
+    cache.store(clave, huella, "4")
+    assert cache.lookup(audio(4, 2))[1] == "miss"
+
+
+def test_similar_corrido_o_de_otro_largo():
+    cache = TranscriptCache(max_entries=10)
+    original = audio(1)
+    _, _, clave, huella = cache.lookup(original)
+    cache.store(clave, huella, "publicidad")
+    for seed in (2, 3):
+        _, _, clave, huella = cache.lookup(audio(seed))
+        cache.store(clave, huella, str(seed))
+
+    # el corte cayó 0,31s más tarde (no coincide con los frames guardados)
+    corrido = original[int(16000 * 0.31):]
+    assert cache.lookup(corrido)[:2] == ("publicidad", "similar")
+    # un chunk del VAD un poco más largo: 0,8s de otro audio al final
+    mas_largo = np.concatenate([original, audio(7, 1)[:int(16000 * 0.8)]])
+    assert cache.lookup(mas_largo)[:2] == ("publicidad", "similar")
+    # un tercio del audio no alcanza para reutilizar el texto
+    assert cache.lookup(original[:16000 * 5])[1] == "miss"
@@ -0,0 +1,204 @@
+import datetime
+import importlib.util
+import json
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+requests = pytest.importorskip("requests")
+pytest.importorskip("whisper")
+pytest.importorskip("yt_dlp")
+
+RUTA = os.path.join(os.path.dirname(__file__), "youtube-live-transcriber.py")
+
+
+@pytest.fixture(scope="module")
+def live():
+    spec = importlib.util.spec_from_file_location("youtube_live_transcriber", RUTA)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def test_ring_buffer_da_la_vuelta(live):
+    buffer = live.RingBuffer(10)
+    buffer.escribir(b"abcdefgh")
+    assert buffer.leer(6) == (0, b"abcdef")
+    buffer.escribir(b"ijklmn")  # pasa el final del buffer interno
+    assert buffer.leer(8) == (6, b"ghijklmn")
+    assert buffer.perdidos == 0
+
+
+def test_ring_buffer_pisa_lo_mas_viejo(live):
+    buffer = live.RingBuffer(10)
+    buffer.escribir(b"0123456789")
+    buffer.escribir(b"abcd")
+    assert buffer.perdidos == 4
+    assert buffer.leer(10) == (4, b"456789abcd")
+    buffer.escribir(b"x" * 13)  # más grande que el buffer entero
+    assert buffer.perdidos == 7
+    assert buffer.leer(10) == (17, b"x" * 10)
+
+
+def test_ring_buffer_cerrado(live):
+    buffer = live.RingBuffer(10)
+    buffer.escribir(b"abc")
+    resultado = []
+    lector = threading.Thread(target=lambda: resultado.append(buffer.leer(5)))
+    lector.start()
+    buffer.cerrar()
+    lector.join(timeout=5)
+    assert resultado == [(0, b"abc")]
+    assert buffer.leer(5) is None
+    with pytest.raises(ValueError):
+        buffer.leer(11)
+
+
+def test_ring_buffer_marcas(live):
+    buffer = live.RingBuffer(100, bytes_por_segundo=10)
+    inicio = datetime.datetime(2025, 5, 13, 10, 0, 0)
+    buffer.marcar(inicio)
+    buffer.escribir(b"a" * 20)
+    # ffmpeg se reconectó 30s después: los bytes siguientes se anclan de nuevo
+    buffer.marcar(inicio + datetime.timedelta(seconds=32))
+    buffer.escribir(b"b" * 20)
+    offset, _ = buffer.leer(10)
+    assert buffer.momento(offset) == inicio
+    offset, _ = buffer.leer(10)
+    assert buffer.momento(offset) == inicio + datetime.timedelta(seconds=1)
+    offset, _ = buffer.leer(15)
+    assert buffer.momento(offset) == inicio + datetime.timedelta(seconds=32)
+    assert buffer.momento(offset + 10) == inicio + datetime.timedelta(seconds=33)
+
+
+class FakeSession:
+    """
+    Sesión HTTP falsa: guarda cada lote y la API rechaza los bloques sin texto.
+    `fallas` son excepciones a lanzar en los primeros envíos; un lote con un
+    bloque de texto "rompe" falla entero con un 500, como un COPY que no pasa.
+    """
+    def __init__(self, fallas=()):
+        self.lotes = []
+        self.fallas = list(fallas)
+
+    def post(self, url, json, timeout):
+        if self.fallas:
+            raise self.fallas.pop(0)
+        self.lotes.append(json)
+        if any(bloque.get("texto") == "rompe" for bloque in json):
+            return FakeRespuesta({"detail": "error"}, status_code=500)
+        items = [{"index": i, "ok": bool(bloque.get("texto"))} for i, bloque in enumerate(json)]
+        return FakeRespuesta({"ok": all(item["ok"] for item in items), "items": items})
+
+
+class FakeRespuesta:
+    def __init__(self, cuerpo, status_code=200):
+        self.cuerpo = cuerpo
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self.cuerpo
+
+
+def _bloque(i, texto="hola"):
+    return {"fuente": "radio", "timestamp_inicio": f"2025-05-13T10:00:{i:02d}Z",
+            "timestamp_fin": f"2025-05-13T10:00:{i + 1:02d}Z", "texto": texto}
+
+
+def _lineas(*bloques) -> bytes:
+    return b"".join((json.dumps(bloque) + "\n").encode() for bloque in bloques)
+
+
+@pytest.fixture
+def spool(live, tmp_path, monkeypatch):
+    sesion = FakeSession()
+    monkeypatch.setattr(live.requests, "Session", lambda: sesion)
+    ruta = tmp_path / "spool.jsonl"
+
+    def crear(contenido: bytes = b"", offset: int = None, **kwargs):
+        ruta.write_bytes(contenido)
+        if offset is not None:
+            (tmp_path / "spool.jsonl.offset").write_text(str(offset))
+        return live.SpoolUploader("http://api/transcripciones/", str(ruta), **kwargs)
+
+    crear.sesion = sesion
+    crear.ruta = ruta
+    return crear
+
+
+def _esperar(condicion, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert condicion()
+
+
+def test_spool_reenvia_desde_el_offset(spool):
+    primero = _lineas(_bloque(0))
+    uploader = spool(primero + _lineas(_bloque(1), _bloque(2)), offset=len(primero))
+    uploader.cerrar()
+    assert spool.sesion.lotes == [[_bloque(1), _bloque(2)]]
+    assert uploader.pendientes() == 0
+    assert int((spool.ruta.parent / "spool.jsonl.offset").read_text()) == spool.ruta.stat().st_size
+
+
+def test_spool_descarta_linea_incompleta(spool):
+    uploader = spool(_lineas(_bloque(0)) + b'{"fuente": "rad')
+    uploader.agregar(_bloque(1))
+    uploader.cerrar()
+    assert spool.sesion.lotes[0][0] == _bloque(0)
+    assert [bloque for lote in spool.sesion.lotes for bloque in lote] == [_bloque(0), _bloque(1)]
+
+
+def test_spool_compacta_lo_confirmado(spool):
+    uploader = spool(_lineas(_bloque(0), _bloque(1)), compactar_bytes=0)
+    _esperar(lambda: spool.sesion.lotes and spool.ruta.stat().st_size == 0)
+    assert uploader.pendientes() == 0
+    # después de compactar el log vuelve a empezar desde 0
+    uploader.agregar(_bloque(2))
+    uploader.cerrar()
+    assert spool.sesion.lotes == [[_bloque(0), _bloque(1)], [_bloque(2)]]
+    assert (spool.ruta.parent / "spool.jsonl.offset").read_text() == "0"
+
+
+def test_spool_aparta_rechazados_y_corruptos(spool):
+    uploader = spool(_lineas(_bloque(0), _bloque(1, texto="")) + b"no es json\n" + _lineas(_bloque(2)))
+    uploader.cerrar()
+    assert spool.sesion.lotes == [[_bloque(0), _bloque(1, texto="")], [_bloque(2)]]
+    rechazados = spool.ruta.parent / "spool.jsonl.rechazados"
+    assert rechazados.read_text().splitlines() == [json.dumps(_bloque(1, texto=""))]
+    assert (spool.ruta.parent / "spool.jsonl.corruptos").read_bytes() == b"no es json\n"
+    assert uploader.pendientes() == 0
+
+
+def test_spool_sobrevive_a_errores_inesperados(spool, live):
+    spool.sesion.fallas = [RuntimeError("inesperado"), live.requests.exceptions.Timeout("lenta")]
+    uploader = spool(_lineas(_bloque(0)))
+    # 1s de espera tras el primer error y 2s tras el segundo
+    _esperar(lambda: spool.sesion.lotes, timeout=10)
+    uploader.cerrar()
+    assert spool.sesion.lotes == [[_bloque(0)]]
+
+
+def test_spool_parte_el_lote_que_falla_entero(spool):
+    bloques = [_bloque(0), _bloque(1), _bloque(2, texto="rompe"), _bloque(3), _bloque(4)]
+    uploader = spool(_lineas(*bloques), max_intentos_lote=1)
+    # sin esperas: cada partición reintenta enseguida
+    _esperar(lambda: uploader.pendientes() == 0)
+    enviados = [lote for lote in spool.sesion.lotes if _bloque(2, texto="rompe") not in lote]
+    assert [bloque for lote in enviados for bloque in lote] == [_bloque(0), _bloque(1), _bloque(3), _bloque(4)]
+    rechazados = spool.ruta.parent / "spool.jsonl.rechazados"
+    assert rechazados.read_text().splitlines() == [json.dumps(_bloque(2, texto="rompe"))]
+    # pasado el lote que fallaba vuelve al tamaño completo
+    uploader.agregar(_bloque(5))
+    uploader.agregar(_bloque(6))
+    uploader.cerrar()
+    assert spool.sesion.lotes[-1][-1] == _bloque(6)
+    assert uploader._tamano_lote == uploader.max_lote
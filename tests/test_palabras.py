@@ -0,0 +1,85 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "transcriber"))
+
+import engines
+
+
+class FakeEngine:
+    def __init__(self, **_):
+        pass
+
+    def transcribe_audio(self, audio) -> str:
+        return "hola mundo"
+
+    def transcribe_words(self, audio) -> tuple:
+        return "hola mundo", [(0, "hola"), (480, "mundo")]
+
+    def decode_batch(self, audios: list) -> list:
+        raise AssertionError("el decode en batch no da marcas por palabra")
+
+
+@pytest.fixture
+def motor(monkeypatch):
+    monkeypatch.setitem(engines.ENGINES, "fake", FakeEngine)
+    # init_engine pisa el estado global del módulo: se restaura al terminar
+    for nombre in ("_engine", "_cache", "_word_timestamps"):
+        monkeypatch.setattr(engines, nombre, getattr(engines, nombre))
+
+
+def test_transcribe_con_marcas_por_palabra(motor):
+    engines.init_engine({"backend": "fake", "timestamps": "palabras"})
+    pcm = bytes(2 * 16000)
+    resultados = engines.transcribe_files([pcm, pcm])
+    assert [r["texto"] for r in resultados] == ["hola mundo", "hola mundo"]
+    assert resultados[0]["palabras"] == ["hola", "mundo"]
+    assert resultados[0]["palabras_ms"] == [0, 480]
+
+    engines.init_engine({"backend": "fake"})
+    assert "palabras" not in engines.transcribe_files([pcm])[0]
+    with pytest.raises(ValueError):
+        engines.init_engine({"backend": "fake", "timestamps": "segmentos"})
+
+
+def test_bloque_con_palabras():
+    spec = importlib.util.spec_from_file_location("transcriber_main", os.path.join(ROOT, "transcriber", "transcriber.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+
+    job = {"media": "radio", "timestamp_inicio": "2025-05-13T10:00:00"}
+    resultado = {"texto": "hola mundo", "duracion_audio": 15, "palabras": ["hola", "mundo"], "palabras_ms": [0, 480]}
+    bloque = modulo.build_transcripcion(job, resultado)
+    assert bloque["palabras"] == ["hola", "mundo"] and bloque["palabras_ms"] == [0, 480]
+    assert "palabras" not in modulo.build_transcripcion(job, {"texto": "hola", "duracion_audio": 15})
+
+
+def test_modelo_valida_palabras_alineadas():
+    pytest.importorskip("fastapi")
+    sys.path.append(os.path.join(ROOT, "api"))
+    from models import Transcripcion
+
+    bloque = {"fuente": "radio", "timestamp_inicio": "2025-05-13T10:00:00",
+              "timestamp_fin": "2025-05-13T10:00:15", "texto": "hola mundo"}
+    assert Transcripcion(**bloque, palabras=["hola", "mundo"], palabras_ms=[0, 480]).palabras_ms == [0, 480]
+    with pytest.raises(ValueError):
+        Transcripcion(**bloque, palabras=["hola", "mundo"], palabras_ms=[0])
+    with pytest.raises(ValueError):
+        Transcripcion(**bloque, palabras=["hola"])
+
+
+def test_cache_con_palabras_solo_exacto(motor):
+    np = pytest.importorskip("numpy")
+    engines.init_engine({"backend": "fake", "timestamps": "palabras", "cache_size": 16,
+                         "cache_ttl_seconds": 60, "cache_max_ber": 0.15})
+    ruido = (np.random.default_rng(0).normal(0, 3000, 16000 * 5)).astype(np.int16)
+    corrido = np.concatenate([np.zeros(160, dtype=np.int16), ruido[:-160]])  # 10ms después
+    assert engines.transcribe_files([ruido.tobytes()])[0]["cache"] == "miss"
+    # el corrido sería un acierto "similar", pero sus marcas no caerían en su lugar
+    resultados = engines.transcribe_files([ruido.tobytes(), corrido.tobytes()])
+    assert [r["cache"] for r in resultados] == ["exacto", "miss"]
@@ -0,0 +1,160 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from pipeline.scheduler import FairQueue, add_source_job, finish_source, register_source
+from pipeline.streams import StreamQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _fair_queue(redis, consumer="a", **kwargs):
+    queue = FairQueue(redis, "jobs", "workers",
+                      lambda stream: StreamQueue(redis, stream, "workers", consumer, **kwargs), refresh_seconds=0)
+    await queue.ensure_group()
+    return queue
+
+
+async def _add(redis, media, n):
+    for i in range(n):
+        await add_source_job(redis, "jobs", {"media": media, "id": f"{media}-{i}"})
+
+
+def test_vivo_antes_que_diferido():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "vod", "diferido")
+        await register_source(redis, "jobs", "radio", "vivo")
+        await _add(redis, "vod", 3)
+        await _add(redis, "radio", 2)
+        queue = await _fair_queue(redis)
+
+        medias = [job["media"] for _, job in await queue.read(count=4, block_ms=None)]
+        assert medias == ["radio", "radio", "vod", "vod"]
+
+    run(scenario())
+
+
+def test_reparto_por_peso():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "a", "diferido", peso=3)
+        await register_source(redis, "jobs", "b", "diferido", peso=1)
+        await _add(redis, "a", 20)
+        await _add(redis, "b", 20)
+        queue = await _fair_queue(redis)
+
+        leidos = Counter()
+        for _ in range(8):
+            for message_id, job in await queue.read(count=2, block_ms=None):
+                leidos[job["media"]] += 1
+                await queue.ack(message_id)
+        assert leidos == {"a": 12, "b": 4}
+
+    run(scenario())
+
+
+def test_tope_de_concurrencia():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "radio", "vivo", max_concurrencia=2)
+        await register_source(redis, "jobs", "vod", "diferido")
+        await _add(redis, "radio", 5)
+        await _add(redis, "vod", 5)
+        queue = await _fair_queue(redis)
+
+        medias = [job["media"] for _, job in await queue.read(count=4, block_ms=None)]
+        assert medias == ["radio", "radio", "vod", "vod"]
+        # con la radio en su tope, el bloqueo tampoco la lee
+        assert [job["media"] for _, job in await queue.read(count=1, block_ms=10)] == ["vod"]
+
+    run(scenario())
+
+
+def test_ids_se_derivan_a_su_sub_cola():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "radio|am", "vivo")
+        await _add(redis, "radio|am", 2)
+        queue = await _fair_queue(redis, max_attempts=5, retry_backoff_ms=0)
+
+        [(primero, job), (segundo, _)] = await queue.read(count=2, block_ms=None)
+        assert primero.startswith("radio|am|")
+        await queue.move(primero, job, "done")
+        await queue.retry(segundo, {"media": "radio|am", "id": "radio|am-1"}, RuntimeError("falla"))
+
+        assert await redis.xlen("done") == 1
+        [(_, reintento)] = await queue.read(count=1, block_ms=None)
+        assert reintento["attempts"] == 1
+        assert (await redis.xpending("jobs:radio|am", "workers"))["pending"] == 1
+
+    run(scenario())
+
+
+def test_fuente_terminada_se_da_de_baja():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "vod", "diferido")
+        await _add(redis, "vod", 1)
+        await finish_source(redis, "jobs", "vod")
+        queue = await _fair_queue(redis)
+
+        [(message_id, job)] = await queue.read(count=1, block_ms=None)
+        await queue.refresh(force=True)
+        assert await redis.hexists("jobs:fuentes", "vod")  # todavía tiene un job en el stream
+        await queue.move(message_id, job, "done")
+        await queue.refresh(force=True)
+        assert not await redis.hexists("jobs:fuentes", "vod")
+        assert queue.sources == {}
+
+    run(scenario())
+
+
+def test_tope_no_traba_jobs_de_un_consumidor_caido():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await register_source(redis, "jobs", "radio", "vivo", max_concurrencia=2)
+        await _add(redis, "radio", 3)
+        caido = await _fair_queue(redis, consumer="caido", visibility_timeout_ms=100)
+        assert len(await caido.read(count=2, block_ms=None)) == 2
+
+        queue = await _fair_queue(redis, consumer="vivo", visibility_timeout_ms=100)
+        await asyncio.sleep(0.15)
+        recuperados = await queue.read(count=2, block_ms=None)
+        assert [job["id"] for _, job in recuperados] == ["radio-0", "radio-1"]
+        # los recuperados vuelven a ocupar el tope
+        assert await queue.read(count=1, block_ms=None) == []
+
+    run(scenario())
+
+
+def test_bloqueo_respeta_count_y_block_ms():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _fair_queue(redis)
+        # sin fuentes duerme block_ms en vez de volver enseguida
+        inicio = asyncio.get_running_loop().time()
+        assert await queue.read(count=1, block_ms=100) == []
+        assert asyncio.get_running_loop().time() - inicio >= 0.1
+
+        for media in ("a", "b", "c"):
+            await register_source(redis, "jobs", media, "diferido")
+        await queue.refresh(force=True)
+        await _add(redis, "a", 1)
+        await _add(redis, "b", 1)
+        await _add(redis, "c", 1)
+
+        async def vacio(prioridad, count):
+            return []  # como si los jobs llegaran durante el bloqueo
+
+        queue._read_class = vacio
+        assert len(await queue.read(count=2, block_ms=10)) == 2
+        # el que el XREADGROUP entregó de más sale en la lectura siguiente
+        assert len(await queue.read(count=2, block_ms=None)) == 1
+
+    run(scenario())
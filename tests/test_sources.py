@@ -0,0 +1,113 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import pytest
+
+CHUNKER = os.path.join(os.path.dirname(__file__), "..", "audio-chunker")
+sys.path.append(CHUNKER)
+
+from sources import HostLimiter, StreamInfoCache, load_sources_file, load_sources_redis
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_fuentes_de_archivo(tmp_path):
+    ruta = tmp_path / "fuentes.json"
+    ruta.write_text(json.dumps({"radio": "https://youtube.com/a", "tv": {"url": "https://youtube.com/b",
+                                                                          "continuo": True}}))
+    assert load_sources_file(str(ruta)) == {
+        "radio": {"url": "https://youtube.com/a", "media": "radio"},
+        "tv": {"url": "https://youtube.com/b", "continuo": True, "media": "tv"},
+    }
+    ruta.write_text(json.dumps([{"media": "radio", "url": "https://youtube.com/a"}]))
+    assert load_sources_file(str(ruta)) == {"radio": {"url": "https://youtube.com/a", "media": "radio"}}
+
+
+def test_fuentes_de_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await redis.hset("fuentes", mapping={"radio": "https://youtube.com/a",
+                                             "tv": '{"url": "https://youtube.com/b", "modo": "streaming"}'})
+        return await load_sources_redis(redis, "fuentes")
+
+    assert run(scenario())["tv"] == {"url": "https://youtube.com/b", "modo": "streaming", "media": "tv"}
+
+
+def test_cache_vence_con_la_url_firmada():
+    cache = StreamInfoCache(ttl_seconds=300, margin_seconds=60)
+    vence = int(time.time()) + 30
+    cache.put("a", {"id": "a"}, f"https://rr1.googlevideo.com/videoplayback?expire={vence}&id=1")
+    cache.put("b", {"id": "b"}, f"https://manifest.googlevideo.com/api/manifest/hls/expire/{vence + 3600}/id/2")
+    assert cache.get("a") is None  # vence en menos que el margen
+    assert cache.get("b") == ({"id": "b"}, f"https://manifest.googlevideo.com/api/manifest/hls/expire/{vence + 3600}/id/2")
+    cache.invalidate("b")
+    assert cache.get("b") is None
+
+
+def test_limite_por_host():
+    async def scenario():
+        limiter = HostLimiter(concurrency=1, min_interval=0.05)
+        inicios = {}
+
+        async def pedido(url, clave):
+            async with limiter.limit(url):
+                inicios[clave] = time.monotonic()
+
+        await asyncio.gather(pedido("https://youtube.com/a", 1), pedido("https://youtube.com/b", 2),
+                             pedido("https://otro.com/c", 3))
+        return inicios
+
+    inicios = run(scenario())
+    assert inicios[2] - inicios[1] >= 0.045
+    assert inicios[3] < inicios[2]  # otro host no espera
+
+
+@pytest.fixture(scope="module")
+def chunker():
+    spec = importlib.util.spec_from_file_location("audio_chunker", os.path.join(CHUNKER, "audio-chunker.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def test_servicio_sigue_las_fuentes(chunker, monkeypatch):
+    llamadas = []
+
+    async def process_url(url, chunk_duration, media_name, mode=None, redis=None, executor=None):
+        llamadas.append(media_name)
+        if media_name == "falla" and llamadas.count("falla") == 1:
+            raise RuntimeError("URL vencida")
+        await asyncio.sleep(10 if media_name == "radio" else 0)
+
+    monkeypatch.setattr(chunker, "process_url", process_url)
+
+    async def scenario():
+        fuentes = {"radio": {"media": "radio", "url": "https://youtube.com/radio"},
+                   "vod": {"media": "vod", "url": "https://youtube.com/vod"},
+                   "falla": {"media": "falla", "url": "https://youtube.com/falla", "continuo": True}}
+
+        async def load_sources():
+            return dict(fuentes)
+
+        service = chunker.ChunkerService(None, load_sources, 15, restart_seconds=0.01)
+        await service.reconcile()
+        await asyncio.sleep(0.05)
+        assert service.tasks["vod"][1].done()
+        assert llamadas.count("falla") >= 2  # reintento tras el error y recaptura por ser continuo
+
+        del fuentes["radio"]
+        tarea = service.tasks["radio"][1]
+        await service.reconcile()
+        assert tarea.cancelled() and "radio" not in service.tasks
+        assert llamadas.count("vod") == 1  # terminada, no se reinicia
+        await service._stop("falla")
+
+    run(scenario())
@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from pipeline.audio import delete_audio, load_job_audio, store_audio
+from pipeline.streams import StreamQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _queue(redis, consumer, **kwargs):
+    queue = StreamQueue(redis, "jobs", "workers", consumer, **kwargs)
+    await queue.ensure_group()
+    return queue
+
+
+def test_read_move_ack():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _queue(redis, "a")
+        await queue.ensure_group()  # idempotente
+        await queue.add({"id": "1"})
+
+        [(message_id, job)] = await queue.read(block_ms=None)
+        assert job == {"id": "1"}
+        await queue.move(message_id, job, "done")
+
+        assert await redis.xlen("jobs") == 0
+        assert await redis.xpending("jobs", "workers") == {"pending": 0, "min": None, "max": None,
+                                                            "consumers": []}
+        assert await redis.xlen("done") == 1
+
+    run(scenario())
+
+
+def test_reclaim_after_visibility_timeout():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        caido = await _queue(redis, "caido", visibility_timeout_ms=50)
+        vivo = await _queue(redis, "vivo", visibility_timeout_ms=50)
+        await caido.add({"id": "1"})
+        [(message_id, _)] = await caido.read(block_ms=None)
+
+        assert await vivo.read(block_ms=None) == []
+        await asyncio.sleep(0.1)
+        vivo._next_reclaim = 0
+        assert await vivo.read(block_ms=None) == [(message_id, {"id": "1"})]
+
+    run(scenario())
+
+
+def test_retry_and_dead_letter():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _queue(redis, "a", max_attempts=2, dead_letter_stream="dead")
+        await queue.add({"id": "1"})
+
+        [(message_id, job)] = await queue.read(block_ms=None)
+        await queue.retry(message_id, job, Exception("falla"))
+        [(message_id, job)] = await queue.read(block_ms=None)
+        assert job["attempts"] == 1
+        await queue.retry(message_id, job, Exception("falla"))
+
+        assert await queue.read(block_ms=None) == []
+        assert await redis.xlen("dead") == 1
+
+    run(scenario())
+
+
+def test_retry_with_backoff():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _queue(redis, "a", retry_backoff_ms=50)
+        await queue.add({"id": "1"})
+
+        [(message_id, job)] = await queue.read(block_ms=None)
+        await queue.retry(message_id, job, Exception("falla"))
+        assert await queue.read(block_ms=None) == []
+        assert await redis.zcard("jobs:retry") == 1
+
+        await asyncio.sleep(0.1)
+        queue._next_promote = 0
+        [(_, job)] = await queue.read(block_ms=None)
+        assert job["attempts"] == 1
+        assert await redis.zcard("jobs:retry") == 0
+
+    run(scenario())
+
+
+def test_queue_depths():
+    from pipeline.metrics import QUEUE_DEPTH, update_queue_depths
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _queue(redis, "a")
+        await queue.add({"id": "1"})
+        await queue.add({"id": "2"})
+        await queue.read(block_ms=None)
+
+        await update_queue_depths(redis, ["jobs", "no_existe"])
+        assert QUEUE_DEPTH.labels("jobs", "en_stream")._value.get() == 2
+        assert QUEUE_DEPTH.labels("jobs", "pendientes")._value.get() == 1
+        assert QUEUE_DEPTH.labels("no_existe", "en_stream")._value.get() == 0
+
+    run(scenario())
+
+
+def test_audio_en_redis():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        pcm = bytes(range(256)) * 4
+        key = await store_audio(redis, "1", pcm)
+        assert 0 < await redis.ttl(key)
+
+        # el PCM vuelve como bytes aunque el cliente decodifique las respuestas
+        assert await load_job_audio(redis, {"id": "1", "audio-key": key}) == pcm
+        assert await load_job_audio(redis, {"id": "2", "file-path": "/tmp/x.flac"}) == "/tmp/x.flac"
+
+        assert await delete_audio(redis, [key]) == 1
+        with pytest.raises(FileNotFoundError):
+            await load_job_audio(redis, {"id": "1", "audio-key": key})
+
+    run(scenario())
+
+
+def test_audio_en_redis_con_limite(monkeypatch):
+    monkeypatch.setenv("CHUNK_AUDIO_PREFIX", "chunk_audio:")
+    monkeypatch.setenv("CHUNK_AUDIO_MAX_MB", str(1500 / 1024 / 1024))
+    monkeypatch.setenv("CHUNK_AUDIO_POLL_SECONDS", "0.01")
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        primera = await store_audio(redis, "1", bytes(1000))
+        segunda = asyncio.create_task(store_audio(redis, "2", bytes(1000)))
+        await asyncio.sleep(0.05)
+        assert not segunda.done()  # no entra hasta que el cleaner borre la primera
+        await delete_audio(redis, [primera])
+        await asyncio.wait_for(segunda, 1)
+        assert await redis.get("chunk_audio:total") == "1000"
+
+        # una clave vencida se descuenta sola
+        await redis.zadd("chunk_audio:index", {"chunk_audio:2": 0})
+        await redis.delete("chunk_audio:2")
+        await asyncio.wait_for(store_audio(redis, "3", bytes(1000)), 1)
+        assert await redis.get("chunk_audio:total") == "1000"
+
+    run(scenario())
+
+
+def test_remove_consumer_solo_sin_pendientes():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = await _queue(redis, "a")
+        await queue.add({"id": "1"})
+        [(message_id, _)] = await queue.read(block_ms=None)
+
+        assert not await queue.remove_consumer()
+        await queue.ack(message_id)
+        assert await queue.remove_consumer()
+        assert await redis.xinfo_consumers("jobs", "workers") == []
+
+    run(scenario())
@@ -0,0 +1,113 @@
+import asyncio
+import importlib.util
+import os
+import sys
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "transcriber"))
+
+from pipeline.scheduler import add_source_job, register_source
+from pipeline.streams import StreamQueue
+from supervisor import Autoscaler, Supervisor, queue_load
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def carga(en_espera=0, en_proceso=0, espera_s=0.0):
+    return {"en_espera": en_espera, "en_proceso": en_proceso, "diferidos": 0, "espera_s": espera_s,
+            "proceso_s": 0.0}
+
+
+def test_autoscaler_sube_directo_y_baja_de_a_uno():
+    autoscaler = Autoscaler(1, 4, jobs_per_worker=2, max_wait_seconds=60, idle_seconds=100, cooldown_seconds=10)
+    assert autoscaler.desired(0, carga(), 0) == 1  # por debajo del mínimo, sin esperar
+    assert autoscaler.desired(1, carga(en_espera=20), 1) == 1  # cooldown
+    assert autoscaler.desired(1, carga(en_espera=20), 20) == 4  # hasta el máximo
+    assert autoscaler.desired(4, carga(en_espera=1), 40) == 4
+    assert autoscaler.desired(4, carga(en_espera=1), 139) == 4  # todavía no pasaron idle_seconds
+    assert autoscaler.desired(4, carga(en_espera=1), 140) == 3
+    assert autoscaler.desired(3, carga(en_espera=1), 150) == 3  # cada paso vuelve a esperar
+    assert autoscaler.desired(3, carga(en_espera=1), 240) == 2
+
+
+def test_autoscaler_sube_si_los_jobs_esperan_demasiado():
+    autoscaler = Autoscaler(1, 4, jobs_per_worker=10, max_wait_seconds=60, cooldown_seconds=0)
+    assert autoscaler.desired(2, carga(en_espera=3, espera_s=30), 0) == 2
+    assert autoscaler.desired(2, carga(en_espera=3, espera_s=90), 1) == 3
+
+
+def test_carga_de_la_cola_con_sub_colas():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = StreamQueue(redis, "jobs", "workers", "a")
+        await queue.ensure_group()
+        for i in range(3):
+            await queue.add({"id": i})
+        await queue.read(count=1, block_ms=None)
+        await register_source(redis, "jobs", "radio", "vivo")
+        await StreamQueue(redis, "jobs:radio", "workers", "a").ensure_group()
+        await add_source_job(redis, "jobs", {"media": "radio", "id": 9})
+        return await queue_load(redis, "jobs", "workers")
+
+    load = run(scenario())
+    assert (load["en_espera"], load["en_proceso"], load["diferidos"]) == (3, 1, 0)
+    assert 0 <= load["espera_s"] < 5
+
+
+def test_supervisor_lanza_y_drena_procesos():
+    # un "transcriber" que al recibir SIGTERM termina su trabajo y sale
+    comando = [sys.executable, "-c",
+               "import signal, sys, time\n"
+               "signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))\n"
+               "time.sleep(30)"]
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = StreamQueue(redis, "jobs", "workers", "a")
+        await queue.ensure_group()
+        for i in range(5):
+            await queue.add({"id": i})
+        autoscaler = Autoscaler(1, 3, jobs_per_worker=2, idle_seconds=0, cooldown_seconds=0)
+        supervisor = Supervisor(redis, "jobs", "workers", autoscaler, comando, drain_timeout=5)
+        await supervisor.step()
+        assert len(supervisor.workers) == 3
+        procesos = list(supervisor.workers.values())
+        await asyncio.sleep(0.5)  # que los procesos lleguen a instalar el handler de SIGTERM
+
+        await redis.delete("jobs")
+        await queue.ensure_group()
+        await supervisor.step()
+        assert len(supervisor.workers) == 2
+        await asyncio.gather(*supervisor.draining)
+        assert procesos[2].returncode == 0
+
+        stopping = asyncio.Event()
+        stopping.set()
+        await supervisor.run(stopping)
+        assert supervisor.workers == {} and all(p.returncode is not None for p in procesos)
+
+    run(scenario())
+
+
+def test_drenando_no_lee_jobs_nuevos():
+    spec = importlib.util.spec_from_file_location(
+        "transcriber_main", os.path.join(os.path.dirname(__file__), "..", "transcriber", "transcriber.py"))
+    transcriber = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(transcriber)
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        queue = StreamQueue(redis, "jobs", "workers", "a")
+        await queue.ensure_group()
+        for i in range(3):
+            await queue.add({"id": str(i)})
+        stopping = asyncio.Event()
+        stopping.set()
+        assert await transcriber.next_batch(queue, batch_size=2, batch_wait_ms=100, stopping=stopping) == []
+        assert (await redis.xpending("jobs", "workers"))["pending"] == 0
+
+    run(scenario())
@@ -1,9 +1,15 @@
+import pytest
 from fastapi.testclient import TestClient
 from api.main import app
 
-client = TestClient(app)
 
-def test_create_transcripcion():
+@pytest.fixture(scope="module")
+def client():
+    # El context manager dispara el lifespan (apertura/cierre del pool)
+    with TestClient(app) as c:
+        yield c
+
+def test_create_transcripcion(client):
     response = client.post("/transcripciones/", json={
         "fuente": "Radio Test",
         "timestamp_inicio": "2025-05-13T10:00:00",
@@ -12,3 +18,124 @@ def test_create_transcripcion():
     })
     assert response.status_code == 200
     assert response.json()["ok"] is True
+
+
+def test_estado_pool(client):
+    response = client.get("/db/pool")
+    assert response.status_code == 200
+    assert response.json()["abierto"] is True
+
+
+def test_create_transcripciones_bulk(client):
+    bloque = {
+        "fuente": "Radio Test",
+        "timestamp_inicio": "2025-05-13T10:00:15",
+        "timestamp_fin": "2025-05-13T10:00:30",
+        "texto": "Bloque masivo"
+    }
+    response = client.post("/transcripciones/bulk", json=[bloque, {"fuente": "Radio Test"}])
+    assert response.status_code == 200
+    body = response.json()
+    assert body["insertados"] == 1
+    assert [item["ok"] for item in body["items"]] == [True, False]
+
+
+def test_create_transcripciones_ndjson(client):
+    lineas = [
+        '{"fuente": "Radio Test", "timestamp_inicio": "2025-05-13T10:00:30", '
+        '"timestamp_fin": "2025-05-13T10:00:45", "texto": "Linea uno"}',
+        "no es json",
+    ]
+    response = client.post("/transcripciones/bulk/ndjson", content="\n".join(lineas),
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["insertados"] == 1
+    assert body["items"][1]["ok"] is False
+
+
+def test_buscar_texto_completo(client):
+    response = client.get("/transcripciones/buscar", params={
+        "fuente": "Radio Test", "texto": "prueb", "modo": "prefijo", "resaltar": True
+    })
+    assert response.status_code == 200
+    resultados = response.json()
+    assert resultados
+    assert "<b>" in resultados[0]["fragmento"]
+
+
+def test_buscar_paginado_por_cursor(client):
+    params = {"fuente": "Radio Test", "limite": 1, "campos": "texto"}
+    primera = client.get("/transcripciones/buscar", params=params)
+    assert primera.status_code == 200
+    assert len(primera.json()) == 1
+    assert set(primera.json()[0]) == {"id", "timestamp_inicio", "texto"}
+
+    cursor = primera.headers["X-Siguiente-Cursor"]
+    segunda = client.get("/transcripciones/buscar", params={**params, "cursor": cursor})
+    assert segunda.status_code == 200
+    assert segunda.json()[0]["id"] != primera.json()[0]["id"]
+
+
+def test_buscar_cache(client):
+    params = {"fuente": "Radio Cache"}
+    assert client.get("/transcripciones/buscar", params=params).headers["X-Cache"] == "miss"
+    assert client.get("/transcripciones/buscar", params=params).headers["X-Cache"] == "hit"
+
+    # un bloque nuevo de la fuente invalida la búsqueda
+    client.post("/transcripciones/", json={
+        "fuente": "Radio Cache",
+        "timestamp_inicio": "2025-05-13T11:00:00",
+        "timestamp_fin": "2025-05-13T11:00:15",
+        "texto": "Bloque nuevo"
+    })
+    response = client.get("/transcripciones/buscar", params=params)
+    assert response.headers["X-Cache"] == "miss"
+    assert "Bloque nuevo" in [fila["texto"] for fila in response.json()]
+
+
+def test_exportar_ndjson(client):
+    response = client.get("/transcripciones/exportar", params={"fuente": "Radio Test"})
+    assert response.status_code == 200
+    lineas = response.text.strip().split("\n")
+    assert len(lineas) >= 2
+
+
+def test_metrics(client):
+    client.get("/db/pool")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'api_request_seconds_count{estado="200",metodo="GET",ruta="/db/pool"}' in response.text
+
+
+def test_momentos(client):
+    bloques = [
+        {"fuente": "Radio Momentos", "timestamp_inicio": "2025-05-13T11:00:00",
+         "timestamp_fin": "2025-05-13T11:00:15", "texto": "Subió el dólar",
+         "palabras": ["Subió", "el", "dólar"], "palabras_ms": [0, 14000, 14500]},
+        {"fuente": "Radio Momentos", "timestamp_inicio": "2025-05-13T11:00:15",
+         "timestamp_fin": "2025-05-13T11:00:30", "texto": "otra vez",
+         "palabras": ["otra", "vez"], "palabras_ms": [1000, 1500]},
+    ]
+    response = client.post("/transcripciones/bulk", json=bloques)
+    assert response.json()["insertados"] == 2
+
+    response = client.get("/transcripciones/momentos", params={
+        "texto": "DÓLAR", "fuente": "Radio Momentos", "contexto": 5})
+    assert response.status_code == 200
+    momentos = response.json()
+    assert len(momentos) == 1
+    assert momentos[0]["posicion"] == 3 and momentos[0]["segundo"] == 14.5
+    # el contexto cruza el corte entre bloques
+    assert momentos[0]["contexto"] == "el dólar otra vez"
+
+    bloque = {"fuente": "Radio Momentos", "timestamp_inicio": "2025-05-13T11:00:30",
+              "timestamp_fin": "2025-05-13T11:00:45", "texto": "Cotiza a 1.500 en Medio-Oriente.",
+              "palabras": ["Cotiza", "a", "1.500", "en", "Medio-Oriente."], "palabras_ms": [0, 400, 600, 1500, 1800]}
+    assert client.post("/transcripciones/bulk", json=[bloque]).json()["insertados"] == 1
+    response = client.get("/transcripciones/momentos", params={
+        "texto": "1.500 en medio-oriente", "fuente": "Radio Momentos"})
+    assert [m["posicion"] for m in response.json()] == [3]
+
+    response = client.get("/transcripciones/momentos", params={"texto": "¿?"})
+    assert response.status_code == 400
@@ -0,0 +1,81 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "audio-chunker"))
+
+from vad import VadSegmenter
+
+
+def segmentar(patron: str, **kwargs) -> list:
+    """
+    Corre el segmentador sobre un patrón de frames de 100ms ('v' voz, '.' pausa)
+    y devuelve los segmentos como (inicio_ms, duración_ms).
+    """
+    segmenter = VadSegmenter(frame_ms=100, **kwargs)
+    segmentos = []
+    for caracter in patron:
+        segmentos += segmenter.push(b"xx", caracter == "v")
+    segmentos += segmenter.flush()
+    return [(inicio, len(pcm) // 2 * 100) for inicio, pcm in segmentos]
+
+
+def test_corta_en_pausas():
+    patron = "vvvvvvvvvv...vvvvvvvvvv...vvvvv"
+    assert segmentar(patron, min_ms=500, max_ms=2000, min_silence_ms=300) == [(0, 1200), (1200, 1300), (2500, 600)]
+
+
+def test_corte_forzado_en_la_pausa_mas_larga():
+    patron = "vvvvvv.vvvv..vvvvvvvvvvvvvvv"
+    # sin pausas de 300ms: a los 2s corta en la pausa más larga ("..")
+    assert segmentar(patron, min_ms=500, max_ms=2000, min_silence_ms=300) == [(0, 1200), (1200, 1600)]
+
+
+def test_descarta_silencio_y_musica():
+    patron = "......" + "v.v......v...." + "vvvvvvvv"
+    segmentos = segmentar(patron, min_ms=500, max_ms=1400, min_silence_ms=300, min_speech_ratio=0.5)
+    # el silencio inicial y los segmentos con poca voz no llegan a encolarse
+    assert segmentos == [(1800, 1000)]
+
+
+def test_modo_completo_cuenta_voz_y_descartado(monkeypatch):
+    pytest.importorskip("pydub")
+    spec = importlib.util.spec_from_file_location(
+        "audio_chunker", os.path.join(os.path.dirname(__file__), "..", "audio-chunker", "audio-chunker.py"))
+    chunker = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(chunker)
+
+    class Detector:
+        def __init__(self, **_):
+            pass
+
+        def is_speech(self, frame: bytes) -> bool:
+            return any(frame)
+
+    monkeypatch.setattr(chunker, "SpeechDetector", Detector)
+    voz = chunker.AUDIO_SECONDS.labels("vad_voz")
+    descartado = chunker.AUDIO_SECONDS.labels("vad_descartado")
+    antes = voz._value.get(), descartado._value.get()
+
+    pcm = bytes(32000) + b"\x01\x00" * 32000 + bytes(32000)  # 1s de silencio, 2s de "voz", 1s de silencio
+    audio = chunker.AudioSegment(data=pcm, sample_width=2, frame_rate=16000, channels=1)
+    bounds = chunker.vad_bounds(audio, {"min_ms": 500, "max_ms": 5000, "min_silence_ms": 300})
+    assert len(bounds) == 1
+    assert voz._value.get() - antes[0] == pytest.approx((bounds[0][1] - bounds[0][0]) / 1000)
+    assert descartado._value.get() - antes[1] > 0
+
+
+def test_lista_de_segmentos_csv():
+    pytest.importorskip("pydub")
+    spec = importlib.util.spec_from_file_location(
+        "audio_chunker", os.path.join(os.path.dirname(__file__), "..", "audio-chunker", "audio-chunker.py"))
+    chunker = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(chunker)
+
+    assert chunker.parse_segment_entry("/chunks/.a-000001.mp3,15.023000,29.998000") == \
+        ("/chunks/.a-000001.mp3", 15.023, 29.998)
+    # ffmpeg pone entre comillas las rutas con comas
+    assert chunker.parse_segment_entry('"/chunks/radio, am/.a-000002.mp3",30.0,37.5') == \
+        ("/chunks/radio, am/.a-000002.mp3", 30.0, 37.5)
@@ -2,6 +2,9 @@ import subprocess
 import tempfile
 import os
 import datetime
+import queue
+import threading
+import numpy as np
 import requests
 import whisper
 import time
@@ -9,6 +12,9 @@ import socket
 import json
 from yt_dlp import YoutubeDL
 
+SAMPLE_RATE = 16000
+BYTES_POR_SEGUNDO = SAMPLE_RATE * 2  # PCM s16le mono
+
 def check_internet(host="8.8.8.8", port=53, timeout=2):
     try:
         socket.setdefaulttimeout(timeout)
@@ -17,6 +23,317 @@ def check_internet(host="8.8.8.8", port=53, timeout=2):
     except Exception:
         return False
 
+class RingBuffer:
+    """
+    Buffer circular de PCM entre la captura (escribe) y el cortador (lee).
+    Si el lector se atrasa más que la capacidad, se pisa el audio más viejo:
+    se pierde audio pero la latencia queda acotada.
+
+    Las marcas (offset, momento) anclan los bytes a la hora real: la captura
+    marca cada vez que ffmpeg vuelve a abrir el stream, así el tiempo que
+    estuvo cortado no corre los timestamps de los bloques siguientes.
+    """
+    def __init__(self, capacidad: int, bytes_por_segundo: int = BYTES_POR_SEGUNDO):
+        self.capacidad = capacidad
+        self.bytes_por_segundo = bytes_por_segundo
+        self._buf = bytearray(capacidad)
+        self._escritos = 0  # bytes escritos desde el inicio
+        self._leidos = 0    # bytes leídos (o pisados) desde el inicio
+        self._marcas = []   # (offset en bytes, momento de ese byte), en orden
+        self.perdidos = 0
+        self.cerrado = False
+        self._cond = threading.Condition()
+
+    def marcar(self, momento: datetime.datetime):
+        """
+        El próximo byte que se escriba corresponde a `momento`.
+        """
+        with self._cond:
+            self._marcas.append((self._escritos, momento))
+
+    def momento(self, offset: int) -> datetime.datetime:
+        """
+        Hora real del byte `offset`, según la última marca anterior a él.
+        """
+        with self._cond:
+            base, momento = self._marcas[0]
+            for marca_offset, marca_momento in self._marcas:
+                if marca_offset > offset:
+                    break
+                base, momento = marca_offset, marca_momento
+            return momento + datetime.timedelta(seconds=(offset - base) / self.bytes_por_segundo)
+
+    def escribir(self, datos: bytes):
+        with self._cond:
+            if len(datos) > self.capacidad:
+                # el principio no entra: cuenta como escrito y pisado (abajo)
+                self._escritos += len(datos) - self.capacidad
+                datos = datos[-self.capacidad:]
+            inicio = self._escritos % self.capacidad
+            primera = min(len(datos), self.capacidad - inicio)
+            self._buf[inicio:inicio + primera] = datos[:primera]
+            self._buf[:len(datos) - primera] = datos[primera:]
+            self._escritos += len(datos)
+            if self._escritos - self._leidos > self.capacidad:
+                self.perdidos += self._escritos - self._leidos - self.capacidad
+                self._leidos = self._escritos - self.capacidad
+            self._cond.notify_all()
+
+    def leer(self, n: int):
+        """
+        Espera hasta tener `n` bytes y devuelve (offset en bytes desde el inicio, datos).
+        Cerrado el buffer devuelve lo que quede, o None si no queda nada.
+        """
+        if n > self.capacidad:
+            # nunca habría `n` bytes juntos sin leer: esperaría para siempre
+            raise ValueError(f"No se pueden leer {n} bytes de un buffer de {self.capacidad}")
+        with self._cond:
+            self._cond.wait_for(lambda: self._escritos - self._leidos >= n or self.cerrado)
+            n = min(n, self._escritos - self._leidos)
+            if n == 0:
+                return None
+            offset = self._leidos
+            inicio = offset % self.capacidad
+            primera = min(n, self.capacidad - inicio)
+            datos = bytes(self._buf[inicio:inicio + primera]) + bytes(self._buf[:n - primera])
+            self._leidos += n
+            # las marcas anteriores a lo devuelto ya no hacen falta
+            while len(self._marcas) > 1 and self._marcas[1][0] <= offset:
+                self._marcas.pop(0)
+            return offset, datos
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrado = True
+            self._cond.notify_all()
+
+
+# respuestas de /bulk que pueden deberse al contenido del lote
+ESTADOS_DE_LOTE = (400, 413, 422, 500)
+
+
+class SpoolUploader:
+    """
+    Envío resiliente a la API. Cada bloque se escribe primero en un log local
+    append-only (con fsync) y un hilo aparte lo envía en lotes a `/bulk`, con
+    una sesión HTTP persistente. Lo confirmado por la API se marca en
+    `<spool>.offset`: si la API o la red se caen, los bloques se acumulan en el
+    log y al volver se reenvían en lotes de hasta `max_lote`. Lo que quedó
+    pendiente de una corrida anterior se envía al arrancar. Los bloques que
+    la API rechaza van a `<spool>.rechazados` y las líneas del log que no se
+    pueden leer, a `<spool>.corruptos`.
+
+    Un lote que la API rechaza entero (413, o un 500 porque una fila hace
+    fallar el COPY) trabaría el spool para siempre: tras `max_intentos_lote`
+    fallas seguidas se parte a la mitad, y un bloque solo que sigue fallando
+    va a `<spool>.rechazados`.
+    """
+    def __init__(self, api_url: str, spool_file: str = "spool_transcripciones.jsonl", max_lote: int = 500,
+                 timeout: float = 10, espera_maxima: float = 60, compactar_bytes: int = 1 << 20,
+                 max_intentos_lote: int = 3):
+        self.bulk_url = api_url.rstrip("/") + "/bulk"
+        self.spool_file = spool_file
+        self.offset_file = spool_file + ".offset"
+        self.rechazados_file = spool_file + ".rechazados"
+        self.corruptos_file = spool_file + ".corruptos"
+        self.max_lote = max_lote
+        self.timeout = timeout
+        self.espera_maxima = espera_maxima
+        self.compactar_bytes = compactar_bytes
+        self.max_intentos_lote = max_intentos_lote
+        # lote partido: tamaño reducido hasta pasar el offset donde terminaba el que fallaba
+        self._tamano_lote = max_lote
+        self._partido_hasta = None
+        self._fallas_lote = 0
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._hay_datos = threading.Event()
+        self._detener = threading.Event()
+        self._reparar()
+        self._log = open(spool_file, "ab")
+        self._offset = self._leer_offset()
+        # puede haber pendientes de una corrida anterior
+        self._hay_datos.set()
+        self._hilo = threading.Thread(target=self._enviar_pendientes, daemon=True)
+        self._hilo.start()
+
+    def agregar(self, payload: dict):
+        linea = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._log.write(linea)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+        self._hay_datos.set()
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return os.fstat(self._log.fileno()).st_size - self._offset
+
+    def cerrar(self, timeout: float = 10):
+        """
+        Intenta vaciar el spool durante `timeout` segundos. Lo que no se pudo
+        enviar queda en el log para la próxima corrida.
+        """
+        self._detener.set()
+        self._hay_datos.set()
+        self._hilo.join(timeout)
+        if self.pendientes():
+            print(f"💾 {self.pendientes()} bytes sin enviar quedan en {self.spool_file}")
+
+    def _reparar(self):
+        # una línea a medio escribir (corte de luz, kill -9) se descarta
+        if not os.path.exists(self.spool_file):
+            return
+        with open(self.spool_file, "rb+") as f:
+            datos = f.read()
+            if datos and not datos.endswith(b"\n"):
+                f.truncate(datos.rfind(b"\n") + 1)
+                print("⚠️ Se descartó una línea incompleta al final del spool")
+
+    def _leer_offset(self) -> int:
+        try:
+            with open(self.offset_file) as f:
+                offset = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        # offset de antes de una compactación que no llegó a guardarse
+        return offset if offset <= os.path.getsize(self.spool_file) else 0
+
+    def _guardar_offset(self, offset: int):
+        tmp = self.offset_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offset_file)
+        self._offset = offset
+
+    def _leer_lote(self):
+        """
+        Hasta max_lote bloques (menos si se partió un lote) desde el offset confirmado: (bloques, offset siguiente).
+        Una línea ilegible corta el lote; si es la primera, se aparta y se sigue.
+        """
+        bloques = []
+        offset = self._offset
+        with open(self.spool_file, "rb") as f:
+            f.seek(offset)
+            while len(bloques) < self._tamano_lote:
+                linea = f.readline()
+                if not linea.endswith(b"\n"):
+                    break
+                try:
+                    bloque = json.loads(linea)
+                except ValueError:
+                    if bloques:
+                        break
+                    self._apartar_corrupta(linea, offset + len(linea))
+                    offset += len(linea)
+                    continue
+                offset += len(linea)
+                bloques.append(bloque)
+        return bloques, offset
+
+    def _apartar_corrupta(self, linea: bytes, offset: int):
+        # se confirma enseguida para no apartarla otra vez si el lote falla
+        with open(self.corruptos_file, "ab") as f:
+            f.write(linea)
+        self._guardar_offset(offset)
+        print(f"⚠️ Línea ilegible en el spool, guardada en {self.corruptos_file}")
+
+    def _compactar(self):
+        # todo confirmado: el log vuelve a empezar para no crecer sin límite
+        with self._lock:
+            tamano = os.fstat(self._log.fileno()).st_size
+            if self._offset < tamano or tamano < self.compactar_bytes:
+                return
+            self._log.truncate(0)
+            self._guardar_offset(0)
+
+    def _rechazar(self, bloques: list, estados: list):
+        # bloques que la API no acepta (validación): reintentarlos no sirve
+        rechazados = [bloques[estado["index"]] for estado in estados if not estado.get("ok")]
+        if not rechazados:
+            return
+        with open(self.rechazados_file, "a", encoding="utf-8") as f:
+            for bloque in rechazados:
+                f.write(json.dumps(bloque, ensure_ascii=False) + "\n")
+        print(f"⚠️ La API rechazó {len(rechazados)} bloques, guardados en {self.rechazados_file}")
+
+    def _confirmar(self, offset: int):
+        self._guardar_offset(offset)
+        self._fallas_lote = 0
+        if self._partido_hasta is not None and offset >= self._partido_hasta:
+            self._tamano_lote = self.max_lote
+            self._partido_hasta = None
+        self._compactar()
+
+    def _fallo_lote(self, bloques: list, offset: int) -> bool:
+        """
+        Cuenta una falla del lote por su contenido. Al llegar a
+        max_intentos_lote lo parte o, si es un bloque solo, lo rechaza.
+        True si hizo alguna de las dos cosas.
+        """
+        self._fallas_lote += 1
+        if self._fallas_lote < self.max_intentos_lote:
+            return False
+        self._fallas_lote = 0
+        if self._partido_hasta is None:
+            self._partido_hasta = offset
+        if len(bloques) > 1:
+            self._tamano_lote = len(bloques) // 2
+            print(f"⚠️ La API rechaza el lote entero, se reintenta de a {self._tamano_lote} bloques")
+            return True
+        self._rechazar(bloques, [{"index": 0, "ok": False}])
+        self._confirmar(offset)
+        return True
+
+    def _enviar_pendientes(self):
+        espera = 1
+        while True:
+            self._hay_datos.wait()
+            self._hay_datos.clear()
+            while True:
+                try:
+                    if not self._enviar_lote():
+                        break
+                    espera = 1
+                    continue
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ No se pudo enviar a la API ({e}); quedan en el spool, reintento en {espera}s")
+                    if isinstance(e, requests.exceptions.ConnectionError) and not check_internet():
+                        print("⚠️ Posible pérdida de conexión a internet")
+                except Exception as e:
+                    # si el hilo muere el envío se corta sin aviso por el resto de la corrida
+                    print(f"❌ Error inesperado enviando el spool ({e!r}); reintento en {espera}s")
+                if self._detener.wait(espera):
+                    return
+                espera = min(espera * 2, self.espera_maxima)
+            if self._detener.is_set():
+                return
+
+    def _enviar_lote(self) -> bool:
+        """
+        Envía el próximo lote y lo confirma. False si no queda nada pendiente.
+        """
+        bloques, offset = self._leer_lote()
+        if not bloques:
+            return False
+        resp = self.session.post(self.bulk_url, json=bloques, timeout=self.timeout)
+        try:
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError:
+            # 502/503/504 o 401 son de la API o el proxy, no del lote: solo reintentar
+            if resp.status_code in ESTADOS_DE_LOTE and self._fallo_lote(bloques, offset):
+                return True
+            raise
+        self._rechazar(bloques, resp.json().get("items", []))
+        self._confirmar(offset)
+        fin = datetime.datetime.fromisoformat(bloques[-1]["timestamp_fin"].rstrip("Z"))
+        latencia = (datetime.datetime.utcnow() - fin).total_seconds()
+        print(f"✅ {len(bloques)} bloques enviados a API, {latencia:.1f}s después del audio")
+        return True
+
+
 class YouTubeLiveTranscriber:
     def __init__(
         self,
@@ -27,9 +344,12 @@ class YouTubeLiveTranscriber:
         intervalo: int = 15,
         resumen_palabras_inicio: int = 5,
         resumen_palabras_fin: int = 5,
-        guardar_backup_local: bool = True,
-        backup_file: str = "backup_transcripciones.jsonl"
+        buffer_segundos: int = 120,
+        max_pendientes: int = 4,
+        spool_file: str = "spool_transcripciones.jsonl"
     ):
+        if buffer_segundos < intervalo:
+            raise ValueError(f"buffer_segundos ({buffer_segundos}) tiene que ser al menos el intervalo ({intervalo})")
         self.original_url = url
         self.api_url = api_url
         self.fuente = fuente
@@ -37,8 +357,11 @@ class YouTubeLiveTranscriber:
         self.intervalo = intervalo
         self.resumen_inicio = resumen_palabras_inicio
         self.resumen_fin = resumen_palabras_fin
-        self.guardar_backup_local = guardar_backup_local
-        self.backup_file = backup_file
+        # modo pipeline: audio que puede acumularse sin transcribir antes de
+        # empezar a perderse, y segmentos que esperan en cada cola
+        self.buffer_segundos = buffer_segundos
+        self.max_pendientes = max_pendientes
+        self.spool_file = spool_file
 
         # 🎯 Extraemos info UNA sola vez para detectar live vs VOD
         info, stream_url = self._extract_info()
@@ -96,13 +419,135 @@ class YouTubeLiveTranscriber:
     def _transcribir(self, audio_path: str) -> str:
         result = self.model.transcribe(audio_path, fp16=False)
         return result["text"].strip()
-    #
-    # def _guardar_backup(self, payload: dict):
-    #     try:
-    #         with open(self.backup_file, "a", encoding="utf-8") as f:
-    #             f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-    #     except Exception as e:
-    #         print(f"⚠️ Error al guardar backup local: {e}")
+
+    def _resumen(self, texto: str) -> str:
+        palabras = texto.split()
+        if len(palabras) > self.resumen_inicio + self.resumen_fin:
+            inicio = " ".join(palabras[:self.resumen_inicio])
+            fin = " ".join(palabras[-self.resumen_fin:])
+            puntos = "." * (len(palabras) - (self.resumen_inicio + self.resumen_fin))
+            return f"{inicio} {puntos} {fin}"
+        return texto
+
+    # --- modo pipeline -------------------------------------------------
+    # Un único ffmpeg escribe PCM continuo en un RingBuffer y los hilos
+    # trabajan en paralelo: cortador (buffer → segmentos de `intervalo`),
+    # transcriptor (segmento → texto → spool) y el SpoolUploader (spool →
+    # API). Mientras se transcribe un segmento se sigue capturando el
+    # siguiente, sin huecos, y nada espera a la red.
+
+    def _abrir_ffmpeg(self) -> subprocess.Popen:
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+        if self.is_live:
+            cmd += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "10"]
+        elif self.offset > 0:
+            cmd += ["-ss", str(self.offset)]
+        cmd += ["-i", self.stream_url, "-vn", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _capturar(self, buffer: RingBuffer, detener: threading.Event):
+        """
+        Lee el PCM de ffmpeg hacia el buffer. En vivo, si ffmpeg se corta lo
+        vuelve a abrir y marca en el buffer la hora de los primeros bytes; en
+        VOD termina con el archivo.
+        """
+        try:
+            while not detener.is_set():
+                self._ffmpeg = self._abrir_ffmpeg()
+                primeros = True
+                while True:
+                    datos = self._ffmpeg.stdout.read(BYTES_POR_SEGUNDO // 10)
+                    if not datos:
+                        break
+                    if self.is_live and primeros:
+                        buffer.marcar(datetime.datetime.utcnow()
+                                      - datetime.timedelta(seconds=len(datos) / BYTES_POR_SEGUNDO))
+                        primeros = False
+                    buffer.escribir(datos)
+                    if not self.is_live:
+                        self.offset += len(datos) / BYTES_POR_SEGUNDO
+                self._ffmpeg.wait()
+                if not self.is_live or detener.is_set():
+                    break
+                print(f"❌ ffmpeg terminó (código {self._ffmpeg.returncode}), reconectando...")
+                if not check_internet():
+                    print("⚠️ Posible pérdida de conexión a internet")
+                time.sleep(5)
+        finally:
+            buffer.cerrar()
+
+    def _cortar(self, buffer: RingBuffer, segmentos: queue.Queue):
+        """
+        Saca del buffer segmentos de `intervalo` segundos. Si la cola está
+        llena espera, y el atraso se acumula en el buffer. La hora de cada
+        segmento sale de las marcas del buffer.
+        """
+        perdidos = 0
+        while True:
+            leido = buffer.leer(self.intervalo * BYTES_POR_SEGUNDO)
+            if leido is None:
+                break
+            offset, pcm = leido
+            if buffer.perdidos > perdidos:
+                print(f"⚠️ Transcripción atrasada: se descartaron "
+                      f"{(buffer.perdidos - perdidos) / BYTES_POR_SEGUNDO:.1f}s de audio")
+                perdidos = buffer.perdidos
+            t0 = buffer.momento(offset)
+            t1 = t0 + datetime.timedelta(seconds=len(pcm) / BYTES_POR_SEGUNDO)
+            segmentos.put((t0, t1, pcm))
+        segmentos.put(None)
+
+    def _transcribir_segmentos(self, segmentos: queue.Queue, uploader: SpoolUploader):
+        while True:
+            segmento = segmentos.get()
+            if segmento is None:
+                break
+            t0, t1, pcm = segmento
+            audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+            inicio = time.time()
+            try:
+                texto = self.model.transcribe(audio, fp16=False)["text"].strip()
+            except Exception as e:
+                print(f"❌ Error en la transcripción: {e}")
+                continue
+            print(f"[{t0.isoformat()}] {self._resumen(texto)} ({len(texto)} caracteres, "
+                  f"{time.time() - inicio:.2f}s)")
+            payload = {
+                "fuente": self.fuente,
+                "timestamp_inicio": t0.isoformat() + "Z",
+                "timestamp_fin":    t1.isoformat() + "Z",
+                "texto":            texto
+            }
+            uploader.agregar(payload)
+
+    def run_pipeline(self):
+        print(f"Transcribiendo {'LIVE' if self.is_live else 'VOD'} en modo pipeline, segmentos de "
+              f"{self.intervalo}s, hasta {self.buffer_segundos}s de atraso (Ctrl+C para detener)")
+        buffer = RingBuffer(self.buffer_segundos * BYTES_POR_SEGUNDO)
+        segmentos = queue.Queue(maxsize=self.max_pendientes)
+        uploader = SpoolUploader(self.api_url, self.spool_file)
+        detener = threading.Event()
+        # en VOD la hora es la del comienzo del video; en vivo la captura la
+        # vuelve a marcar al llegar los primeros bytes de cada conexión
+        buffer.marcar(datetime.datetime.utcnow() - datetime.timedelta(seconds=self.offset))
+        hilos = [
+            threading.Thread(target=self._capturar, args=(buffer, detener), daemon=True),
+            threading.Thread(target=self._cortar, args=(buffer, segmentos), daemon=True),
+            threading.Thread(target=self._transcribir_segmentos, args=(segmentos, uploader), daemon=True),
+        ]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=1)
+            print("🏁 Fin del audio.")
+        except KeyboardInterrupt:
+            print("🛑 Transcripción detenida por el usuario.")
+            detener.set()
+            if getattr(self, "_ffmpeg", None) and self._ffmpeg.poll() is None:
+                self._ffmpeg.terminate()
+        uploader.cerrar()
 
     def run(self):
         print(f"Consumiendo Audio y almacenando chunks {'LIVE' if self.is_live else 'VOD'} cada {self.intervalo}s... (Ctrl+C para detener)")
@@ -154,9 +599,6 @@ class YouTubeLiveTranscriber:
                 #     "timestamp_fin":    t1.isoformat() + "Z",
                 #     "texto":            texto
                 # }
-                #
-                # if self.guardar_backup_local:
-                #     self._guardar_backup(payload)
 
                 # Envío a API
                 try:
@@ -194,7 +636,6 @@ if __name__ == "__main__":
         model_size="small",
         intervalo=15,
         resumen_palabras_inicio=5,
-        resumen_palabras_fin=5,
-        guardar_backup_local=True
+        resumen_palabras_fin=5
     )
-    transcriptor.run()
+    transcriptor.run_pipeline()
@@ -0,0 +1,240 @@
+import os
+import time
+
+# Motores de transcripción. Cada proceso del pool carga el modelo una sola vez
+# (init_engine, usado como initializer del ProcessPoolExecutor) y después
+# transcribe archivos, o PCM 16 kHz mono 16 bits ya en memoria, con
+# transcribe_file.
+
+SAMPLE_RATE = 16000
+# Whisper procesa ventanas de 30s: los chunks más cortos se rellenan con
+# silencio para poder apilarlos en un batch
+MAX_BATCH_SECONDS = 30
+
+_engine = None
+# cache de textos por contenido del audio (fingerprint.py); None = desactivado
+_cache = None
+# WHISPER_TIMESTAMPS=palabras: además del texto, cada palabra con su inicio
+_word_timestamps = False
+
+
+class WhisperEngine:
+    """
+    openai-whisper sobre PyTorch (CPU, fp32).
+    """
+    def __init__(self, model_name: str, language: str, threads: int, **_):
+        import torch
+        import whisper
+        torch.set_num_threads(threads)
+        self.whisper = whisper
+        self.model = whisper.load_model(model_name, device="cpu")
+        self.language = language
+
+    def load_audio(self, path: str):
+        return self.whisper.load_audio(path)
+
+    def transcribe_audio(self, audio) -> str:
+        result = self.model.transcribe(audio, language=self.language, fp16=False)
+        return result["text"].strip()
+
+    def transcribe_words(self, audio) -> tuple:
+        result = self.model.transcribe(audio, language=self.language, fp16=False, word_timestamps=True)
+        palabras = [(round(word["start"] * 1000), word["word"].strip())
+                    for segment in result["segments"] for word in segment.get("words", []) if word["word"].strip()]
+        return result["text"].strip(), palabras
+
+    def decode_batch(self, audios: list) -> list:
+        import torch
+        mels = torch.stack([
+            self.whisper.log_mel_spectrogram(self.whisper.pad_or_trim(audio), self.model.dims.n_mels)
+            for audio in audios
+        ])
+        options = self.whisper.DecodingOptions(language=self.language, fp16=False, without_timestamps=True)
+        return [result.text.strip() for result in self.whisper.decode(self.model, mels, options)]
+
+
+class FasterWhisperEngine:
+    """
+    faster-whisper (CTranslate2). Con compute_type=int8 es varias veces más
+    rápido que openai-whisper en CPU y usa bastante menos memoria.
+    """
+    def __init__(self, model_name: str, language: str, threads: int, compute_type: str = "int8",
+                 beam_size: int = 5, **_):
+        from faster_whisper import WhisperModel
+        from faster_whisper.tokenizer import Tokenizer
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=threads)
+        self.language = language
+        self.beam_size = beam_size
+        self.tokenizer = Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual,
+                                   task="transcribe", language=language)
+
+    def load_audio(self, path: str):
+        from faster_whisper.audio import decode_audio
+        return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+    def transcribe_audio(self, audio) -> str:
+        segments, _ = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def transcribe_words(self, audio) -> tuple:
+        """
+        Texto y lista de (inicio en ms, palabra), con las marcas de tiempo por
+        palabra de faster-whisper (alineación sobre la atención cruzada).
+        """
+        segments, _ = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size,
+                                            word_timestamps=True)
+        segments = list(segments)
+        palabras = [(round(word.start * 1000), word.word.strip())
+                    for segment in segments for word in segment.words or [] if word.word.strip()]
+        return " ".join(segment.text.strip() for segment in segments).strip(), palabras
+
+    def decode_batch(self, audios: list) -> list:
+        import numpy as np
+        extractor = self.model.feature_extractor
+        n_samples = MAX_BATCH_SECONDS * SAMPLE_RATE
+        features = np.stack([
+            extractor(np.pad(audio, (0, n_samples - len(audio))))[:, :extractor.nb_max_frames]
+            for audio in audios
+        ])
+        prompt = list(self.tokenizer.sot_sequence) + [self.tokenizer.no_timestamps]
+        encoder_output = self.model.encode(features)
+        results = self.model.model.generate(encoder_output, [prompt] * len(audios),
+                                            beam_size=self.beam_size, max_length=448)
+        return [self.tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+
+
+ENGINES = {
+    "whisper": WhisperEngine,
+    "faster-whisper": FasterWhisperEngine,
+}
+
+
+def engine_config_from_env() -> dict:
+    """
+    Configuración del motor a partir de variables de entorno.
+    Los hilos por proceso se reparten para no sobresuscribir la CPU, salvo
+    que TRANSCRIBER_THREADS los fije (supervisor.py, varios transcribers por host).
+    """
+    processes = int(os.getenv("TRANSCRIBER_PROCESSES", str(os.cpu_count() or 1)))
+    return {
+        "backend": os.getenv("WHISPER_BACKEND", "faster-whisper"),
+        "model_name": os.getenv("WHISPER_MODEL", "small"),
+        "language": os.getenv("WHISPER_LANGUAGE", "es"),
+        "compute_type": os.getenv("WHISPER_COMPUTE_TYPE", "int8"),
+        "beam_size": int(os.getenv("WHISPER_BEAM_SIZE", "5")),
+        "timestamps": os.getenv("WHISPER_TIMESTAMPS", "bloque"),
+        "threads": int(os.getenv("TRANSCRIBER_THREADS", "0")) or max(1, (os.cpu_count() or 1) // processes),
+        "cache_size": int(os.getenv("TRANSCRIBER_CACHE_SIZE", "2048")),
+        "cache_ttl_seconds": float(os.getenv("TRANSCRIBER_CACHE_TTL_SECONDS", "86400")),
+        "cache_max_ber": float(os.getenv("TRANSCRIBER_CACHE_MAX_BER", "0.15")),
+        "cache_min_overlap": float(os.getenv("TRANSCRIBER_CACHE_MIN_OVERLAP", "0.9")),
+    }
+
+
+def init_engine(config: dict):
+    """
+    Initializer de cada proceso del pool: carga el modelo una única vez.
+    """
+    global _engine, _cache, _word_timestamps
+    backend = config["backend"]
+    if backend not in ENGINES:
+        raise ValueError(f"WHISPER_BACKEND desconocido: {backend}")
+    if config.get("timestamps", "bloque") not in ("bloque", "palabras"):
+        raise ValueError(f"WHISPER_TIMESTAMPS desconocido: {config['timestamps']}")
+    _engine = ENGINES[backend](**config)
+    _word_timestamps = config.get("timestamps") == "palabras"
+    if config.get("cache_size"):
+        from fingerprint import TranscriptCache
+        _cache = TranscriptCache(config["cache_size"], config["cache_ttl_seconds"], config["cache_max_ber"],
+                                 config.get("cache_min_overlap", 0.9), similar=not _word_timestamps)
+
+
+def load_source(source):
+    """
+    Audio float32 de una ruta (la decodifica el motor) o de PCM s16le 16 kHz mono.
+    """
+    if isinstance(source, bytes):
+        import numpy as np
+        return np.frombuffer(source, dtype=np.int16).astype(np.float32) / 32768.0
+    return _engine.load_audio(source)
+
+
+def transcribe_file(source) -> dict:
+    """
+    Transcribe un archivo (o PCM en memoria) con el modelo ya cargado en este
+    proceso. Devuelve el texto, la duración del audio y el tiempo de inferencia.
+    """
+    return transcribe_files([source])[0]
+
+
+def transcribe_files(sources: list) -> list:
+    """
+    Transcribe varios archivos (o PCM en memoria) en un único batch: los audios se rellenan con
+    silencio hasta 30s y encoder y decoder corren sobre todos a la vez. Los
+    chunks de más de 30s no entran en una ventana de Whisper y se transcriben
+    de a uno. Devuelve un resultado por audio, en el mismo orden.
+
+    Con el cache activo, los audios ya transcriptos (o casi iguales a uno ya
+    transcripto) no pasan por el modelo: `cache` indica el resultado de la
+    consulta (exacto, similar o miss; None si el cache está desactivado).
+
+    Con WHISPER_TIMESTAMPS=palabras cada resultado trae también `palabras` y
+    `palabras_ms` (inicio de cada una desde el comienzo del audio). El decode
+    en batch no genera marcas de tiempo, así que en ese modo cada audio pasa
+    por el modelo por separado.
+    """
+    if _engine is None:
+        raise RuntimeError("El motor de transcripción no está inicializado en este proceso")
+    inicio = time.perf_counter()
+    audios = [load_source(source) for source in sources]
+    textos = [None] * len(audios)
+    aciertos = [None] * len(audios)
+    claves = {}
+    # audios repetidos dentro del mismo batch: índice → índice del primero
+    repetidos = {}
+
+    if _cache is not None:
+        primeros = {}
+        for i, audio in enumerate(audios):
+            texto, aciertos[i], clave, huella = _cache.lookup(audio, SAMPLE_RATE)
+            if texto is not None:
+                textos[i] = texto
+            elif clave in primeros:
+                repetidos[i] = primeros[clave]
+                aciertos[i] = "exacto"
+                _cache.count_repeat()
+            else:
+                primeros[clave] = i
+                claves[i] = (clave, huella)
+
+    # con marcas por palabra cada texto es (texto, palabras), también en el cache
+    transcribe = _engine.transcribe_words if _word_timestamps else _engine.transcribe_audio
+    cortos = [i for i, audio in enumerate(audios)
+              if textos[i] is None and i not in repetidos and len(audio) <= MAX_BATCH_SECONDS * SAMPLE_RATE]
+    if len(cortos) > 1 and not _word_timestamps:
+        for i, texto in zip(cortos, _engine.decode_batch([audios[i] for i in cortos])):
+            textos[i] = texto
+    for i, audio in enumerate(audios):
+        if textos[i] is None and i not in repetidos:
+            textos[i] = transcribe(audio)
+
+    for i, primero in repetidos.items():
+        textos[i] = textos[primero]
+    for i, (clave, huella) in claves.items():
+        _cache.store(clave, huella, textos[i])
+
+    # el tiempo del batch se reparte en partes iguales entre sus jobs
+    segundos = (time.perf_counter() - inicio) / len(sources)
+    return [
+        {**_texto_y_palabras(texto), "duracion_audio": len(audio) / SAMPLE_RATE, "segundos_transcripcion": segundos,
+         "cache": acierto}
+        for texto, audio, acierto in zip(textos, audios, aciertos)
+    ]
+
+
+def _texto_y_palabras(valor) -> dict:
+    if isinstance(valor, tuple):
+        texto, palabras = valor
+        return {"texto": texto, "palabras": [palabra for _, palabra in palabras],
+                "palabras_ms": [inicio_ms for inicio_ms, _ in palabras]}
+    return {"texto": valor}
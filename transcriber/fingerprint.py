@@ -0,0 +1,182 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cache de transcripciones por contenido. Las radios repiten jingles,
+# publicidades y separadores: si un chunk es igual (o casi igual) a uno ya
+# transcripto se reutiliza el texto y no se corre el modelo.
+#
+# Cada audio tiene dos claves:
+# - un hash del PCM decodificado, para los duplicados exactos;
+# - una huella espectral (Haitsma-Kalker): por cada frame de 100ms (uno cada
+#   12,5ms, solapados), el signo de la variación de energía entre bandas
+#   vecinas respecto del frame anterior: una sub-huella de 16 bits por frame.
+#   Dos audios con las mismas huellas salvo un porcentaje de bits (`max_ber`)
+#   se consideran el mismo, aunque hayan pasado por otra compresión o tengan
+#   otro volumen.
+#
+# Los candidatos salen de un índice de sub-huellas, como en Haitsma-Kalker:
+# cada sub-huella de la consulta que aparece tal cual en una entrada vota por
+# esa entrada con ese desfasaje, y solo las más votadas se comparan bit a bit.
+# Así un audio corrido unos frames respecto del guardado (los cortes cayeron
+# en otro lugar, o un chunk del VAD un poco más largo) también se encuentra,
+# siempre que las dos huellas se superpongan en al menos `min_overlap` de su
+# largo: fuera de eso el texto guardado no describe el audio nuevo.
+
+FRAME_SECONDS = 0.1
+HOP_SECONDS = 0.0125
+# frames indexados de cada entrada: uno por FRAME_SECONDS alcanza para que
+# cualquier desfasaje de la consulta caiga sobre alguno
+INDEX_STRIDE = round(FRAME_SECONDS / HOP_SECONDS)
+# bandas logarítmicas en el rango de la voz: BANDS - 1 bits por frame
+BANDS = 17
+MIN_HZ = 300
+MAX_HZ = 3000
+# alineaciones más votadas que se comparan bit a bit
+MAX_CANDIDATES = 5
+
+
+def pcm_hash(audio: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(audio, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+
+
+def fingerprint(audio: np.ndarray, sample_rate: int = 16000) -> np.ndarray:
+    """
+    Huella del audio: una sub-huella de 16 bits (np.uint16) por frame, o None
+    si dura menos de dos frames.
+    """
+    frame = int(sample_rate * FRAME_SECONDS)
+    hop = int(sample_rate * HOP_SECONDS)
+    if len(audio) < frame + hop:
+        return None
+    audio = np.asarray(audio, dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame)[::hop]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame), axis=1)) ** 2
+    edges = (np.geomspace(MIN_HZ, MAX_HZ, BANDS + 1) * frame / sample_rate).astype(int)
+    energies = np.stack([spectrum[:, a:b].sum(axis=1) for a, b in zip(edges[:-1], edges[1:])], axis=1)
+    bands_diff = energies[:, :-1] - energies[:, 1:]
+    bits = np.packbits(bands_diff[1:] - bands_diff[:-1] > 0, axis=1)
+    return bits.view(">u2").ravel().astype(np.uint16)
+
+
+def _bit_errors(a: np.ndarray, b: np.ndarray) -> int:
+    return int(np.unpackbits((a ^ b).view(np.uint8)).sum())
+
+
+class TranscriptCache:
+    """
+    Cache LRU con TTL de textos por audio, local al proceso de inferencia.
+    Con `similar=False` solo acierta por hash del PCM: un acierto por huella
+    puede estar corrido, y no sirve cuando el valor guardado depende de la
+    posición del audio (marcas por palabra).
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 86400, max_ber: float = 0.15,
+                 min_overlap: float = 0.9, similar: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_ber = max_ber
+        self.min_overlap = min_overlap
+        self.similar = similar
+        # hash del PCM → (huella, texto, vencimiento)
+        self._entries = OrderedDict()
+        self.stats = {"exacto": 0, "similar": 0, "miss": 0}
+        # índice de sub-huellas (ordenadas) con su entrada y frame; se
+        # rearma en la primera consulta después de un cambio
+        self._index = None
+
+    def _expire(self, now: float):
+        expired = [key for key, (_, _, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._index = None
+
+    def _build_index(self):
+        keys = [key for key, (fp, _, _) in self._entries.items() if fp is not None]
+        parts = [self._entries[key][0][::INDEX_STRIDE] for key in keys]
+        values = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint16)
+        entries = np.concatenate([np.full(len(part), i, dtype=np.int32) for i, part in enumerate(parts)]) \
+            if parts else np.empty(0, dtype=np.int32)
+        frames = np.concatenate([np.arange(len(part), dtype=np.int32) * INDEX_STRIDE for part in parts]) \
+            if parts else np.empty(0, dtype=np.int32)
+        order = np.argsort(values, kind="stable")
+        self._index = (keys, values[order], entries[order], frames[order])
+
+    def _nearest(self, fp: np.ndarray):
+        """
+        Entrada más parecida (dentro de max_ber y superpuesta en min_overlap)
+        entre las alineaciones más votadas por el índice de sub-huellas.
+        """
+        if self._index is None:
+            self._build_index()
+        keys, values, entries, frames = self._index
+        if not len(values):
+            return None
+        start = np.searchsorted(values, fp, side="left")
+        counts = np.searchsorted(values, fp, side="right") - start
+        total = int(counts.sum())
+        if not total:
+            return None
+        # posiciones del índice de cada sub-huella de la consulta que coincide
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(start, counts) + np.arange(total) - first
+        query_frames = np.repeat(np.arange(len(fp)), counts)
+        shifts = frames[positions] - query_frames
+        votes = np.stack([entries[positions], shifts], axis=1)
+        candidates, n_votes = np.unique(votes, axis=0, return_counts=True)
+
+        best_key, best_ber = None, None
+        for i in np.argsort(-n_votes)[:MAX_CANDIDATES]:
+            entry, shift = int(candidates[i][0]), int(candidates[i][1])
+            entry_fp = self._entries[keys[entry]][0]
+            q0, q1 = max(0, -shift), min(len(fp), len(entry_fp) - shift)
+            overlap = q1 - q0
+            if overlap < self.min_overlap * max(len(fp), len(entry_fp)):
+                continue
+            ber = _bit_errors(fp[q0:q1], entry_fp[q0 + shift:q1 + shift]) / (overlap * (BANDS - 1))
+            if ber <= self.max_ber and (best_ber is None or ber < best_ber):
+                best_key, best_ber = keys[entry], ber
+        return best_key
+
+    def lookup(self, audio: np.ndarray, sample_rate: int = 16000):
+        """
+        Devuelve (texto o None, tipo de acierto o "miss", clave, huella).
+        La clave y la huella se pasan a store si hubo que transcribir.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        key = pcm_hash(audio)
+        fp = fingerprint(audio, sample_rate) if self.similar else None
+        kind = "miss"
+        if key in self._entries:
+            kind = "exacto"
+        elif fp is not None:
+            near = self._nearest(fp)
+            if near is not None:
+                key, kind = near, "similar"
+        self.stats[kind] += 1
+        if kind == "miss":
+            return None, kind, key, fp
+        self._entries.move_to_end(key)
+        return self._entries[key][1], kind, key, fp
+
+    def store(self, key: str, fp: np.ndarray, texto: str):
+        self._entries[key] = (fp, texto, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._index = None
+
+    def count_repeat(self):
+        """
+        Un miss resultó ser una repetición de otro audio del mismo batch.
+        """
+        self.stats["miss"] -= 1
+        self.stats["exacto"] += 1
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["exacto"] + self.stats["similar"]) / total if total else 0.0
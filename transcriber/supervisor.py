@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import math
+import os
+import signal
+import sys
+import time
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+from redis.exceptions import ResponseError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.metrics import SUPERVISED_TRANSCRIBERS, start_metrics_server, watch_queue_depths
+from pipeline.scheduler import SOURCES_SUFFIX, source_stream
+
+# Supervisor de transcribers con autoscaling. En vez de un número fijo de
+# workers, corre entre SUPERVISOR_MIN_WORKERS y SUPERVISOR_MAX_WORKERS
+# procesos transcriber.py según la carga de la cola de jobs:
+#
+# - sube apenas los jobs en espera y en proceso superan
+#   SUPERVISOR_JOBS_PER_WORKER por proceso, o el job más viejo en espera lleva
+#   más de SUPERVISOR_MAX_WAIT_SECONDS;
+# - baja de a un proceso, después de SUPERVISOR_IDLE_SECONDS seguidos con
+#   capacidad de sobra. El proceso retirado recibe SIGTERM, deja de leer jobs,
+#   termina los que tiene en curso y sale (SUPERVISOR_DRAIN_TIMEOUT_SECONDS
+#   como máximo; si no, se mata y sus jobs los recupera otro worker pasado
+#   REDIS_VISIBILITY_TIMEOUT_MS).
+#
+# El máximo efectivo también respeta los núcleos del host y la memoria libre
+# para otro modelo cargado (SUPERVISOR_MODEL_MEMORY_MB por proceso de inferencia).
+
+
+def setup_logger():
+    logger = logging.getLogger("supervisor")
+    logger.setLevel(logging.DEBUG)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.DEBUG)
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    return logger
+
+logger = setup_logger()
+
+
+def _id_ms(message_id: str) -> int:
+    return int(message_id.split("-")[0])
+
+
+async def stream_load(redis: aioredis.Redis, stream: str, group: str) -> dict:
+    """
+    Jobs de un stream: en espera (sin entregar), en proceso (entregados sin
+    confirmar) y diferidos, y la antigüedad en segundos del más viejo en espera
+    y en proceso (según el id del mensaje, que es el momento en que se encoló).
+    """
+    load = {"en_espera": 0, "en_proceso": 0, "diferidos": await redis.zcard(f"{stream}:retry"),
+            "espera_s": 0.0, "proceso_s": 0.0}
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except ResponseError:
+        # el stream todavía no existe
+        return load
+    info = next((g for g in groups if g["name"] == group), None)
+    if info is None:
+        return load
+    now_ms = time.time() * 1000
+    # los jobs confirmados se borran del stream (XACK + XDEL): lo que no está pendiente está en espera
+    load["en_proceso"] = info["pending"]
+    load["en_espera"] = max(0, await redis.xlen(stream) - info["pending"])
+    if load["en_espera"]:
+        oldest = await redis.xrange(stream, min=f"({info['last-delivered-id']}", count=1)
+        if oldest:
+            load["espera_s"] = max(0.0, (now_ms - _id_ms(oldest[0][0])) / 1000)
+    if load["en_proceso"]:
+        pending = await redis.xpending(stream, group)
+        load["proceso_s"] = max(0.0, (now_ms - _id_ms(pending["min"])) / 1000)
+    return load
+
+
+async def queue_load(redis: aioredis.Redis, stream: str, group: str) -> dict:
+    """
+    stream_load del stream de jobs y de sus sub-colas por fuente
+    (TRANSCRIPTION_SCHEDULING=fuentes): sumas y antigüedades máximas.
+    """
+    streams = [stream] + [source_stream(stream, media) for media in await redis.hkeys(stream + SOURCES_SUFFIX)]
+    total = {"en_espera": 0, "en_proceso": 0, "diferidos": 0, "espera_s": 0.0, "proceso_s": 0.0}
+    for load in [await stream_load(redis, s, group) for s in streams]:
+        for key in ("en_espera", "en_proceso", "diferidos"):
+            total[key] += load[key]
+        for key in ("espera_s", "proceso_s"):
+            total[key] = max(total[key], load[key])
+    return total
+
+
+def memory_available_mb():
+    """
+    Memoria disponible del host (MemAvailable de /proc/meminfo), o None si no se puede saber.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Autoscaler:
+    """
+    Decide cuántos procesos hacen falta a partir de la carga de la cola. Sube
+    directo a lo necesario (con `cooldown_seconds` entre cambios) y baja de a
+    uno, solo tras `idle_seconds` seguidos con más procesos de los necesarios.
+    """
+
+    def __init__(self, min_workers: int, max_workers: int, jobs_per_worker: float = 4,
+                 max_wait_seconds: float = 60, idle_seconds: float = 300, cooldown_seconds: float = 30):
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.jobs_per_worker = jobs_per_worker
+        self.max_wait_seconds = max_wait_seconds
+        self.idle_seconds = idle_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._last_change = None
+        self._idle_since = None
+
+    def needed(self, current: int, load: dict) -> int:
+        needed = math.ceil((load["en_espera"] + load["en_proceso"]) / self.jobs_per_worker)
+        if load["espera_s"] > self.max_wait_seconds:
+            # los jobs esperan demasiado aunque sean pocos (chunks largos, modelo lento)
+            needed = max(needed, current + 1)
+        return min(max(needed, self.min_workers), self.max_workers)
+
+    def desired(self, current: int, load: dict, now: float) -> int:
+        needed = self.needed(current, load)
+        cooling = self._last_change is not None and now - self._last_change < self.cooldown_seconds
+        if needed > current or current < self.min_workers:
+            self._idle_since = None
+            if cooling and current >= self.min_workers:
+                return current
+            self._last_change = now
+            return needed
+        if needed == current:
+            self._idle_since = None
+            return current
+        if self._idle_since is None:
+            self._idle_since = now
+        if now - self._idle_since < self.idle_seconds or cooling:
+            return current
+        # el siguiente paso hacia abajo vuelve a esperar idle_seconds
+        self._last_change = now
+        self._idle_since = now
+        return current - 1
+
+
+class Supervisor:
+    """
+    Mantiene los procesos transcriber.py que pide el Autoscaler. Cada
+    `interval` segundos mide la cola, reemplaza los procesos que murieron y
+    lanza o retira procesos; los retirados se drenan en segundo plano.
+    """
+
+    def __init__(self, redis: aioredis.Redis, stream: str, group: str, autoscaler: Autoscaler, command: list,
+                 env: dict = None, interval: float = 15, drain_timeout: float = 600,
+                 memory_per_worker_mb: float = 0, metrics_port_base: int = 0):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.autoscaler = autoscaler
+        self.command = command
+        self.env = env or dict(os.environ)
+        self.interval = interval
+        self.drain_timeout = drain_timeout
+        self.memory_per_worker_mb = memory_per_worker_mb
+        self.metrics_port_base = metrics_port_base
+        # slot → proceso; el slot fija el puerto de métricas del proceso
+        self.workers = {}
+        self.draining = set()
+        self._draining_slots = set()
+
+    def _free_slot(self) -> int:
+        slot = 0
+        # un proceso drenando todavía ocupa su puerto
+        while slot in self.workers or slot in self._draining_slots:
+            slot += 1
+        return slot
+
+    async def spawn(self, reserved_mb: float = 0) -> bool:
+        """
+        Lanza un proceso si hay memoria para su modelo; `reserved_mb` es la de
+        los lanzados recién, que todavía no lo cargaron.
+        """
+        available = memory_available_mb()
+        if available is not None:
+            available -= reserved_mb
+        if self.memory_per_worker_mb and available is not None and available < self.memory_per_worker_mb:
+            logger.warning(f"Sin memoria para otro transcriber: {available:.0f} MB libres, "
+                           f"hacen falta {self.memory_per_worker_mb:.0f} MB")
+            return False
+        slot = self._free_slot()
+        env = dict(self.env)
+        env["METRICS_PORT"] = str(self.metrics_port_base + slot if self.metrics_port_base else 0)
+        # sesión propia: un Ctrl-C en la terminal le llega solo al supervisor, que drena los procesos
+        process = await asyncio.create_subprocess_exec(*self.command, env=env, start_new_session=True)
+        self.workers[slot] = process
+        logger.info(f"Transcriber {slot} iniciado (pid {process.pid})")
+        return True
+
+    async def _drain(self, slot: int, process):
+        try:
+            await asyncio.wait_for(process.wait(), self.drain_timeout)
+            logger.info(f"Transcriber {slot} (pid {process.pid}) drenado")
+        except asyncio.TimeoutError:
+            logger.error(f"Transcriber {slot} (pid {process.pid}) no terminó en {self.drain_timeout:.0f}s, se mata")
+            process.kill()
+            await process.wait()
+        finally:
+            self._draining_slots.discard(slot)
+
+    def retire(self):
+        # se retira el más nuevo: los más viejos tienen el cache de transcripciones más completo
+        slot = max(self.workers)
+        process = self.workers.pop(slot)
+        self._draining_slots.add(slot)
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+        logger.info(f"Transcriber {slot} (pid {process.pid}) retirado, drenando jobs en curso")
+        task = asyncio.create_task(self._drain(slot, process))
+        self.draining.add(task)
+        task.add_done_callback(self.draining.discard)
+
+    def reap(self):
+        for slot, process in list(self.workers.items()):
+            if process.returncode is not None:
+                logger.error(f"Transcriber {slot} (pid {process.pid}) terminó con código {process.returncode}")
+                del self.workers[slot]
+
+    async def step(self) -> dict:
+        self.reap()
+        load = await queue_load(self.redis, self.stream, self.group)
+        current = len(self.workers)
+        desired = self.autoscaler.desired(current, load, time.monotonic())
+        if desired != current:
+            logger.info(f"{current} → {desired} transcribers ({load['en_espera']} jobs en espera, "
+                        f"el más viejo hace {load['espera_s']:.0f}s; {load['en_proceso']} en proceso)")
+        reserved_mb = 0
+        while len(self.workers) < desired:
+            if not await self.spawn(reserved_mb):
+                break
+            reserved_mb += self.memory_per_worker_mb
+        while len(self.workers) > desired:
+            self.retire()
+        SUPERVISED_TRANSCRIBERS.labels("activos").set(len(self.workers))
+        SUPERVISED_TRANSCRIBERS.labels("drenando").set(len(self.draining))
+        return load
+
+    async def run(self, stopping: asyncio.Event):
+        try:
+            while not stopping.is_set():
+                try:
+                    await self.step()
+                except Exception as e:
+                    logger.error(f"Error en el supervisor: {e}")
+                try:
+                    await asyncio.wait_for(stopping.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            logger.info(f"Deteniendo {len(self.workers)} transcribers…")
+            while self.workers:
+                self.retire()
+            await asyncio.gather(*self.draining, return_exceptions=True)
+
+
+def worker_env_from_env(max_workers: int) -> tuple:
+    """
+    Entorno de cada proceso transcriber.py y tope de procesos por núcleos:
+    cada proceso corre SUPERVISOR_PROCESSES_PER_WORKER procesos de inferencia
+    con SUPERVISOR_THREADS_PER_PROCESS hilos (por defecto, los que alcanzan
+    para llenar la CPU con max_workers procesos).
+    """
+    cpus = os.cpu_count() or 1
+    processes = int(os.getenv("SUPERVISOR_PROCESSES_PER_WORKER", "1"))
+    threads = int(os.getenv("SUPERVISOR_THREADS_PER_PROCESS", "0")) or max(1, cpus // (max_workers * processes))
+    env = dict(os.environ)
+    env.update({
+        "TRANSCRIBER_PROCESSES": str(processes),
+        "TRANSCRIBER_THREADS": str(threads),
+        "WORKERS": os.getenv("SUPERVISOR_CONSUMERS_PER_WORKER", str(processes + 1)),
+    })
+    return env, max(1, cpus // (processes * threads))
+
+
+async def main(redis_url: str, stream: str, group: str):
+    redis = aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    max_workers = int(os.getenv("SUPERVISOR_MAX_WORKERS", str(os.cpu_count() or 1)))
+    env, cpu_max = worker_env_from_env(max_workers)
+    if max_workers > cpu_max:
+        logger.warning(f"SUPERVISOR_MAX_WORKERS={max_workers} excede los núcleos del host, se usa {cpu_max}")
+        max_workers = cpu_max
+    autoscaler = Autoscaler(
+        int(os.getenv("SUPERVISOR_MIN_WORKERS", "1")),
+        max_workers,
+        jobs_per_worker=float(os.getenv("SUPERVISOR_JOBS_PER_WORKER", "4")),
+        max_wait_seconds=float(os.getenv("SUPERVISOR_MAX_WAIT_SECONDS", "60")),
+        idle_seconds=float(os.getenv("SUPERVISOR_IDLE_SECONDS", "300")),
+        cooldown_seconds=float(os.getenv("SUPERVISOR_COOLDOWN_SECONDS", "30")),
+    )
+    processes = int(env["TRANSCRIBER_PROCESSES"])
+    supervisor = Supervisor(
+        redis, stream, group, autoscaler,
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcriber.py")],
+        env,
+        interval=float(os.getenv("SUPERVISOR_INTERVAL_SECONDS", "15")),
+        drain_timeout=float(os.getenv("SUPERVISOR_DRAIN_TIMEOUT_SECONDS", "600")),
+        memory_per_worker_mb=float(os.getenv("SUPERVISOR_MODEL_MEMORY_MB", "0")) * processes,
+        metrics_port_base=int(os.getenv("SUPERVISOR_WORKER_METRICS_PORT_BASE", "0")),
+    )
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    watcher = None
+    try:
+        if start_metrics_server(9103, "SUPERVISOR_METRICS_PORT"):
+            watcher = asyncio.create_task(watch_queue_depths(redis))
+        logger.info(f"Supervisor en '{stream}': entre {autoscaler.min_workers} y {autoscaler.max_workers} "
+                    f"transcribers de {processes} procesos de inferencia y {env['TRANSCRIBER_THREADS']} hilos")
+        await supervisor.run(stopping)
+    finally:
+        if watcher:
+            watcher.cancel()
+        await redis.close()
+
+if __name__ == '__main__':
+    load_dotenv()
+
+    redis_host = os.getenv("REDIS_HOST", "localhost")
+    redis_port = os.getenv("REDIS_PORT", "6379")
+    asyncio.run(main(
+        f"redis://{redis_host}:{redis_port}",
+        os.getenv("REDIS_QUEUE_TRANSCRIPTION_JOB"),
+        os.getenv("REDIS_CONSUMER_GROUP_TRANSCRIBER", "transcribers"),
+    ))
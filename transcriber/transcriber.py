@@ -1,13 +1,25 @@
 import asyncio
 import datetime
-import json
 import logging
 import os
-from multiprocessing.pool import worker
+import signal
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
 
+import httpx
 import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
+from engines import engine_config_from_env, init_engine, transcribe_file, transcribe_files
+
+# el transporte de jobs (pipeline/) se comparte con el chunker y el cleaner
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.metrics import (AUDIO_SECONDS, JOBS, REAL_TIME_FACTOR, STAGE_SECONDS, TRANSCRIPT_CACHE,
+                              start_metrics_server, watch_queue_depths)
+from pipeline.audio import load_job_audio
+from pipeline.scheduler import fair_queue_from_env, scheduling_from_env
+from pipeline.streams import StreamQueue, stream_queue_from_env
+
 
 def setup_logger():
     logger = logging.getLogger("transcriber")
@@ -21,51 +33,222 @@ def setup_logger():
 
 logger = setup_logger()
 
-async def consumer(name: str, redis: aioredis.Redis, queue: str, processing_queue: str, transcribed_queue: str):
-    logger.info(f"Transcriber {name} iniciado, escuchando '{queue}'")
-    while True:
+def build_transcripcion(job: dict, result: dict) -> dict:
+    """
+    Arma el bloque que se envía a la API a partir del job y del resultado del modelo.
+    """
+    if job.get('timestamp_inicio'):
+        inicio = datetime.datetime.fromisoformat(job['timestamp_inicio'])
+    else:
+        inicio = datetime.datetime.utcnow()
+    fin = inicio + datetime.timedelta(seconds=result['duracion_audio'])
+    transcripcion = {
+        "fuente": job.get('media'),
+        "timestamp_inicio": inicio.isoformat(),
+        "timestamp_fin": fin.isoformat(),
+        "texto": result['texto']
+    }
+    # WHISPER_TIMESTAMPS=palabras: inicio de cada palabra en ms desde timestamp_inicio
+    if result.get('palabras') is not None:
+        transcripcion["palabras"] = result['palabras']
+        transcripcion["palabras_ms"] = result['palabras_ms']
+    return transcripcion
+
+async def post_transcripcion(http: httpx.AsyncClient, api_url: str, transcripcion: dict):
+    with STAGE_SECONDS.labels("post").time():
+        response = await http.post(api_url, json=transcripcion)
+    response.raise_for_status()
+
+def record_inference(name: str, results: list):
+    """
+    Registra en las métricas la duración de la inferencia y el real-time factor del worker.
+    """
+    audio = sum(result['duracion_audio'] for result in results)
+    segundos = sum(result['segundos_transcripcion'] for result in results)
+    STAGE_SECONDS.labels("transcribe").observe(segundos)
+    AUDIO_SECONDS.labels("transcribe").inc(audio)
+    if audio:
+        REAL_TIME_FACTOR.labels(name).set(segundos / audio)
+    for result in results:
+        if result.get('cache'):
+            TRANSCRIPT_CACHE.labels(result['cache']).inc()
+    return audio, segundos
+
+async def complete_job(name: str, queue: StreamQueue, message_id: str, job: dict, transcribed_stream: str):
+    # marcar fecha de transcripción
+    job['transcription_date'] = datetime.datetime.utcnow().isoformat()
+
+    # confirmar el job y enviarlo a transcribed_files_no_deleted en una sola transacción
+    await queue.move(message_id, job, transcribed_stream)
+    JOBS.labels(queue.stream, "ok").inc()
+    logger.info(f"[{name}] Job enviado a '{transcribed_stream}': {job}")
+
+async def consumer(name: str, queue: StreamQueue, transcribed_stream: str,
+                   executor: Executor, http: httpx.AsyncClient, api_url: str, stopping: asyncio.Event = None):
+    """
+    Consume jobs de a uno hasta que se activa `stopping`: el job en curso se
+    termina (o se reintenta) antes de salir.
+    """
+    stopping = stopping or asyncio.Event()
+    logger.info(f"Transcriber {name} iniciado, escuchando '{queue.stream}' como '{queue.consumer}'")
+    while not stopping.is_set():
+        try:
+            messages = await queue.read(count=1)
+            for message_id, job in messages:
+                logger.info(f"[{name}] Recibido {message_id}: {job}")
+                # mientras se transcribe, el job no vuelve a quedar visible para otros workers
+                keep_alive = asyncio.create_task(queue.keep_alive([message_id]))
+                try:
+                    # la inferencia es CPU-bound: corre en el pool de procesos
+                    logger.info(f"[{name}] Transcribiendo: {job.get('file-path') or job.get('audio-key')}")
+                    audio = await load_job_audio(queue.redis, job)
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(executor, transcribe_file, audio)
+                    record_inference(name, [result])
+                    logger.info(
+                        f"[{name}] {result['duracion_audio']:.1f}s de audio transcriptos en "
+                        f"{result['segundos_transcripcion']:.1f}s ({len(result['texto'])} caracteres)"
+                    )
+
+                    await post_transcripcion(http, api_url, build_transcripcion(job, result))
+                    await complete_job(name, queue, message_id, job, transcribed_stream)
+
+                except Exception as process_err:
+                    await queue.retry(message_id, job, process_err)
+                finally:
+                    keep_alive.cancel()
+
+        except Exception as e:
+            logger.error(f"[{name}] Error en bucle de consumo: {e}")
+            await asyncio.sleep(1)
+
+async def next_batch(queue: StreamQueue, batch_size: int, batch_wait_ms: int, stopping: asyncio.Event = None) -> list:
+    """
+    Espera el primer job sin límite (o hasta que se activa `stopping`) y
+    después junta hasta `batch_size` jobs, esperando como mucho
+    `batch_wait_ms` desde que llegó el primero.
+    Devuelve una lista de (message_id, job); vacía si se activó `stopping`
+    antes del primero. Activado `stopping` no se leen más jobs.
+    """
+    stopped = lambda: stopping is not None and stopping.is_set()
+    batch = []
+    while not batch and not stopped():
+        batch = await queue.read(count=batch_size)
+    if not batch:
+        return []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + batch_wait_ms / 1000
+    while len(batch) < batch_size and not stopped():
+        remaining_ms = int((deadline - loop.time()) * 1000)
+        # block=0 en XREADGROUP bloquea para siempre
+        if remaining_ms <= 0:
+            break
+        messages = await queue.read(count=batch_size - len(batch), block_ms=remaining_ms)
+        if not messages:
+            break
+        batch.extend(messages)
+    return batch
+
+async def batch_consumer(name: str, queue: StreamQueue, transcribed_stream: str,
+                         executor: Executor, http: httpx.AsyncClient, api_url: str,
+                         batch_size: int, batch_wait_ms: int, stopping: asyncio.Event = None):
+    """
+    Como consumer, pero pasa los jobs al modelo en batches y después reparte
+    los resultados (envío a la API, reintentos) job por job.
+    """
+    stopping = stopping or asyncio.Event()
+    logger.info(f"Transcriber {name} iniciado en modo batch ({batch_size} jobs / {batch_wait_ms}ms), "
+                f"escuchando '{queue.stream}' como '{queue.consumer}'")
+    while not stopping.is_set():
         try:
-            payload = await redis.brpoplpush(queue, processing_queue)
-            job = json.loads(payload)
-            logger.info(f"[{name}] Recibido: {job}")
+            batch = await next_batch(queue, batch_size, batch_wait_ms, stopping)
+            if not batch:
+                continue
+            message_ids = [message_id for message_id, _ in batch]
+            logger.info(f"[{name}] Batch de {len(batch)} jobs: {[job.get('id') for _, job in batch]}")
 
+            keep_alive = asyncio.create_task(queue.keep_alive(message_ids))
             try:
-                # --- Aqui iría la lógica real de transcripción ---
-                print(f"[{name}] Transcribiendo archivo: {job.get('file_name')}")
-
-                # marcar fecha de transcripción
-                job['transcription_date'] = datetime.datetime.utcnow().isoformat()
-
-                # eliminar de procesamiento y enviar a transcribed_files_no_deleted
-                await redis.lrem(processing_queue, 1, payload)
-                new_payload = json.dumps(job)
-                await redis.lpush(transcribed_queue, new_payload)
-                logger.info(f"[{name}] Job enviado a '{transcribed_queue}': {job}")
-
-            except Exception as process_err:
-                # en caso de falla, reencolar con contador de intentos
-                await redis.lrem(processing_queue, 1, payload)
-                attempts = job.get('attempts', 0) + 1
-                job['attempts'] = attempts
-                new_payload = json.dumps(job)
-                await redis.lpush(queue, new_payload)
-                logger.error(f"[{name}] Error procesando {job}, reintento #{attempts}: {process_err}")
+                # un chunk en Redis que ya no está se reintenta solo, sin frenar el resto del batch
+                audios = await asyncio.gather(*(load_job_audio(queue.redis, job) for _, job in batch),
+                                              return_exceptions=True)
+                cargados = []
+                for (message_id, job), audio in zip(batch, audios):
+                    if isinstance(audio, Exception):
+                        await queue.retry(message_id, job, audio)
+                    else:
+                        cargados.append(((message_id, job), audio))
+                batch = [item for item, _ in cargados]
+                audios = [audio for _, audio in cargados]
+                if not batch:
+                    continue
+                try:
+                    loop = asyncio.get_running_loop()
+                    results = await loop.run_in_executor(executor, transcribe_files, audios)
+                except Exception as process_err:
+                    # falló el batch entero: se reintenta cada job por separado
+                    for message_id, job in batch:
+                        await queue.retry(message_id, job, process_err)
+                    continue
+
+                audio, segundos = record_inference(name, results)
+                logger.info(f"[{name}] {audio:.1f}s de audio transcriptos en {segundos:.1f}s ({len(batch)} jobs)")
+
+                for (message_id, job), result in zip(batch, results):
+                    try:
+                        await post_transcripcion(http, api_url, build_transcripcion(job, result))
+                        await complete_job(name, queue, message_id, job, transcribed_stream)
+                    except Exception as process_err:
+                        await queue.retry(message_id, job, process_err)
+            finally:
+                keep_alive.cancel()
 
         except Exception as e:
             logger.error(f"[{name}] Error en bucle de consumo: {e}")
             await asyncio.sleep(1)
 
-async def main(redis_url: str, queue: str, processing_queue: str, transcribed_queue: str, workers: int):
+async def main(redis_url: str, stream: str, group: str, transcribed_stream: str, workers: int,
+               api_url: str, processes: int, batch_size: int = 1, batch_wait_ms: int = 0):
     redis = aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    # un proceso por núcleo, cada uno con el modelo cargado una sola vez
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=init_engine,
+                                   initargs=(engine_config_from_env(),))
+    http = httpx.AsyncClient(timeout=float(os.getenv("API_TIMEOUT_SECONDS", "10")))
+    # con SIGTERM (supervisor.py al achicar, docker stop) los workers dejan de
+    # leer jobs nuevos, terminan los que tienen en curso y el proceso sale
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    watcher = None
     try:
+        if start_metrics_server(9101):
+            watcher = asyncio.create_task(watch_queue_depths(redis))
         tasks = []
+        queues = []
         for i in range(workers):
             name = f"worker-{i+1}"
-            tasks.append(asyncio.create_task(
-                consumer(name, redis, queue, processing_queue, transcribed_queue)
-            ))
+            # cada worker es un consumidor distinto del group (único por host y proceso)
+            if scheduling_from_env() == "fuentes":
+                queue = fair_queue_from_env(redis, stream, group, name)
+            else:
+                queue = stream_queue_from_env(redis, stream, group, name)
+            await queue.ensure_group()
+            queues.append(queue)
+            if batch_size > 1:
+                worker_coro = batch_consumer(name, queue, transcribed_stream, executor, http, api_url,
+                                             batch_size, batch_wait_ms, stopping)
+            else:
+                worker_coro = consumer(name, queue, transcribed_stream, executor, http, api_url, stopping)
+            tasks.append(asyncio.create_task(worker_coro))
         await asyncio.gather(*tasks)
+        # drenado: los consumidores sin jobs pendientes se borran del group
+        for queue in queues:
+            await queue.remove_consumer()
+        logger.info(f"{workers} workers detenidos sin jobs en curso")
     finally:
+        if watcher:
+            watcher.cancel()
+        await http.aclose()
+        executor.shutdown(cancel_futures=True)
         await redis.close()
 
 if __name__ == '__main__':
@@ -78,12 +261,16 @@ if __name__ == '__main__':
     redis_url = f"redis://{redis_host}:{redis_port}"
 
     workers = int(os.getenv("WORKERS", "3"))
+    processes = int(os.getenv("TRANSCRIBER_PROCESSES", str(os.cpu_count() or 1)))
+    api_url = os.getenv("API_URL", "http://localhost:8000/transcripciones/")
+    batch_size = int(os.getenv("TRANSCRIBER_BATCH_SIZE", "1"))
+    batch_wait_ms = int(os.getenv("TRANSCRIBER_BATCH_WAIT_MS", "200"))
     pending_transcription_queue      = os.getenv("REDIS_QUEUE_TRANSCRIPTION_JOB")
-    in_process_queue                = os.getenv("REDIS_QUEUE_IN_TRANSCRIPTION_PROCESS")
+    consumer_group                  = os.getenv("REDIS_CONSUMER_GROUP_TRANSCRIBER", "transcribers")
     transcribed_not_deleted_queue   = os.getenv("REDIS_QUEUE_TRANSCRIBED_FILES_NOT_DELETED_JOB")
 
     logger.info(
-        f"Iniciando {workers} workers en '{pending_transcription_queue}' → "
+        f"Iniciando {workers} workers ({processes} procesos de inferencia) en '{pending_transcription_queue}' → "
         f"una vez procesados enviar a: '{transcribed_not_deleted_queue}', redis url: {redis_url}"
     )
 
@@ -92,9 +279,13 @@ if __name__ == '__main__':
         asyncio.run(main(
             redis_url,
             pending_transcription_queue,
-            in_process_queue,
+            consumer_group,
             transcribed_not_deleted_queue,
-            workers
+            workers,
+            api_url,
+            processes,
+            batch_size,
+            batch_wait_ms
         ))
     except KeyboardInterrupt:
         logger.info("Deteniendo transcribers…")